@@ -0,0 +1,78 @@
+import numpy as np
+
+from benchmarks.common import seed_all
+from simplexmesh.algorithm import simplex_diagonal, get_position_by_anchors_2d_lls, cayley_menger_diagonals, \
+    simplex_diagonal_3d, get_positions_by_anchors_lls
+from simplexmesh.grid import Point2D
+
+
+class SimplexDiagonal:
+    """Cayley-Menger diagonal solver on a batch of valid quadrilaterals."""
+    n_inputs = 200
+
+    def setup(self):
+        seed_all()
+        self.inputs = []
+        for _ in range(self.n_inputs):
+            p = np.random.rand(4, 2) * 4
+            d = lambda i, j: float(np.linalg.norm(p[i] - p[j]))
+            self.inputs.append((d(0, 1), d(0, 2), d(1, 2), d(1, 3), d(2, 3)))
+
+    def time_simplex_diagonal(self):
+        for edges in self.inputs:
+            simplex_diagonal(*edges)
+
+
+class SimplexDiagonal3D:
+    """Five-point Cayley-Menger solver with three-node gates, one by one and batched."""
+    n_inputs = 200
+
+    def setup(self):
+        seed_all()
+        points = np.random.rand(self.n_inputs, 5, 3) * 4
+        self.d = np.linalg.norm(points[:, :, None, :] - points[:, None, :, :], axis=-1)
+        self.inputs = [(d[0, 1], d[0, 2], d[0, 3], d[1, 2], d[1, 3], d[2, 3], d[1, 4], d[2, 4], d[3, 4])
+                       for d in self.d]
+
+    def time_simplex_diagonal_3d(self):
+        for edges in self.inputs:
+            simplex_diagonal_3d(*edges)
+
+    def time_cayley_menger_diagonals_batch(self):
+        cayley_menger_diagonals(self.d ** 2)
+
+
+class Multilateration:
+    """Linear least squares positioning of a node by its anchors."""
+    params = [3, 8, 16]
+    param_names = ["n_anchors"]
+    n_inputs = 100
+
+    def setup(self, n_anchors):
+        seed_all()
+        self.inputs = []
+        for _ in range(self.n_inputs):
+            target = np.random.rand(2) * 15
+            anchors = np.random.rand(n_anchors, 2) * 15
+            distances = np.linalg.norm(anchors - target, axis=1) + np.random.normal(0, 0.2, n_anchors)
+            self.inputs.append(([Point2D(tuple(a)) for a in anchors], list(distances)))
+
+    def time_get_position_by_anchors_2d_lls(self, n_anchors):
+        for anchors, distances in self.inputs:
+            get_position_by_anchors_2d_lls(anchors.copy(), distances.copy())
+
+
+class BatchedMultilateration3D:
+    """Batched least squares positioning in 3D."""
+    params = [4, 8, 16]
+    param_names = ["n_anchors"]
+    n_inputs = 10000
+
+    def setup(self, n_anchors):
+        seed_all()
+        targets = np.random.rand(self.n_inputs, 3) * 15
+        self.anchors = np.random.rand(self.n_inputs, n_anchors, 3) * 15
+        self.distances = np.linalg.norm(self.anchors - targets[:, None, :], axis=2)
+
+    def time_get_positions_by_anchors_lls(self, n_anchors):
+        get_positions_by_anchors_lls(self.anchors, self.distances)
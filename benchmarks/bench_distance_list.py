@@ -0,0 +1,46 @@
+import random
+
+from benchmarks.common import seed_all
+from positioning_plotter.distance_list import DistanceFilterBank, DistanceList
+
+
+class DistanceListGetValue:
+    """Filtering a stream of measurements, recomputed after every new sample."""
+    n_measurements = 1000
+
+    def setup(self):
+        seed_all()
+        self.values = [random.normalvariate(5.0, 0.5) for _ in range(self.n_measurements)]
+
+    def time_add_and_get_value(self):
+        distance_list = DistanceList()
+        for value in self.values:
+            distance_list.add(value)
+            distance_list.get_value()
+
+
+class DistanceFilterBankUpdate:
+    """One measurement of every anchor per tick, filtered by a DistanceList per anchor or by one bank update."""
+    params = [6, 60, 600]
+    param_names = ["n_anchors"]
+    n_ticks = 50
+
+    def setup(self, n_anchors):
+        seed_all()
+        self.values = [[random.normalvariate(5.0, 0.5) for _ in range(n_anchors)] for _ in range(self.n_ticks)]
+
+    def time_distance_lists(self, n_anchors):
+        distance_lists = [DistanceList() for _ in range(n_anchors)]
+        for tick in self.values:
+            for distance_list, value in zip(distance_lists, tick):
+                distance_list.add(value)
+            for distance_list in distance_lists:
+                distance_list.get_value()
+
+    def time_filter_bank(self, n_anchors):
+        bank = DistanceFilterBank()
+        rows = [bank.add_row() for _ in range(n_anchors)]
+        for tick in self.values:
+            for row, value in zip(rows, tick):
+                bank.add(row, value)
+            bank.update()
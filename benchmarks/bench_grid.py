@@ -0,0 +1,46 @@
+import numpy as np
+
+from benchmarks.common import SEED, seed_all, scaled_grid_size
+from simplexmesh.config import config
+from simplexmesh.grid import Grid, Point2D
+from simplexmesh.spatial import poisson_disk_sample
+
+
+class GridSetup:
+    """Random placement of nodes at constant density."""
+    params = [40, 80, 160, 10000]
+    param_names = ["n_nodes"]
+
+    def setup(self, n_nodes):
+        self.grid_size = scaled_grid_size(n_nodes)
+
+    def time_setup(self, n_nodes):
+        seed_all()
+        Grid(Point2D, n_nodes, self.grid_size, config["measurement"]["sd"]).setup()
+
+
+class GridHopCounts:
+    """BFS hop count tables, computed once per node when the nodes are created."""
+    params = [40, 80, 160]
+    param_names = ["n_nodes"]
+
+    def setup(self, n_nodes):
+        seed_all()
+        self.grid = Grid(Point2D, n_nodes, scaled_grid_size(n_nodes), config["measurement"]["sd"])
+        self.grid.setup()
+
+    def time_get_hop_counts_from(self, n_nodes):
+        for origin in range(0, n_nodes, 10):
+            self.grid.get_hop_counts_from(origin)
+
+
+class PoissonDiskPlacement:
+    """Raw placement of 100k points, without building the Point objects and neighbor lists."""
+    n_points = 100000
+
+    def setup(self):
+        self.grid_size = scaled_grid_size(self.n_points)
+
+    def time_poisson_disk_sample(self):
+        rng = np.random.default_rng(SEED)
+        poisson_disk_sample(rng, self.grid_size, 2, config["grid"]["min_node_real_distance"], n_required=self.n_points)
@@ -0,0 +1,18 @@
+import subprocess
+import sys
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).parent.parent
+
+
+class ImportTime:
+    """
+    Startup of a fresh interpreter importing a module, as paid by every pool worker and CLI invocation.
+    numpy is the floor, as every module of the package depends on it.
+    Plotting, sympy and the YAML parser must not be loaded by any of these imports.
+    """
+    params = ["numpy", "simplexmesh.algorithm", "simplexmesh.grid", "simplexmesh.node", "simulation"]
+    param_names = ["module"]
+
+    def time_import(self, module):
+        subprocess.run([sys.executable, "-c", f"import {module}"], cwd=REPO_ROOT, check=True)
@@ -0,0 +1,30 @@
+import numpy as np
+
+from benchmarks.common import SEED, scaled_grid_size
+from simplexmesh.config import config
+from simplexmesh.localization import localize_edges, localize_patches
+from simplexmesh.spatial import in_reach_pairs
+
+
+class GlobalLocalization:
+    """Localizing a whole network at constant density from the measured distances of all pairs in reach."""
+    params = [1000, 10000]
+    param_names = ["n_nodes"]
+
+    def setup(self, n_nodes):
+        rng = np.random.default_rng(SEED)
+        self.coords = rng.uniform(0, scaled_grid_size(n_nodes), (n_nodes, 2))
+        self.pairs = pairs = in_reach_pairs(self.coords, config["node"]["max_reach"])
+        self.i, self.j = pairs[:, 0], pairs[:, 1]
+        true = np.linalg.norm(self.coords[self.i] - self.coords[self.j], axis=1)
+        self.d = true + rng.normal(0, config["measurement"]["sd"], len(true))
+        self.w = np.ones(len(true))
+        anchors = rng.choice(n_nodes, n_nodes // 10, replace=False)
+        self.anchors = {int(a): tuple(self.coords[a]) for a in anchors}
+
+    def time_localize(self, n_nodes):
+        localize_edges(len(self.coords), self.i, self.j, self.d, self.w, self.anchors, 2)
+
+
+    def time_localize_patches(self, n_nodes):
+        localize_patches(len(self.coords), self.i, self.j, self.d, self.w, self.anchors, 2, self.pairs)
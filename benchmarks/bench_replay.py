@@ -0,0 +1,41 @@
+import json
+import math
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from benchmarks.common import SEED
+from positioning_plotter.replay import run
+
+
+class CaptureReplay:
+    """
+    Filtering and solving stages of the positioning chain, fed by a synthetic capture replayed as fast as possible.
+    Regressions of the DistanceList filter or the solver show up here.
+    """
+    params = [1, 20]
+    param_names = ["n_targets"]
+    n_measurements = 20000
+
+    def setup(self, n_targets):
+        rng = np.random.default_rng(SEED)
+        anchors = {f"A{i}": (10 * math.cos(i), 10 * math.sin(i)) for i in range(6)}
+        targets = rng.uniform(-5, 5, (n_targets, 2))
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = Path(self.dir.name).joinpath("capture.jsonl")
+        with open(self.path, "w") as f:
+            for address, (x, y) in anchors.items():
+                f.write(json.dumps({"anchor": address, "x": x, "y": y}) + "\n")
+            for i in range(self.n_measurements):
+                target = int(rng.integers(n_targets))
+                address = f"A{int(rng.integers(len(anchors)))}"
+                distance = math.dist(targets[target], anchors[address]) + rng.normal(0, 0.2)
+                f.write(json.dumps({"time": i * 0.001, "target": f"T{target}",
+                                    "address": address, "distance": distance}) + "\n")
+
+    def teardown(self, n_targets):
+        self.dir.cleanup()
+
+    def time_replay(self, n_targets):
+        run(self.path)
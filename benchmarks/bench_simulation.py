@@ -0,0 +1,95 @@
+import numpy as np
+
+from benchmarks.common import SEED, seed_all, override_config, scaled_grid_size
+from simplexmesh.grid import Point2D
+from simulation import Simulation
+
+
+class SimulationRun:
+    """Full simulation: grid setup, node creation, neighbor measurements and propagation."""
+    params = [40, 80, 160]
+    param_names = ["n_nodes"]
+    iterations = 200
+    timeout = 300
+
+    def time_create_and_run(self, n_nodes):
+        seed_all()
+        overrides = {
+            "grid": {"n_nodes": n_nodes, "size": scaled_grid_size(n_nodes)},
+            "simulation": {"iterations": self.iterations},
+        }
+        with override_config(**overrides):
+            sim = Simulation()
+            sim.create()
+            sim.run()
+
+
+class TransportRun:
+    """Propagation with the simulated radio transport, sending every message apart or coalesced per peer and round."""
+    params = [False, True]
+    param_names = ["batching"]
+    iterations = 200
+    timeout = 300
+
+    def time_create_and_run(self, batching):
+        seed_all()
+        overrides = {
+            "simulation": {"iterations": self.iterations},
+            "transport": {"enabled": True, "batching": batching},
+        }
+        with override_config(**overrides):
+            sim = Simulation()
+            sim.create()
+            sim.run()
+
+
+class SolverCacheRun:
+    """Propagation with and without skipping the solver inputs a node already computed solutions for."""
+    params = [False, True]
+    param_names = ["solver_cache"]
+    iterations = 200
+    timeout = 300
+
+    def time_create_and_run(self, solver_cache):
+        seed_all()
+        overrides = {
+            "simulation": {"iterations": self.iterations},
+            "solver_cache": {"enabled": solver_cache},
+        }
+        with override_config(**overrides):
+            sim = Simulation()
+            sim.create()
+            sim.run()
+
+
+class TopologyChanges:
+    """Incremental updates of a converged mesh for nodes joining, moving and leaving."""
+    params = [80, 250]
+    param_names = ["n_nodes"]
+    iterations = 50
+    n_changes = 30
+    timeout = 300
+
+    def setup(self, n_nodes):
+        seed_all()
+        overrides = {
+            "grid": {"n_nodes": n_nodes, "size": scaled_grid_size(n_nodes)},
+            "simulation": {"iterations": self.iterations},
+        }
+        with override_config(**overrides):
+            self.sim = Simulation()
+            self.sim.create()
+            self.sim.run()
+        self.size = scaled_grid_size(n_nodes)
+        self.rng = np.random.default_rng(SEED)
+
+    def time_join_move_leave(self, n_nodes):
+        sim, rng = self.sim, self.rng
+        for i in range(self.n_changes):
+            if i % 3 == 0:
+                sim.add_node(Point2D(tuple(rng.random(2) * self.size)))
+            elif i % 3 == 1:
+                node_id = sim.nodes[rng.integers(len(sim.nodes))]._id
+                sim.move_node(node_id, Point2D(tuple(rng.random(2) * self.size)))
+            else:
+                sim.remove_node(sim.nodes[rng.integers(len(sim.nodes))]._id)
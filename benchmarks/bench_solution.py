@@ -0,0 +1,72 @@
+import random
+
+from benchmarks.common import override_config, seed_all
+from simplexmesh.solution import Solution, SolutionSet
+
+
+def _random_solutions(n: int, true_value: float = 3.0) -> list[Solution]:
+    """Half of the solutions repeat around the true value, the other half are spread out."""
+    solutions = []
+    for i in range(n):
+        value = random.normalvariate(true_value, 0.05) if i % 2 == 0 else random.uniform(3, 10)
+        solutions.append(Solution(value, badness=0, gate=(i, i + 1)))
+    return solutions
+
+
+class SolutionSetAdd:
+    """Filling SolutionSets one solution at a time, as the strategy nodes do."""
+    n_sets = 200
+
+    def setup(self):
+        seed_all()
+        self.inputs = [_random_solutions(20) for _ in range(self.n_sets)]
+
+    def time_add(self):
+        for solutions in self.inputs:
+            solution_set = SolutionSet()
+            for solution in solutions:
+                solution_set.add(solution)
+
+
+class SolutionSetUpdate:
+    """Picking the repeating solution from an already filled SolutionSet."""
+    params = [10, 20]
+    param_names = ["n_solutions"]
+    n_sets = 200
+
+    def setup(self, n_solutions):
+        seed_all()
+        self.sets = []
+        for _ in range(self.n_sets):
+            solution_set = SolutionSet()
+            for solution in _random_solutions(n_solutions):
+                solution_set._add(solution)
+            self.sets.append(solution_set)
+
+    def time_update_cached_value(self, n_solutions):
+        for solution_set in self.sets:
+            solution_set.update_cached_value()
+
+
+class ModeFinders:
+    """Picking the values of many SolutionSets one by one and with a single vectorized call, for every mode finder."""
+    params = [["derivative", "kde"], [10, 20]]
+    param_names = ["mode_finder", "n_solutions"]
+    n_sets = 200
+
+    def setup(self, mode_finder, n_solutions):
+        seed_all()
+        self.sets = []
+        with override_config(solution_set={"mode_finder": mode_finder}):
+            for _ in range(self.n_sets):
+                solution_set = SolutionSet()
+                for solution in _random_solutions(n_solutions):
+                    solution_set._add(solution)
+                self.sets.append(solution_set)
+
+    def time_update_cached_value(self, mode_finder, n_solutions):
+        for solution_set in self.sets:
+            solution_set.update_cached_value()
+
+    def time_update_many(self, mode_finder, n_solutions):
+        SolutionSet.update_many(self.sets)
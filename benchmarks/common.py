@@ -0,0 +1,48 @@
+import contextlib
+import copy
+import random
+
+import numpy as np
+
+from simplexmesh.config import config
+
+
+"""Seed shared by all benchmarks, so that every run works on the same inputs"""
+SEED = 43
+
+
+def seed_all(seed: int = SEED) -> None:
+    """
+    Resets the global random generators used to create benchmark inputs.
+    The simulation itself draws from its own streams, seeded by configuration.
+    :param seed: Seed to use
+    :return: None
+    """
+    random.seed(seed)
+    np.random.seed(seed)
+
+
+@contextlib.contextmanager
+def override_config(**sections):
+    """
+    Temporarily overrides values of the global configuration.
+    Usage: override_config(grid={"n_nodes": 40}, simulation={"iterations": 100})
+    :param sections: Mapping of section name to the values overridden in that section
+    """
+    saved = copy.deepcopy(config)
+    try:
+        for section, values in sections.items():
+            config[section].update(values)
+        yield config
+    finally:
+        config.clear()
+        config.update(saved)
+
+
+def scaled_grid_size(n_nodes: int) -> float:
+    """
+    Returns a grid size that keeps node density equal to the one in the default configuration.
+    :param n_nodes: Number of nodes to be placed
+    :return: Size of a single dimension of the grid
+    """
+    return config["grid"]["size"] * (n_nodes / config["grid"]["n_nodes"]) ** 0.5
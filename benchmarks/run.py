@@ -0,0 +1,175 @@
+"""
+Runs the benchmark suite and stores the results as JSON.
+
+Benchmarks are written in the asv style: every bench_*.py module in this directory contains classes
+with time_* methods, an optional setup() method and optional params / param_names attributes.
+Each benchmark is called once to warm up and then timed a number of times.
+
+Usage (from the repository root):
+    python -m benchmarks.run                          # run everything, save to .benchmarks/<commit>.json
+    python -m benchmarks.run -k Simplex               # run benchmarks matching a regex
+    python -m benchmarks.run --compare .benchmarks/baseline.json
+"""
+from __future__ import annotations
+
+import argparse
+import contextlib
+import datetime
+import importlib
+import inspect
+import io
+import itertools
+import json
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+BENCHMARK_DIR = Path(__file__).parent
+RESULTS_DIR = BENCHMARK_DIR.parent.joinpath(".benchmarks")
+
+
+def _git_commit() -> str:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCHMARK_DIR,
+                             capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _param_combinations(bench_class) -> list[tuple]:
+    params = getattr(bench_class, "params", None)
+    if params is None:
+        return [()]
+    param_names = getattr(bench_class, "param_names", [])
+    if len(param_names) > 1:
+        return list(itertools.product(*params))
+    return [(p,) for p in params]
+
+
+def _benchmark_name(module_name: str, bench_class, method_name: str, params: tuple) -> str:
+    name = f"{module_name}.{bench_class.__name__}.{method_name}"
+    if params:
+        param_names = getattr(bench_class, "param_names", [f"p{i}" for i in range(len(params))])
+        name += "(" + ", ".join(f"{k}={v}" for k, v in zip(param_names, params)) + ")"
+    return name
+
+
+def discover(pattern: str | None = None) -> list[tuple[str, type, str, tuple]]:
+    """
+    Finds all benchmarks in the benchmarks directory.
+    :param pattern: Optional regex, only benchmarks with a matching name are returned
+    :return: A list of (name, class, method name, params) tuples
+    """
+    regex = re.compile(pattern) if pattern else None
+    found = []
+    for path in sorted(BENCHMARK_DIR.glob("bench_*.py")):
+        module = importlib.import_module(f"benchmarks.{path.stem}")
+        for _, bench_class in inspect.getmembers(module, inspect.isclass):
+            if bench_class.__module__ != module.__name__:
+                continue
+            methods = [m for m in dir(bench_class) if m.startswith("time_")]
+            for method_name, params in itertools.product(methods, _param_combinations(bench_class)):
+                name = _benchmark_name(path.stem, bench_class, method_name, params)
+                if regex is None or regex.search(name):
+                    found.append((name, bench_class, method_name, params))
+    return found
+
+
+def run_benchmark(bench_class, method_name: str, params: tuple, repeat: int) -> dict:
+    """
+    Times a single benchmark. Output printed by the benchmarked code is suppressed.
+    :return: Statistics of the measured times in seconds
+    """
+    instance = bench_class()
+    samples = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        if hasattr(instance, "setup"):
+            instance.setup(*params)
+        method = getattr(instance, method_name)
+        method(*params)
+        for _ in range(repeat):
+            t = time.perf_counter()
+            method(*params)
+            samples.append(time.perf_counter() - t)
+        if hasattr(instance, "teardown"):
+            instance.teardown(*params)
+
+    return {
+        "min": min(samples),
+        "median": statistics.median(samples),
+        "mean": statistics.mean(samples),
+        "stdev": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        "samples": samples,
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> bool:
+    """
+    Prints the median time ratios of the current results against a baseline.
+    :param threshold: Relative slowdown above which a benchmark is marked as a regression
+    :return: True if any benchmark regressed
+    """
+    regressed = False
+    print(f"\nComparison against {baseline.get('commit', '?')}:")
+    for name, stats in results["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            print(f"  {name:80} {'new':>10}")
+            continue
+        ratio = stats["median"] / base["median"]
+        mark = ""
+        if ratio > 1 + threshold:
+            mark = "  REGRESSION"
+            regressed = True
+        elif ratio < 1 - threshold:
+            mark = "  improved"
+        print(f"  {name:80} {ratio:9.2f}x{mark}")
+    return regressed
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Run the simplexmesh benchmark suite.")
+    parser.add_argument("-k", "--filter", default=None, help="Regex selecting benchmarks by name")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="Timed calls per benchmark")
+    parser.add_argument("-o", "--output", type=Path, default=None,
+                        help="Output JSON file, defaults to .benchmarks/<commit>.json")
+    parser.add_argument("--compare", type=Path, default=None, help="Baseline JSON file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="Relative slowdown reported as a regression (default 0.1)")
+    args = parser.parse_args(argv)
+
+    commit = _git_commit()
+    results = {
+        "commit": commit,
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": {},
+    }
+
+    for name, bench_class, method_name, params in discover(args.filter):
+        stats = run_benchmark(bench_class, method_name, params, args.repeat)
+        results["results"][name] = stats
+        print(f"{name:80} {stats['median'] * 1000:10.2f} ms")
+
+    output = args.output or RESULTS_DIR.joinpath(f"{commit}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to {output}")
+
+    if args.compare is not None:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,4 +1,4 @@
-from positioning_plotter.distance_list import DistanceList
+from positioning_plotter.distance_list import DistanceFilterBank
 from positioning_plotter.plotter import Plotter
 from simplexmesh.algorithm import get_position_by_anchors_2d_lls
 from simplexmesh.grid import Point2D
@@ -7,12 +7,14 @@ if __name__ == '__main__':
     anchor_positions = {}
     anchor_addresses = []
     measurements = []
-    distance_by_address = {}
+    row_by_address = {}
+    bank = DistanceFilterBank()
     target = None
     n_anchors = 0
     ordered_anchors = []
 
-    plotter = Plotter(xrange=(-7, 7), yrange=(-4, 10))
+    output = None  # eg. "trace.png" or "trace.svg" to save the plot headlessly instead of showing it
+    plotter = Plotter(xrange=(-7, 7), yrange=(-4, 10), headless=output is not None)
     # fn = "positioning_tests/24-07-31_14-12-03_positioning.csv"
     # fn = "positioning_tests/24-07-31_13-53-22_positioning.csv"
     fn = "positioning_tests/24-07-31_12-59-37_positioning.csv"
@@ -33,12 +35,12 @@ if __name__ == '__main__':
             if line[0] == "measurement":
                 val = float(line[1])
                 addr = line[2]
-                if addr not in distance_by_address.keys():
-                    distance_by_address[addr] = DistanceList()
-                distance_by_address[addr].add(val)
+                if addr not in row_by_address.keys():
+                    row_by_address[addr] = bank.add_row()
+                bank.add(row_by_address[addr], val)
 
-                completed_anchor_addresses = [addr for addr in distance_by_address.keys()
-                                   if distance_by_address[addr].get_value() is not None]
+                completed_anchor_addresses = [addr for addr, row in row_by_address.items()
+                                              if bank.count(row) >= bank.required_measurements]
                 if len(completed_anchor_addresses) > n_anchors:
                     print(f"New anchor acquired: {addr}")
                     ordered_anchors.append(anchor_positions[addr])
@@ -49,7 +51,7 @@ if __name__ == '__main__':
 
                 position = get_position_by_anchors_2d_lls(
                     a=[anchor_positions[addr] for addr in completed_anchor_addresses],
-                    d=[distance_by_address[addr].get_value() for addr in completed_anchor_addresses]
+                    d=bank.get_values([row_by_address[addr] for addr in completed_anchor_addresses]).tolist()
                 )
                 print(f"Position: {position}   ({n_anchors} anchors)")
                 plotter.set_n_anchors(n_anchors)
@@ -62,4 +64,7 @@ if __name__ == '__main__':
         plotter.plot_anchors(ordered_anchors)
         plotter.plot_target(target)
         plotter.plot_end(position)
-        plotter.show()
\ No newline at end of file
+        if output is not None:
+            plotter.save(output)
+        else:
+            plotter.show()
\ No newline at end of file
@@ -0,0 +1,171 @@
+import threading
+import time
+from typing import Iterable
+
+import numpy as np
+
+from positioning_plotter.solver import StreamingPositionSolver
+from simplexmesh.grid import Point2D
+from simplexmesh.render import new_figure
+
+
+class RingBuffer:
+    """
+    Keeps the most recent rows in a preallocated array, so that memory does not grow with the stream.
+    """
+
+    def __init__(self, capacity: int, width: int):
+        """
+        :param capacity: Maximal number of rows kept
+        :param width: Number of values in a row
+        """
+        self._data = np.empty((capacity, width))
+        self._next = 0
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def append(self, row) -> None:
+        self._data[self._next] = row
+        self._next = (self._next + 1) % len(self._data)
+        self._size = min(self._size + 1, len(self._data))
+
+    def view(self) -> np.ndarray:
+        """
+        :return: A copy of the kept rows, from the oldest to the newest
+        """
+        if self._size < len(self._data):
+            return self._data[:self._size].copy()
+        return np.concatenate((self._data[self._next:], self._data[:self._next]))
+
+
+class LiveDashboard:
+    """
+    Live view of a ranging stream: recent measured distances over time and, if the anchor positions are known,
+    the current position fix with a short trail.
+
+    Measurements are read on a background thread at full rate into ring buffers. The view is redrawn on a timer,
+    independently of data arrival, by updating a few artists in place and blitting only them.
+    """
+
+    def __init__(self, measurements: Iterable[tuple[str, float]], anchor_positions: dict[str, Point2D] | None = None,
+                 window: float = 10, capacity: int = 5000, trail: int = 200, interval_ms: int = 50,
+                 distance_range=(0, 5), xrange=None, yrange=None):
+        """
+        :param measurements: Iterable of (anchor address, distance), eg. read from a serial port
+        :param anchor_positions: Position of every anchor by its address. Without it only the distances are shown.
+        :param window: Time span of the distance plot in seconds
+        :param capacity: Maximal number of measurements kept for the distance plot
+        :param trail: Number of past position fixes drawn
+        :param interval_ms: Redraw interval
+        :param distance_range: Range of the distance axis
+        :param xrange: X range of the position plot, fitted to the anchors if not provided
+        :param yrange: Y range of the position plot, fitted to the anchors if not provided
+        """
+        import matplotlib
+
+        self.measurements = measurements
+        self.window = window
+        self.interval_ms = interval_ms
+        self.solver = StreamingPositionSolver(anchor_positions) if anchor_positions else None
+        self.n_received = 0
+
+        self._samples = RingBuffer(capacity, 3)  # time, distance, address index
+        self._fixes = RingBuffer(trail, 2)
+        self._address_index: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._animation = None
+        self._start_time = time.perf_counter()
+        self._last_fix: Point2D | None = None
+        self._colors = np.array(matplotlib.colormaps["tab10"].colors)
+
+        self.fig, axes = new_figure(2 if self.solver else 1, size=(16 if self.solver else 10, 7))
+        self.ax = axes[0]
+        self.ax.set_xlim(-window, 0)
+        self.ax.set_ylim(*distance_range)
+        self.ax.set_xlabel("Time [s]")
+        self.ax.set_ylabel("Distance")
+        self._distances = self.ax.scatter(np.empty(0), np.empty(0), s=9, animated=True)
+        self._status = self.ax.text(0.01, 0.98, "", transform=self.ax.transAxes, va="top", animated=True)
+        self._artists = [self._distances, self._status]
+
+        if self.solver:
+            self.ax_position = axes[1]
+            anchors = np.array([p.xyz for p in anchor_positions.values()])
+            margin = 0.2 * np.ptp(anchors, axis=0).max()
+            self.ax_position.set_xlim(*(xrange or (anchors[:, 0].min() - margin, anchors[:, 0].max() + margin)))
+            self.ax_position.set_ylim(*(yrange or (anchors[:, 1].min() - margin, anchors[:, 1].max() + margin)))
+            self.ax_position.scatter(*anchors.T, color="black", marker=".", s=64)
+            for address, (x, y) in zip(anchor_positions.keys(), anchors.tolist()):
+                self.ax_position.annotate(address, (x + .06, y + .06), fontsize=8)
+            self._trail, = self.ax_position.plot([], [], color="orange", lw=1, animated=True)
+            self._fix, = self.ax_position.plot([], [], color="green", marker="*", markersize=12, animated=True)
+            self._artists += [self._trail, self._fix]
+
+    def _read(self) -> None:
+        for address, distance in self.measurements:
+            if self._stop.is_set():
+                return
+            t = time.perf_counter() - self._start_time
+            with self._lock:
+                index = self._address_index.setdefault(address, len(self._address_index))
+                self._samples.append((t, distance, index))
+                if self.solver is not None:
+                    self.solver.add(address, distance)
+                self.n_received += 1
+
+    def update(self, _frame=None) -> list:
+        """
+        Pushes the buffered data to the artists. Called by the timer.
+        :return: The updated artists, to be blitted
+        """
+        now = time.perf_counter() - self._start_time
+        with self._lock:
+            samples = self._samples.view()
+            fix = self.solver.get_position() if self.solver is not None else None
+            n_received = self.n_received
+
+        samples = samples[samples[:, 0] > now - self.window]
+        self._distances.set_offsets(np.column_stack((samples[:, 0] - now, samples[:, 1])))
+        self._distances.set_color(self._colors[samples[:, 2].astype(int) % len(self._colors)])
+        rate = np.count_nonzero(samples[:, 0] > now - 1)
+        status = f"{n_received} measurements, {rate} / s"
+
+        if fix is not None:
+            if fix is not self._last_fix:
+                self._fixes.append(fix.xyz)
+                self._last_fix = fix
+            trail = self._fixes.view()
+            self._trail.set_data(trail[:, 0], trail[:, 1])
+            self._fix.set_data([fix[0]], [fix[1]])
+            status += f"\nFix: {fix} ({len(self.solver.completed_addresses)} anchors)"
+        self._status.set_text(status)
+        return self._artists
+
+    def start(self) -> None:
+        """
+        Starts reading the measurements and the redraw timer.
+        """
+        from matplotlib.animation import FuncAnimation
+
+        self._thread = threading.Thread(target=self._read, daemon=True)
+        self._thread.start()
+        self._animation = FuncAnimation(self.fig, self.update, interval=self.interval_ms, blit=True,
+                                        cache_frame_data=False)
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._animation is not None:
+            self._animation.event_source.stop()
+
+    def show(self) -> None:
+        from matplotlib import pyplot as plt
+
+        self.start()
+        try:
+            plt.show()
+        finally:
+            self.stop()
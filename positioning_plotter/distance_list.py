@@ -1,3 +1,5 @@
+import numpy as np
+
 
 class DistanceList:
     def __init__(self):
@@ -47,4 +49,109 @@ class DistanceList:
         self.cached_value = sum(self.filtered) / len(self.filtered)
         # self.cached_value = iqr_mean(self.filtered)
         self.cache_valid = True
-        return self.cached_value
\ No newline at end of file
+        return self.cached_value
+
+
+class DistanceFilterBank:
+    """
+    The filter of DistanceList for many anchors at once. The windows of all anchors are rows of one 2D ring buffer,
+    and the filtered values of all anchors measured since the last update are computed in one vectorized call,
+    so the cost of an update does not grow with the number of Python objects.
+
+    Gives the same values as DistanceList, up to rounding. As there, the windows of the median filter are not sorted,
+    so the median of a window is the mean of its two middle samples in arrival order.
+    """
+
+    def __init__(self, capacity: int = 16, max_measurements: int = 30, required_measurements: int = 10,
+                 median_filter_size: int = 5):
+        """
+        :param capacity: Initial number of rows, grown when needed
+        :param max_measurements: Length of the window of every row
+        :param required_measurements: Number of measurements required to compute a value
+        :param median_filter_size: Size of the median filter, adjusted as in DistanceList
+        """
+        self.max_measurements = max_measurements
+        self.required_measurements = required_measurements
+        half_size = median_filter_size // 2
+        if half_size % 2 == 0:
+            half_size += 1
+        self._half_size = half_size
+        self._buffer = np.zeros((capacity, max_measurements))
+        self.values = np.full(capacity, np.nan)
+        self._counts: list[int] = []
+        self._starts: list[int] = []
+        self._dirty: set[int] = set()
+
+    @property
+    def n_rows(self) -> int:
+        return len(self._counts)
+
+    def add_row(self) -> int:
+        """
+        :return: Index of a new, empty row, eg. for a new anchor
+        """
+        if self.n_rows == len(self._buffer):
+            self._buffer = np.concatenate((self._buffer, np.zeros_like(self._buffer)))
+            self.values = np.concatenate((self.values, np.full(len(self.values), np.nan)))
+        self._counts.append(0)
+        self._starts.append(0)
+        return self.n_rows - 1
+
+    def add(self, row: int, value: float) -> None:
+        """
+        Appends a measurement to a row, dropping the oldest one if the window is full.
+        """
+        n = self._counts[row]
+        if n < self.max_measurements:
+            self._buffer[row, n] = value
+            self._counts[row] = n + 1
+        else:
+            start = self._starts[row]
+            self._buffer[row, start] = value
+            self._starts[row] = (start + 1) % self.max_measurements
+        self._dirty.add(row)
+
+    def count(self, row: int) -> int:
+        """
+        :return: Number of measurements in the window of a row
+        """
+        return self._counts[row]
+
+    def update(self) -> np.ndarray:
+        """
+        Recomputes the values of all rows with new measurements.
+        :return: Indices of the recomputed rows
+        """
+        if not self._dirty:
+            return np.empty(0, dtype=np.int64)
+        rows = np.fromiter(self._dirty, dtype=np.int64, count=len(self._dirty))
+        self._dirty.clear()
+        counts = np.array(self._counts)[rows]
+        ready = counts >= self.required_measurements
+        self.values[rows[~ready]] = np.nan
+        rows, counts = rows[ready], counts[ready]
+        if len(rows) == 0:
+            return rows
+
+        w, h = self.max_measurements, self._half_size
+        order = (np.array(self._starts)[rows, None] + np.arange(w)) % w
+        ordered = self._buffer[rows[:, None], order]
+        # The median of the unsorted window [i - h, i + h) is the mean of samples i - 1 and i
+        cumulative = np.zeros((len(rows), w + 1))
+        np.cumsum((ordered[:, :-1] + ordered[:, 1:]) / 2, axis=1, out=cumulative[:, 2:])
+        b = np.arange(len(rows))
+        self.values[rows] = (cumulative[b, counts - h] - cumulative[b, h]) / (counts - 2 * h)
+        return rows
+
+    def get_values(self, rows) -> np.ndarray:
+        """
+        :param rows: Indices of rows
+        :return: Filtered values of the rows, NaN where there are too few measurements. Updates the bank first.
+        """
+        if self._dirty:
+            self.update()
+        return self.values[rows]
+
+    def get_value(self, row: int) -> float | None:
+        value = self.get_values(row)
+        return None if np.isnan(value) else float(value)
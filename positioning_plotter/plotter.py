@@ -1,17 +1,39 @@
-import matplotlib.pyplot as plt
-from matplotlib.animation import FuncAnimation, PillowWriter
 import numpy as np
+from matplotlib.collections import LineCollection
+from matplotlib.colors import to_rgba
+
+from simplexmesh.render import new_figure, save_figure
+
 
 class Plotter:
-    def __init__(self, xrange=(-5, 5), yrange=(-5, 5)):
-        self.fig, self.ax = plt.subplots()
-        self.points = []
+    """
+    Plots a trace of calculated positions. The trace is kept in NumPy arrays and drawn by two artists,
+    which are updated in place, so that long traces can be plotted live and exported quickly.
+    """
+
+    def __init__(self, xrange=(-5, 5), yrange=(-5, 5), headless=False):
+        """
+        :param headless: Whether to create the figure without pyplot, for exporting only
+        """
+        self.fig, (self.ax,) = new_figure(1, headless, size=(6.4, 4.8))
+        self.headless = headless
         self.n_anchors = 3
         self.anchor_colors = {3: 'y', 4: 'orange', 5: 'r', 6: 'purple'}
 
+        self._points = np.empty((256, 2))
+        self._colors = np.empty((256, 4))
+        self._n_points = 0
+        self._trace = LineCollection(np.empty((0, 2, 2)), lw=1)
+        self.ax.add_collection(self._trace)
+        self._markers = self.ax.scatter(np.empty(0), np.empty(0), marker=".")
+
         self.ax.set_xlim(*xrange)
         self.ax.set_ylim(*yrange)
 
+    @property
+    def points(self) -> np.ndarray:
+        return self._points[:self._n_points]
+
     def set_n_anchors(self, n_anchors):
         self.n_anchors = n_anchors
 
@@ -22,21 +44,44 @@ class Plotter:
         self.ax.plot(point[0], point[1], color="green", markersize=12, marker="*")
 
     def plot_anchors(self, points_list):
-        for i, point in enumerate(points_list):
-            print(point)
-            if i < self.n_anchors:
-                self.ax.plot(point[0], point[1], color="black", markersize=8, marker=".")
-                self.ax.annotate(i, (point[0] + .06, point[1] + .06), zorder=3)
-            else:
-                self.ax.plot(point[0], point[1], color="red", markersize=8, marker=".")
+        points = np.array([point[:2] for point in points_list]).reshape(-1, 2)
+        self.ax.scatter(*points[:self.n_anchors].T, color="black", s=64, marker=".")
+        self.ax.scatter(*points[self.n_anchors:].T, color="red", s=64, marker=".")
+        for i, (x, y) in enumerate(points[:self.n_anchors].tolist()):
+            self.ax.annotate(i, (x + .06, y + .06), zorder=3)
 
     def add_point(self, point):
-        color = self.anchor_colors[self.n_anchors]
-        if len(self.points) > 0:
-            self.ax.plot((self.points[-1][0], point[0]), (self.points[-1][1], point[1]), color=color, lw=1)
-        self.ax.plot(point[0], point[1], color=color, marker=".")
-        self.points.append(point)
+        """
+        Appends a point to the trace. The segment from the previous point gets the color of the new one.
+        The artists are updated on the next refresh.
+        """
+        if self._n_points == len(self._points):
+            self._points = np.resize(self._points, (2 * len(self._points), 2))
+            self._colors = np.resize(self._colors, (2 * len(self._colors), 4))
+        self._points[self._n_points] = point[0], point[1]
+        self._colors[self._n_points] = to_rgba(self.anchor_colors[self.n_anchors])
+        self._n_points += 1
+
+    def refresh(self):
+        """
+        Pushes the trace to the artists. Call before drawing a live figure, eg. followed by plt.pause().
+        """
+        points = self.points
+        self._trace.set_segments(np.stack((points[:-1], points[1:]), axis=1))
+        self._trace.set_color(self._colors[1:self._n_points])
+        self._markers.set_offsets(points)
+        self._markers.set_facecolors(self._colors[:self._n_points])
+        self._markers.set_edgecolors(self._colors[:self._n_points])
+
+    def save(self, path, dpi=100):
+        """
+        Saves the plot, the format given by the extension, eg. .png or .svg.
+        """
+        self.refresh()
+        save_figure(self.fig, path, dpi)
 
     def show(self):
-        plt.show()
+        from matplotlib import pyplot as plt
 
+        self.refresh()
+        plt.show()
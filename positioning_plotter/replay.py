@@ -0,0 +1,191 @@
+"""
+Replay of recorded ranging captures through the positioning pipeline.
+
+Captures are either the CSV files written by positioning_test.py, with "anchor,<x>,<y>,<address>" and
+"measurement,<distance>,<address>[,<target>[,<time>]]" lines, or JSONL files written by record(), with one
+{"time": ..., "address": ..., "distance": ..., "target": ...} object per measurement
+and {"anchor": <address>, "x": ..., "y": ...} objects for the anchors.
+
+Usage:
+    python -m positioning_plotter.replay capture.jsonl [--speed 1] [--anchors anchors.csv] [-o report.json]
+
+Without --speed the capture is replayed as fast as possible. --speed 1 keeps the original timing.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import time
+from pathlib import Path
+from typing import Iterable, Iterator
+
+import numpy as np
+
+from positioning_plotter.service import load_anchors, parse_measurement
+from positioning_plotter.solver import StreamingPositionSolver
+from simplexmesh.grid import Point2D
+
+"""Target of the measurements of captures recorded from a single tag"""
+DEFAULT_TARGET = "tag"
+
+
+def read_capture(path) -> list[tuple[float, str, str, float]]:
+    """
+    :param path: CSV or JSONL capture
+    :return: List of (time, target, anchor address, distance), time is NaN if the capture has no timing
+    """
+    records = []
+    with open(path, "r") as f:
+        if Path(path).suffix == ".jsonl":
+            for line in f:
+                r = json.loads(line)
+                if "anchor" in r:
+                    continue
+                records.append((r.get("time", math.nan), r.get("target", DEFAULT_TARGET), r["address"], r["distance"]))
+            return records
+
+        for line in f:
+            measurement = parse_measurement(line, DEFAULT_TARGET)
+            if measurement is None:
+                continue
+            fields = line.strip().split(",")
+            t = float(fields[4]) if len(fields) > 4 and fields[4] else math.nan
+            records.append((t, *measurement))
+    return records
+
+
+def read_anchors(path) -> dict[str, Point2D]:
+    """
+    :param path: CSV or JSONL capture, or a CSV file with only the anchor lines
+    :return: Position of every anchor by its address
+    """
+    if Path(path).suffix != ".jsonl":
+        return load_anchors(path)
+    anchors = {}
+    with open(path, "r") as f:
+        for line in f:
+            r = json.loads(line)
+            if "anchor" in r:
+                anchors[r["anchor"]] = Point2D((r["x"], r["y"]))
+    return anchors
+
+
+def record(measurements: Iterable[tuple[str, float]], path, target: str = DEFAULT_TARGET,
+           anchor_positions: dict[str, Point2D] | None = None) -> None:
+    """
+    Writes measurements, eg. from serial_measurements(), to a JSONL capture with their arrival times.
+    Stops at the end of the measurements or on KeyboardInterrupt.
+    :param anchor_positions: Positions of the anchors to store with the capture
+    """
+    start = time.perf_counter()
+    with open(path, "w") as f:
+        for address, position in (anchor_positions or {}).items():
+            f.write(json.dumps({"anchor": address, "x": position[0], "y": position[1]}) + "\n")
+        try:
+            for address, distance in measurements:
+                f.write(json.dumps({"time": round(time.perf_counter() - start, 6), "target": target,
+                                    "address": address, "distance": distance}) + "\n")
+        except KeyboardInterrupt:
+            pass
+
+
+def scheduled(records: list[tuple[float, str, str, float]], speed: float | None = None) \
+        -> Iterator[tuple[float, tuple[float, str, str, float]]]:
+    """
+    Yields the records at their original timing scaled by the speed, or as fast as possible.
+    :param speed: Speed of the replay, eg. 1 for the original timing, 10 for ten times faster.
+    As fast as possible if None or if the capture has no timing.
+    :return: Iterator of (perf_counter time at which the record was due, record)
+    """
+    timed = speed is not None and len(records) > 0 and not math.isnan(records[0][0])
+    start = time.perf_counter()
+    first = records[0][0] if timed else 0.0
+    for r in records:
+        if not timed:
+            yield time.perf_counter(), r
+            continue
+        due = start + (r[0] - first) / speed
+        delay = due - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        yield due, r
+
+
+def replay_measurements(path, speed: float | None = None) -> Iterator[tuple[str, float]]:
+    """
+    Replays a capture with the same interface as positioning_test.serial_measurements,
+    so it can be used anywhere a serial port is, eg. in the LiveDashboard.
+    """
+    for _, (_, _, address, distance) in scheduled(read_capture(path), speed):
+        yield address, distance
+
+
+def run(path, anchor_positions=None, speed: float | None = None) -> dict:
+    """
+    Replays a capture through the per-target filtering and solving stages and measures them.
+    A position is solved after every measurement, as in the live view of a single tag.
+    :param anchor_positions: Position of every anchor by its address, taken from the capture if not provided
+    :return: Throughput and end-to-end latency report. The latency of a fix is counted from the time
+    its measurement was due, so a pipeline falling behind the original timing shows up as growing latency.
+    """
+    records = read_capture(path)
+    anchor_positions = anchor_positions or read_anchors(path)
+    if not anchor_positions:
+        raise ValueError(f"No anchor positions in {path}, provide them separately")
+    solvers: dict[str, StreamingPositionSolver] = {}
+    latencies = []
+    filter_time = solve_time = 0.0
+
+    start = time.perf_counter()
+    for due, (_, target, address, distance) in scheduled(records, speed):
+        solver = solvers.get(target)
+        if solver is None:
+            solver = solvers[target] = StreamingPositionSolver(anchor_positions)
+        t0 = time.perf_counter()
+        solver.add(address, distance)
+        t1 = time.perf_counter()
+        position = solver.get_position()
+        t2 = time.perf_counter()
+        filter_time += t1 - t0
+        solve_time += t2 - t1
+        if position is not None:
+            latencies.append(t2 - due)
+    elapsed = time.perf_counter() - start
+
+    latencies = np.array(latencies) * 1000
+    return {
+        "capture": str(path),
+        "speed": speed,
+        "measurements": len(records),
+        "targets": len(solvers),
+        "fixes": len(latencies),
+        "elapsed [s]": round(elapsed, 4),
+        "throughput [1/s]": round(len(records) / elapsed, 1) if elapsed > 0 else None,
+        "filter [us/measurement]": round(filter_time / max(1, len(records)) * 1e6, 2),
+        "solve [us/measurement]": round(solve_time / max(1, len(records)) * 1e6, 2),
+        "latency mean [ms]": round(float(latencies.mean()), 4) if len(latencies) else None,
+        "latency p99 [ms]": round(float(np.percentile(latencies, 99)), 4) if len(latencies) else None,
+        "latency max [ms]": round(float(latencies.max()), 4) if len(latencies) else None,
+    }
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Replay a ranging capture and report throughput and latency.")
+    parser.add_argument("path", help="CSV or JSONL capture")
+    parser.add_argument("--speed", type=float, default=None, help="Replay speed, 1 for the original timing")
+    parser.add_argument("--anchors", default=None, help="CSV file with the anchor lines, the capture by default")
+    parser.add_argument("-o", "--output", default=None, help="Save the report to a JSON file")
+    args = parser.parse_args(argv)
+
+    anchors = read_anchors(args.anchors) if args.anchors is not None else None
+    report = run(args.path, anchors, args.speed)
+    for key, value in report.items():
+        print(f"{key:26} {value}")
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
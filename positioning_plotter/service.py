@@ -0,0 +1,297 @@
+"""
+Positioning service for many tags ranging at once.
+
+Measurements are read concurrently from serial ports, replayed capture files or TCP clients. Each target keeps
+its own solver state, while the distance filters of all targets share one DistanceFilterBank. Position fixes are
+solved for all targets with new data at a fixed tick, batched into one least squares call, and published to
+in-process subscriber queues or to TCP clients as JSON lines.
+
+Usage:
+    python -m positioning_plotter.service --anchors capture.csv --serial COM4 --file other.csv --tcp-in 9000 --tcp-out 9001
+
+Input lines are "measurement,<distance>,<anchor address>[,<target>]" as in the capture CSV files.
+Lines without a target are attributed to the source, eg. the serial port of the tag.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import dataclasses
+import json
+import threading
+import time
+from typing import AsyncIterator
+
+import numpy as np
+
+from positioning_plotter.distance_list import DistanceFilterBank
+from positioning_plotter.solver import StreamingPositionSolver
+from simplexmesh.algorithm import get_positions_by_anchors_lls
+from simplexmesh.grid import Point2D
+
+
+@dataclasses.dataclass(frozen=True)
+class Fix:
+    target: str
+    x: float
+    y: float
+    n_anchors: int
+    """perf_counter time at which the fix was published"""
+    time: float
+    """Time from the first measurement not yet included in a fix to the publication of this one"""
+    latency: float
+
+    def to_json(self) -> str:
+        return json.dumps(dataclasses.asdict(self))
+
+
+def parse_measurement(line: str, default_target: str) -> tuple[str, str, float] | None:
+    """
+    :return: (target, anchor address, distance), None if the line is not a measurement
+    """
+    fields = line.strip().split(",")
+    if fields[0] != "measurement" or len(fields) < 3:
+        return None
+    target = fields[3] if len(fields) > 3 else default_target
+    return target, fields[2], float(fields[1])
+
+
+def load_anchors(path) -> dict[str, Point2D]:
+    """
+    :param path: CSV file with "anchor,<x>,<y>,<address>" lines, eg. a capture
+    :return: Position of every anchor by its address
+    """
+    anchors = {}
+    with open(path, "r") as f:
+        for line in f:
+            fields = line.strip().split(",")
+            if fields[0] == "anchor":
+                anchors[fields[3]] = Point2D((float(fields[1]), float(fields[2])))
+    return anchors
+
+
+class PositioningService:
+    """
+    Keeps a StreamingPositionSolver per target and publishes their position fixes.
+
+    Adding a measurement only appends it to the filter bank shared by all targets and marks the target as changed.
+    Every tick, the filters of all measured anchors of all targets are updated in one vectorized call,
+    and the positions of all changed targets are solved in batches grouped by the number of anchors, so the cost of
+    a tick grows with the number of changed targets, not with the number of measurements, and the latency of
+    a fix is bounded by the tick interval plus the time of one batched solve.
+    """
+
+    def __init__(self, anchor_positions: dict[str, Point2D], tick: float = 0.02, min_anchors: int = 3,
+                 queue_size: int = 1000):
+        """
+        :param anchor_positions: Position of every anchor by its address, shared by all targets
+        :param tick: Interval of solving and publishing fixes in seconds
+        :param min_anchors: Number of anchors with a filtered distance required to solve a position
+        :param queue_size: Capacity of a subscriber queue. When full, the oldest fixes are dropped.
+        """
+        self.anchor_positions = anchor_positions
+        self.tick = tick
+        self.min_anchors = min_anchors
+        self.queue_size = queue_size
+        self.solvers: dict[str, StreamingPositionSolver] = {}
+        self.bank = DistanceFilterBank()
+        self.n_measurements = 0
+        self.n_fixes = 0
+        self.latencies: list[float] = []
+        self._changed: dict[str, float] = {}
+        self._subscribers: list[asyncio.Queue] = []
+
+    def add_measurement(self, target: str, address: str, distance: float) -> None:
+        solver = self.solvers.get(target)
+        if solver is None:
+            solver = self.solvers[target] = StreamingPositionSolver(self.anchor_positions, self.min_anchors, self.bank)
+        if solver.add(address, distance):
+            self.n_measurements += 1
+            self._changed.setdefault(target, time.perf_counter())
+
+    def subscribe(self) -> asyncio.Queue:
+        """
+        :return: A queue receiving every published Fix
+        """
+        queue = asyncio.Queue(self.queue_size)
+        self._subscribers.append(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        self._subscribers.remove(queue)
+
+    def solve_changed(self) -> list[Fix]:
+        """
+        Solves the positions of all targets which received measurements since the last call.
+        :return: The new fixes
+        """
+        changed, self._changed = self._changed, {}
+        self.bank.update()
+        by_n_anchors: dict[int, list[tuple[str, list, list]]] = {}
+        for target in changed:
+            inputs = self.solvers[target].get_anchors_and_distances()
+            if inputs is not None:
+                by_n_anchors.setdefault(len(inputs[0]), []).append((target, *inputs))
+
+        fixes = []
+        now = time.perf_counter()
+        for n_anchors, problems in by_n_anchors.items():
+            a = np.array([[p.xyz for p in anchors] for _, anchors, _ in problems], dtype=np.float64)
+            d = np.array([distances for _, _, distances in problems], dtype=np.float64)
+            positions = get_positions_by_anchors_lls(a, d).tolist()
+            now = time.perf_counter()
+            for (target, _, _), (x, y) in zip(problems, positions):
+                self.solvers[target].set_position(Point2D((x, y)))
+                fixes.append(Fix(target, x, y, n_anchors, now, now - changed[target]))
+        return fixes
+
+    def publish(self, fixes: list[Fix]) -> None:
+        for fix in fixes:
+            self.latencies.append(fix.latency)
+            for queue in self._subscribers:
+                if queue.full():
+                    queue.get_nowait()
+                queue.put_nowait(fix)
+        self.n_fixes += len(fixes)
+
+    async def run_publisher(self) -> None:
+        """
+        Solves and publishes the fixes every tick, until cancelled.
+        """
+        next_tick = time.perf_counter()
+        while True:
+            self.publish(self.solve_changed())
+            next_tick += self.tick
+            await asyncio.sleep(max(0.0, next_tick - time.perf_counter()))
+
+    async def consume(self, source: AsyncIterator[tuple[str, str, float]]) -> None:
+        """
+        Adds all measurements of a source, given as (target, anchor address, distance).
+        """
+        async for target, address, distance in source:
+            self.add_measurement(target, address, distance)
+
+    def latency_summary(self) -> dict:
+        if not self.latencies:
+            return {"fixes": 0}
+        latencies = np.array(self.latencies) * 1000
+        return {
+            "measurements": self.n_measurements,
+            "fixes": self.n_fixes,
+            "targets": len(self.solvers),
+            "latency mean [ms]": round(float(latencies.mean()), 2),
+            "latency p99 [ms]": round(float(np.percentile(latencies, 99)), 2),
+            "latency max [ms]": round(float(latencies.max()), 2),
+        }
+
+
+async def file_source(path, target: str | None = None, rate: float | None = None):
+    """
+    Replays the measurements of a capture file.
+    :param target: Target of lines without one, the file name by default
+    :param rate: Measurements per second, as fast as possible if not provided
+    """
+    target = str(path) if target is None else target
+    with open(path, "r") as f:
+        for line in f:
+            measurement = parse_measurement(line, target)
+            if measurement is None:
+                continue
+            yield measurement
+            await asyncio.sleep(0 if rate is None else 1 / rate)
+
+
+async def serial_source(port: str, target: str | None = None):
+    """
+    Reads the measurements of a tag connected to a serial port. The blocking reads run on a dedicated thread,
+    so that any number of ports can be read at once.
+    :param target: Target of the measurements, the port name by default
+    """
+    from positioning_test import serial_measurements
+
+    target = port if target is None else target
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+
+    def read():
+        for address, distance in serial_measurements(port):
+            loop.call_soon_threadsafe(queue.put_nowait, (target, address, distance))
+
+    threading.Thread(target=read, daemon=True).start()
+    while True:
+        yield await queue.get()
+
+
+async def serve_measurements(service: PositioningService, host: str, port: int) -> asyncio.AbstractServer:
+    """
+    Accepts TCP clients sending measurement lines. Lines without a target are attributed to "<host>:<port>" of the client.
+    """
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        peer = "%s:%s" % writer.get_extra_info("peername")[:2]
+        while line := await reader.readline():
+            measurement = parse_measurement(line.decode(), peer)
+            if measurement is not None:
+                service.add_measurement(*measurement)
+        writer.close()
+
+    return await asyncio.start_server(handle, host, port)
+
+
+async def serve_fixes(service: PositioningService, host: str, port: int) -> asyncio.AbstractServer:
+    """
+    Streams every published fix to the connected TCP clients as JSON lines.
+    """
+    async def handle(_reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        queue = service.subscribe()
+        try:
+            while True:
+                writer.write((await queue.get()).to_json().encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            service.unsubscribe(queue)
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
+
+
+async def main_async(args) -> None:
+    service = PositioningService(load_anchors(args.anchors), tick=args.tick)
+    servers = []
+    if args.tcp_in is not None:
+        servers.append(await serve_measurements(service, args.host, args.tcp_in))
+    if args.tcp_out is not None:
+        servers.append(await serve_fixes(service, args.host, args.tcp_out))
+    sources = [serial_source(port) for port in args.serial] + [file_source(path, rate=args.rate) for path in args.file]
+
+    publisher = asyncio.create_task(service.run_publisher())
+    try:
+        await asyncio.gather(*(service.consume(source) for source in sources))
+        if servers:
+            await asyncio.gather(*(server.serve_forever() for server in servers))
+        await asyncio.sleep(2 * service.tick)
+    finally:
+        publisher.cancel()
+        print(f"[SERVICE] {service.latency_summary()}")
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Serve position fixes of many tags from many measurement sources.")
+    parser.add_argument("--anchors", required=True, help="CSV file with anchor,<x>,<y>,<address> lines")
+    parser.add_argument("--serial", action="append", default=[], help="Serial port of a tag, may be repeated")
+    parser.add_argument("--file", action="append", default=[], help="Capture file to replay, may be repeated")
+    parser.add_argument("--rate", type=float, default=None, help="Replay rate of capture files per second")
+    parser.add_argument("--tcp-in", type=int, default=None, help="Port accepting measurement lines")
+    parser.add_argument("--tcp-out", type=int, default=None, help="Port streaming fixes as JSON lines")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--tick", type=float, default=0.02, help="Interval of solving the fixes in seconds")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(main_async(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+from positioning_plotter.distance_list import DistanceFilterBank
+from simplexmesh.algorithm import get_position_by_anchors_2d_lls
+from simplexmesh.grid import Point2D
+
+
+class StreamingPositionSolver:
+    """
+    Solves the position of a target from a stream of ranging measurements to anchors with known positions.
+    Measurements are filtered per anchor by a row of a DistanceFilterBank, and the position is solved from all anchors
+    which already have a filtered distance, in the order in which they got it.
+    """
+
+    def __init__(self, anchor_positions: dict[str, Point2D], min_anchors: int = 3,
+                 bank: DistanceFilterBank | None = None):
+        """
+        :param anchor_positions: Position of every anchor by its address
+        :param min_anchors: Number of anchors with a filtered distance required to solve the position
+        :param bank: Filter bank shared with other solvers, so that all of them are filtered in one call
+        """
+        self.anchor_positions = anchor_positions
+        self.min_anchors = min_anchors
+        self.bank = bank if bank is not None else DistanceFilterBank()
+        self.row_by_address: dict[str, int] = {}
+        self.completed_addresses: list[str] = []
+        self._completed_rows: list[int] = []
+        self.n_measurements = 0
+        self._position: Point2D | None = None
+        self._position_valid = False
+
+    def add(self, address: str, distance: float) -> bool:
+        """
+        :param address: Address of the anchor
+        :param distance: Measured distance to the anchor
+        :return: True if the measurement was used, False if the anchor is not known
+        """
+        if address not in self.anchor_positions:
+            return False
+        row = self.row_by_address.get(address)
+        if row is None:
+            row = self.row_by_address[address] = self.bank.add_row()
+        self.bank.add(row, distance)
+        if self.bank.count(row) == self.bank.required_measurements:
+            self.completed_addresses.append(address)
+            self._completed_rows.append(row)
+        self.n_measurements += 1
+        self._position_valid = False
+        return True
+
+    def get_anchors_and_distances(self) -> tuple[list[Point2D], list[float]] | None:
+        """
+        :return: Positions of the anchors with a filtered distance and the distances,
+        None if there are too few of them to solve the position
+        """
+        addresses = self.completed_addresses
+        if len(addresses) < self.min_anchors:
+            return None
+        return ([self.anchor_positions[addr] for addr in addresses],
+                self.bank.get_values(self._completed_rows).tolist())
+
+    def get_position(self) -> Point2D | None:
+        """
+        :return: The current position fix, None if too few anchors have a filtered distance.
+        Solved only if a measurement arrived since the last call.
+        """
+        if self._position_valid:
+            return self._position
+        inputs = self.get_anchors_and_distances()
+        self._position = None if inputs is None else get_position_by_anchors_2d_lls(*inputs)
+        self._position_valid = True
+        return self._position
+
+    def set_position(self, position: Point2D | None) -> None:
+        """
+        Stores a position solved outside of the solver, eg. in a batch with other targets.
+        """
+        self._position = position
+        self._position_valid = True
@@ -3,8 +3,7 @@ import random
 import datetime
 import time
 
-import matplotlib.pyplot as plt
-
+from positioning_plotter.dashboard import LiveDashboard
 from simplexmesh.grid import Point2D
 import serial
 import re
@@ -103,25 +102,21 @@ def generate_csv_from_serial(port="COM4", shuffle=False):
             shuffle_csv(fname)
 
 
-def plot_from_serial(port="COM4"):
-    fig, ax = plt.subplots(1, 1, figsize=(10, 8))
-    ax.set_xlim(0, 10)
-    ax.set_ylim(0, 5)
-
-    start_time = time.time()
+def simulated_measurements(rate=500):
+    """
+    Generates measurements of the test anchors at the given rate per second, to try out the live view without hardware.
+    """
+    while True:
+        addr = random.choices(population=addresses, weights=weights, k=1)[0]
+        yield addr, measure(addr)
+        time.sleep(1 / rate)
 
-    for addr, dist in serial_measurements(port):
-        delta = (time.time() - start_time) * 1000
-        x = (delta % 10000) / 1000
-        ax.scatter(x, dist, c="orange")
-        plt.pause(0.1)
-        if delta > 10000:
-            plt.cla()
-            ax.set_xlim(0, 10)
-            ax.set_ylim(0, 5)
-            start_time = time.time()
 
-    plt.show()
+def plot_from_serial(port="COM4", anchor_positions=None):
+    """
+    Shows the measured distances live and, if the anchor positions are given, the current position fix.
+    """
+    LiveDashboard(serial_measurements(port), anchor_positions, window=10, distance_range=(0, 5)).show()
 
 
 
@@ -138,5 +133,6 @@ if __name__ == '__main__':
     # shuffle_csv("positioning_tests/24-07-31_14-12-03_positioning.csv")
     # generate_csv_from_serial("COM8", shuffle=False)
     plot_from_serial("COM25")
+    # LiveDashboard(simulated_measurements(), true_positions, distance_range=(0, 15)).show()
     # for addr, dist in serial_measurements("COM25"):
     #     print(addr, dist)
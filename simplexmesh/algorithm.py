@@ -1,8 +1,7 @@
 import numpy
 import numpy as np
 from math import sqrt
-import sympy
-from simplexmesh.grid import Point2D
+from simplexmesh.grid import Point2D, Point3D
 
 
 def determinant_roots(d):
@@ -30,6 +29,7 @@ def determinant_roots(d):
 
 
 def sympy_determinant_roots(d):
+    import sympy  # Slow to import and only used to check the numeric solvers
     x = sympy.Symbol('x')
     m = [[      0, d[0][1], d[0][2],       x, 1],
          [d[0][1],       0, d[1][2], d[1][3], 1],
@@ -61,6 +61,49 @@ def simplex_diagonal(p0p1, p0p2, p1p2, p1p3, p2p3, use_sympy=False):
     return determinant_roots(d) if not use_sympy else sympy_determinant_roots(d)
 
 
+def cayley_menger_diagonals(d2: np.ndarray) -> np.ndarray:
+    """
+    Batched Cayley-Menger solver for the missing edge between the first and the last point of a simplex.
+    The points must lie in a space of one dimension less than a simplex of that size would need,
+    eg. 4 points on a plane or 5 points in 3D, so that the Cayley-Menger determinant is zero.
+    The determinant is a quadratic polynomial of the squared missing edge,
+    which is recovered by evaluating it at -1, 0 and 1.
+    :param d2: Array of shape (batch, m, m) of squared distances. The [0, m-1] and [m-1, 0] entries are ignored.
+    :return: Array of shape (batch, 2) with both candidate lengths of the missing edge, NaN if there is no real one
+    """
+    batch, m, _ = d2.shape
+    cm = np.ones((3, batch, m + 1, m + 1))
+    cm[:, :, :m, :m] = d2
+    cm[:, :, m, m] = 0
+    for k, x in enumerate((-1., 0., 1.)):
+        cm[k, :, 0, m - 1] = x
+        cm[k, :, m - 1, 0] = x
+
+    f_neg, f_zero, f_pos = np.linalg.det(cm)
+    a = (f_pos + f_neg) / 2 - f_zero
+    b = (f_pos - f_neg) / 2
+    c = f_zero
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rd = np.sqrt(b * b - 4 * a * c)
+        roots = np.stack(((-b - rd) / (2 * a), (-b + rd) / (2 * a)), axis=1)
+        return np.sqrt(np.where(roots > 0, roots, np.nan))
+
+
+def simplex_diagonal_3d(p0p1, p0p2, p0p3, p1p2, p1p3, p2p3, p1p4, p2p4, p3p4):
+    """
+    Finds the two possible distances between p0 and p4, given a gate of three nodes p1, p2, p3
+    with known distances to both of them. The two solutions are mirror images across the plane of the gate.
+    """
+    d = np.array([[0, p0p1, p0p2, p0p3, 0],
+                  [p0p1, 0, p1p2, p1p3, p1p4],
+                  [p0p2, p1p2, 0, p2p3, p2p4],
+                  [p0p3, p1p3, p2p3, 0, p3p4],
+                  [0, p1p4, p2p4, p3p4, 0]], dtype=np.float64)
+    roots = cayley_menger_diagonals((d * d)[None])[0]
+    return [float(r) for r in roots if not np.isnan(r)]
+
+
 def get_position_by_anchors_2d(a: list["Point2D"], d: list[float]):
     a0 = a.pop()
     d0 = d.pop()
@@ -100,6 +143,43 @@ def get_position_by_anchors_2d_lls(a: list["Point2D"], d: list[float]):
     return Point2D(p)
 
 
+def get_positions_by_anchors_lls(a: np.ndarray, d: np.ndarray) -> np.ndarray:
+    """
+    Batched linear least squares multilateration, in any number of dimensions.
+    The last anchor of every problem is used as the reference one, as in get_position_by_anchors_2d_lls.
+    :param a: Anchor coordinates, shape (batch, n_anchors, dim). At least dim + 1 anchors are needed.
+    :param d: Distances to the anchors, shape (batch, n_anchors)
+    :return: Positions, shape (batch, dim)
+    """
+    a0, d0 = a[:, -1:, :], d[:, -1:]
+    A = 2 * (a[:, :-1, :] - a0)
+    B = (d0 ** 2 - d[:, :-1] ** 2) - (a0 ** 2 - a[:, :-1, :] ** 2).sum(axis=2)
+    return (np.linalg.pinv(A) @ B[:, :, None])[:, :, 0]
+
+
+def refine_position_by_anchors(x: np.ndarray, a: np.ndarray, d: np.ndarray, iterations: int) -> np.ndarray:
+    """
+    Gauss-Newton refinement of a position minimizing the squared errors of its distances to the anchors.
+    Started from the previous estimate after a small change of the distances, a few steps are enough.
+    :param x: Starting position, shape (dim,)
+    :param a: Anchor coordinates, shape (n_anchors, dim)
+    :param d: Distances to the anchors, shape (n_anchors,)
+    :param iterations: Number of steps
+    :return: Refined position, shape (dim,)
+    """
+    for _ in range(iterations):
+        diff = x - a
+        r = np.maximum(np.linalg.norm(diff, axis=1), 1e-9)
+        x = x + np.linalg.lstsq(diff / r[:, None], d - r, rcond=None)[0]
+    return x
+
+
+def get_position_by_anchors_3d_lls(a: list["Point3D"], d: list[float]):
+    positions = get_positions_by_anchors_lls(np.array([[p.xyz for p in a]], dtype=np.float64),
+                                             np.array([d], dtype=np.float64))
+    return Point3D(tuple(positions[0].tolist()))
+
+
 
 
 if __name__ == '__main__':
@@ -1,5 +1,80 @@
+import contextlib
+import copy
+from collections.abc import MutableMapping
 from pathlib import Path
 
-import yaml
 
-config = yaml.safe_load(open(Path(__file__).parent.joinpath("config.yaml"), "r"))
+class LazyConfig(MutableMapping):
+    """
+    The global configuration. The YAML file is parsed on first access instead of at import,
+    so that processes which never read the configuration, eg. pool workers only running the solvers, start faster.
+    """
+
+    def __init__(self, path: Path):
+        self._path = path
+        self._data: dict | None = None
+
+    @property
+    def data(self) -> dict:
+        if self._data is None:
+            import yaml
+            with open(self._path, "r") as f:
+                self._data = yaml.safe_load(f)
+        return self._data
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def __setitem__(self, key, value):
+        self.data[key] = value
+
+    def __delitem__(self, key):
+        del self.data[key]
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def clear(self) -> None:
+        self._data = {}
+
+    def __repr__(self) -> str:
+        return repr(self.data)
+
+
+config = LazyConfig(Path(__file__).parent.joinpath("config.yaml"))
+
+
+def with_overrides(base: dict, overrides: dict) -> dict:
+    """
+    Builds a new configuration without modifying the base one.
+    :param base: Configuration to start from
+    :param overrides: Mapping of "section.key" to the overridden value
+    :return: A deep copy of the base configuration with the overrides applied
+    """
+    result = copy.deepcopy(dict(base))
+    for name, value in overrides.items():
+        section, key = name.split(".", 1)
+        if key not in result.get(section, {}):
+            raise KeyError(f"Unknown configuration value {name}")
+        result[section][key] = value
+    return result
+
+
+@contextlib.contextmanager
+def use_config(run_config: dict):
+    """
+    Installs a configuration in place of the global one for the duration of a run.
+    Values are read from the configuration when objects are created, so everything created inside sees it.
+    :param run_config: Complete configuration, eg. built by with_overrides
+    """
+    saved = copy.deepcopy(config)
+    config.clear()
+    config.update(copy.deepcopy(run_config))
+    try:
+        yield config
+    finally:
+        config.clear()
+        config.update(saved)
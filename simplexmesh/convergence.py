@@ -0,0 +1,181 @@
+"""
+Records how a simulation converges over iterations and compares recorded runs.
+
+Usage:
+    python -m simplexmesh.convergence show run.npz
+    python -m simplexmesh.convergence compare run_a.npz run_b.npz [...]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import math
+from typing import Collection, TYPE_CHECKING
+
+import numpy as np
+
+from simplexmesh.config import config
+
+if TYPE_CHECKING:
+    from simplexmesh.grid import Grid, Network
+    from simplexmesh.node import Node
+
+
+class ConvergenceRecorder:
+    """
+    Keeps a compact per-iteration record of edges solved, nodes anchored and the error of the solved edges.
+
+    Edge values are pushed by the nodes through Network.edge_listener as soon as they change, so that a record
+    only has to reduce an array of errors instead of walking every SolutionSet of every node.
+    """
+
+    DTYPE = np.dtype([
+        ("iteration", "<u4"),
+        ("edges_solved", "<u4"),
+        ("nodes_anchored", "<u4"),
+        ("mean_error", "<f4"),
+        ("p95_error", "<f4"),
+    ])
+
+    """Config values stored with each record, as these are the ones tuned by comparing runs"""
+    TRACKED_PARAMETERS = [
+        ("grid", "n_nodes"),
+        ("node", "hop_level_advance_threshold"),
+        ("solution_set", "mode_finder"),
+        ("solution_set", "deriv_filter_avg_threshold"),
+        ("solution_set", "max_set_length"),
+        ("measurement", "sd"),
+    ]
+
+    def __init__(self, grid: Grid, network: Network, every: int = 1):
+        """
+        :param grid: Grid of the simulation, used to obtain the true distances
+        :param network: Network of the simulation. The recorder registers itself as its edge listener.
+        :param every: Record only every n-th iteration
+        """
+        self.every = every
+        self._nodes: Collection[Node] = network.nodes()
+        self._coords = grid.real_node_coords
+        self._errors: dict[tuple[int, int], float] = {}
+        self._records = np.zeros(config["simulation"]["iterations"] // every + 1, dtype=self.DTYPE)
+        self._n_records = 0
+        self.parameters = {f"{section}.{key}": config[section][key] for section, key in self.TRACKED_PARAMETERS}
+        network.edge_listener = self.on_edge_value
+
+    def on_edge_value(self, origin: int, target: int, value: float, is_exact: bool) -> None:
+        """
+        Called by a node whenever its value of an edge is set, or with None when the value is lost.
+        Exact edges are direct measurements, so they are not counted as solved.
+        """
+        if value is None:
+            self._errors.pop((origin, target), None)
+        elif not is_exact:
+            self._errors[(origin, target)] = abs(value - math.dist(self._coords[origin].xyz, self._coords[target].xyz))
+
+    def record(self, iteration: int) -> None:
+        """
+        Stores the state of the network after the given iteration.
+        :param iteration: Number of the iteration that just ended
+        """
+        if iteration % self.every != 0:
+            return
+        if self._n_records == len(self._records):
+            self._records = np.resize(self._records, 2 * len(self._records))
+
+        errors = np.fromiter(self._errors.values(), dtype=np.float32, count=len(self._errors))
+        row = self._records[self._n_records]
+        row["iteration"] = iteration
+        row["edges_solved"] = len(errors)
+        row["nodes_anchored"] = sum(1 for node in self._nodes if node.is_anchor or node.anchor_reached)
+        row["mean_error"] = errors.mean() if len(errors) else np.nan
+        row["p95_error"] = np.percentile(errors, 95) if len(errors) else np.nan
+        self._n_records += 1
+
+    @property
+    def records(self) -> np.ndarray:
+        return self._records[:self._n_records]
+
+    def save(self, path) -> None:
+        """
+        Saves the records and the tracked configuration to an uncompressed .npz file.
+        """
+        np.savez(path, records=self.records, parameters=np.array(json.dumps(self.parameters)))
+
+
+def load(path) -> tuple[np.ndarray, dict]:
+    """
+    :param path: Path to a file created by ConvergenceRecorder.save
+    :return: The records array and the dict of tracked configuration values
+    """
+    with np.load(path) as data:
+        return data["records"], json.loads(str(data["parameters"]))
+
+
+def iterations_to_reach(records: np.ndarray, field: str, value: float) -> int | None:
+    """
+    :return: First recorded iteration at which the field reached the value, None if it never did
+    """
+    hits = np.nonzero(records[field] >= value)[0]
+    if len(hits) == 0:
+        return None
+    return int(records["iteration"][hits[0]])
+
+
+def summarize(records: np.ndarray, n_nodes: int) -> dict:
+    """
+    :param records: Records of a single run
+    :param n_nodes: Number of nodes in the run
+    :return: Iterations to reach fractions of anchored nodes and solved edges, and the final errors
+    """
+    final = records[-1]
+    result = {}
+    for frac in (0.5, 0.9, 1.0):
+        result[f"anchored {int(frac * 100)}%"] = iterations_to_reach(records, "nodes_anchored", math.ceil(frac * n_nodes))
+    for frac in (0.5, 0.9):
+        result[f"edges {int(frac * 100)}%"] = iterations_to_reach(records, "edges_solved", frac * final["edges_solved"])
+    result["final edges"] = int(final["edges_solved"])
+    result["final mean err"] = round(float(final["mean_error"]), 3)
+    result["final p95 err"] = round(float(final["p95_error"]), 3)
+    return result
+
+
+def print_table(header: list[str], rows: list[list]) -> None:
+    """
+    Prints rows as a table with right-aligned columns.
+    """
+    widths = [max(len(str(x)) for x in column) for column in zip(header, *rows)]
+    for row in [header, *rows]:
+        print("  ".join(f"{str(x):>{w}}" for x, w in zip(row, widths)))
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Inspect and compare convergence records of simulation runs.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    show = subparsers.add_parser("show", help="Print the records of a single run")
+    show.add_argument("path")
+    show.add_argument("--rows", type=int, default=20, help="Number of evenly spaced records to print")
+    cmp = subparsers.add_parser("compare", help="Compare iterations to convergence of several runs")
+    cmp.add_argument("paths", nargs="+")
+    args = parser.parse_args(argv)
+
+    if args.command == "show":
+        records, parameters = load(args.path)
+        print(parameters)
+        step = max(1, len(records) // args.rows)
+        print_table(list(records.dtype.names), [[round(x, 3) if isinstance(x, float) else x for x in row] for row in records[::step].tolist()])
+        return
+
+    summaries, parameter_rows = [], []
+    for path in args.paths:
+        records, parameters = load(path)
+        summaries.append(summarize(records, parameters["grid.n_nodes"]))
+        parameter_rows.append(parameters)
+    print_table(["run", *parameter_rows[0].keys()],
+                 [[path, *p.values()] for path, p in zip(args.paths, parameter_rows)])
+    print()
+    print_table(["run", *summaries[0].keys()],
+                 [[path, *("-" if v is None else v for v in s.values())] for path, s in zip(args.paths, summaries)])
+
+
+if __name__ == '__main__':
+    main()
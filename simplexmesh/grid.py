@@ -1,24 +1,23 @@
 from __future__ import annotations
 
 import abc
+import bisect
 import dataclasses
+import heapq
 import itertools
 import math
-import random
+import numpy as np
 from simplexmesh.config import config
-from matplotlib import pyplot as plt
-from matplotlib.collections import LineCollection
+from simplexmesh.spatial import (in_reach_pairs, poisson_disk_sample, csr_adjacency, bfs_hop_counts, PointIndex,
+                                 SlackAdjacency)
+from simplexmesh.streams import RandomStreams
+from simplexmesh.render import NetworkRenderer, new_figure, save_figure
 from abc import ABC
 from typing import Generic, TypeVar, Type, Collection, TYPE_CHECKING
 
 if TYPE_CHECKING:
     from node import Node
-
-
-"""
-To preserve the same network in testing phase
-"""
-random.seed(43)
+    from simplexmesh.transport import Transport
 
 
 """Abstract class for a N-dimensional point in an Euclidean Space."""
@@ -51,16 +50,17 @@ class Point(ABC):
         return math.sqrt(self.d2_to(other))
 
     @classmethod
-    def random(cls, lower_bound=0, upper_bound=1) -> Point:
+    def random(cls, rng: np.random.Generator, lower_bound=0, upper_bound=1) -> Point:
         """
         Creates a new object of a subclass of Point, which has random coordinates in the given range
+        :param rng: Generator to draw the coordinates from
         :param lower_bound: minimal value of coordinates
         :param upper_bound: maximal value of coordinates
         :return: a Point with random coordinates
         """
         assert upper_bound > lower_bound
         diff = upper_bound - lower_bound
-        coords = tuple(random.random() * diff + lower_bound for _ in range(cls.dim))
+        coords = tuple((rng.random(cls.dim) * diff + lower_bound).tolist())
         return cls.__call__(coords)
 
     def __repr__(self):
@@ -88,28 +88,58 @@ class Point3D(Point, ABC):
         return super().__repr__()
 
 
+@dataclasses.dataclass
+class TopologyChange:
+    """A node joining, leaving or moving, as seen by the rest of the network"""
+    node: int
+    added_neighbors: list[int]
+    removed_neighbors: list[int]
+    """Nodes whose hop counts to any node other than the changed one changed"""
+    changed_hop_rows: list[int]
+
+
 class Network:
     """
     Takes care of communication between nodes.
     Any node can get access to another by its ID (address)
     """
-    _nodes: dict = {}
+    def __init__(self, transport: Transport | None = None):
+        """
+        :param transport: Optional simulated radio transport accounting the messages of the nodes
+        """
+        self._nodes: dict = {}
+        self._node_count = config["grid"]["n_nodes"]
+        self.transport = transport
 
-    def __init__(self):
-        pass
+        """Optional callback (origin_id, target_id, value, is_exact) called whenever a node sets an edge value"""
+        self.edge_listener = None
 
     def add_node(self, node) -> None:
         self._nodes[node._id] = node
+        self._node_count = max(self._node_count, node._id + 1)
+
+    def remove_node(self, id: int) -> None:
+        del self._nodes[id]
 
     def get_node(self, id: int) -> Node | None:
         return self._nodes.get(id, None)
 
     def get_node_count(self) -> int:
-        return config["grid"]["n_nodes"]
+        """
+        :return: Number of node IDs ever used, including those of nodes which left
+        """
+        return self._node_count
 
     def nodes(self) -> Collection[Node]:
         return self._nodes.values()
 
+    def end_round(self) -> None:
+        """
+        Closes a round of the propagation, in which every node made one step.
+        """
+        if self.transport is not None:
+            self.transport.end_round(self)
+
 
 P = TypeVar("P", bound=Point)
 
@@ -120,58 +150,406 @@ class Grid(Generic[P]):
     Works in either 2D or 3D, a point_type parameter needs to be provided.
     """
 
-    """Maximum distance below which nodes can communicate with each other"""
-    NODE_REACH = config["node"]["max_reach"]
-
-    def __init__(self, point_type: Type[P], n_nodes: int, grid_size: int, sd: float = 0.2):
+    def __init__(self, point_type: Type[P], n_nodes: int, grid_size: int, sd: float = 0.2, seed: int | None = None,
+                 streams: RandomStreams | None = None):
         """
         :param point_type: Point2D or Point3D
         :param n_nodes: Number of nodes in the network
         :param grid_size: Size of a single dimension in units. It is assumed the grid is a square or a cube
         :param sd: Standard deviation for the normal distribution used to provide simulated measurement results.
         The distribution is always centered on the real value.
+        :param seed: Root seed of the random streams. Taken from simulation.seed in configuration if not provided,
+        so that the same network is preserved in the testing phase.
+        :param streams: Random streams shared with the rest of the simulation.
+        Only one of seed and streams can be given.
         """
         self.P = point_type
+        """Maximum distance below which nodes can communicate with each other"""
+        self.NODE_REACH = config["node"]["max_reach"]
         self.n_nodes = n_nodes
         self.grid_size = grid_size
         self.sd = sd
+        if streams is not None and seed is not None:
+            raise ValueError("The seed of a grid with shared random streams is given by the streams")
+        if streams is None:
+            streams = RandomStreams(config["simulation"]["seed"] if seed is None else seed)
+        self.streams = streams
+        self.rng = self.streams.generator("placement")
+        self._measurement_rngs: dict[int, np.random.Generator] = {}
         self.real_node_coords: list[P] = []
-        self._placement_conditions = [self._condition_nodes_away_from_each_other]
-
-    def _condition_nodes_away_from_each_other(self, point: P) -> bool:
-        for target in self.real_node_coords:
-            if point.distance_to(target) < config["grid"]["min_node_real_distance"]:
-                return False
-        return True
-
-    def get_random_node_placement(self) -> P | None:
-        counter = 100
-        while counter > 0:
-            point = self.P.random(upper_bound=self.grid_size)
-            counter -= 1
-            for condition in self._placement_conditions:
-                if not condition(point):
-                    break
-            else:
-                return point
-
-        return None
+        self.coords: np.ndarray | None = None
+        self._in_reach_pairs: np.ndarray | None = None
+        self._indptr: np.ndarray | None = None
+        self._indices: np.ndarray | None = None
+        self._neighbors: list[list[int]] | None = None
+        self._hop_rows: np.ndarray | None = None
+        """Adjacency patched by topology changes, and the buffers which _hop_rows and coords are views of"""
+        self._adjacency: SlackAdjacency | None = None
+        self._hop_buffer: np.ndarray | None = None
+        self._coords_buffer: np.ndarray | None = None
+        self._point_index: PointIndex | None = None
+        """IDs of the nodes which left the network. Their coordinates are kept, but they have no neighbors."""
+        self.removed: set[int] = set()
+
+    def _placement_mask(self, points: np.ndarray) -> np.ndarray:
+        """
+        Vectorized placement condition, checked on top of the minimal distance between nodes.
+        :param points: Candidate coordinates of shape (k, dim)
+        :return: Boolean array telling which candidates may be used
+        """
+        return np.ones(len(points), dtype=bool)
 
     def setup(self):
         """
         Creates the points on the grid, such that no two lie closer together than a constant given in configuration.
+        A Poisson-disk sample of the grid is drawn first, then the required number of nodes is picked from it at random.
         :return: None
         """
         print("setup")
-        for i in range(self.n_nodes):
-            point = self.get_random_node_placement()
-            if point is None:
-                raise RecursionError("Not possible to fit another node onto grid under current configuration")
+        points = poisson_disk_sample(self.rng, self.grid_size, self.P.dim, config["grid"]["min_node_real_distance"],
+                                     n_required=self.n_nodes, accept=self._placement_mask)
+        if len(points) < self.n_nodes:
+            raise RecursionError("Not possible to fit another node onto grid under current configuration")
 
-            self.real_node_coords.append(point)
+        points = points[self.rng.choice(len(points), self.n_nodes, replace=False)]
+        self.real_node_coords = [self.P(tuple(point)) for point in points.tolist()]
 
+        self._build_adjacency()
         print("[GRID] Setup finished.")
 
+    def _build_adjacency(self):
+        """
+        Finds all pairs of nodes in reach of each other at once and caches the neighbor lists.
+        Called after the placement is finished.
+        :return: None
+        """
+        self.coords = np.array([p.xyz for p in self.real_node_coords], dtype=np.float64).reshape(-1, self.P.dim)
+        pairs = in_reach_pairs(self.coords, self.NODE_REACH)
+        if self.removed:
+            pairs = pairs[~np.isin(pairs, list(self.removed)).any(axis=1)]
+        self._set_adjacency(pairs, *csr_adjacency(pairs, len(self.real_node_coords)))
+
+    def _set_adjacency(self, pairs: np.ndarray, indptr: np.ndarray, indices: np.ndarray):
+        """
+        Stores the adjacency and caches the neighbor lists.
+        Grids which precompute data for every in-reach edge override this.
+        :param pairs: In-reach pairs as returned by get_in_reach_pairs
+        :param indptr: CSR row pointers of the adjacency
+        :param indices: CSR column indices of the adjacency
+        :return: None
+        """
+        self._in_reach_pairs = pairs
+        self._indptr, self._indices = indptr, indices
+        self._neighbors = [neighbors.tolist() for neighbors in np.split(np.asarray(indices), indptr[1:-1])]
+        self._hop_rows = None
+        self._adjacency = None
+        self._hop_buffer = None
+        self._coords_buffer = None
+
+    def set_placement(self, coords: np.ndarray, indptr: np.ndarray | None = None, indices: np.ndarray | None = None,
+                      hop_rows: np.ndarray | None = None):
+        """
+        Places the nodes at the given coordinates instead of random ones, eg. when restoring a snapshot.
+        :param coords: Array of shape (n_nodes, dim)
+        :param indptr: Optional CSR row pointers of a precomputed adjacency
+        :param indices: Optional CSR column indices of a precomputed adjacency
+        :param hop_rows: Optional precomputed matrix of hop counts, row i as returned by get_hop_row(i)
+        :return: None
+        """
+        self.coords = np.array(coords, dtype=np.float64)
+        self.real_node_coords = [self.P(tuple(point)) for point in self.coords.tolist()]
+        if indptr is None:
+            self._build_adjacency()
+        else:
+            self._set_adjacency(self._csr_pairs(indptr, indices), indptr, np.asarray(indices))
+        self._hop_rows = hop_rows
+
+    def get_csr_adjacency(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        :return: indptr, indices of the adjacency in the CSR layout, neighbors of point i being
+        indices[indptr[i]:indptr[i + 1]], sorted ascending
+        """
+        if self._indptr is None:
+            if self._adjacency is None:
+                self._build_adjacency()
+            else:
+                self._indptr, self._indices = self._adjacency.csr()
+        return self._indptr, self._indices
+
+    @staticmethod
+    def _csr_pairs(indptr: np.ndarray, indices: np.ndarray) -> np.ndarray:
+        """
+        :return: Pairs of an adjacency given in the CSR layout, as returned by get_in_reach_pairs
+        """
+        sources = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+        indices = np.asarray(indices)
+        keep = sources < indices
+        return np.stack((sources[keep], indices[keep]), axis=1)
+
+    def get_in_reach_pairs(self) -> np.ndarray:
+        """
+        :return: Array of shape (n_pairs, 2) with IDs of all pairs of nodes in reach of each other,
+        the first ID always smaller than the second
+        """
+        if self._in_reach_pairs is None:
+            self._in_reach_pairs = self._csr_pairs(*self.get_csr_adjacency())
+        return self._in_reach_pairs
+
+    """
+    Topology changes
+    """
+
+    def add_point(self, point: P) -> TopologyChange:
+        """
+        Places a new node, eg. one joining the network. It gets the next free ID.
+        """
+        self._get_dynamic_hop_rows()
+        index = self._get_point_index()
+        node_id = self._get_dynamic_adjacency().add_row()
+        self.real_node_coords.append(point)
+        self.n_nodes = len(self.real_node_coords)
+        self._neighbors.append([])
+        if node_id == len(self._get_dynamic_coords()):
+            self._coords_buffer = np.zeros((2 * (node_id + 1), self.P.dim))
+            self._coords_buffer[:node_id] = self.coords
+        self._coords_buffer[node_id] = point.xyz
+        self.coords = self._coords_buffer[:node_id + 1]
+        if node_id == len(self._hop_buffer):
+            # The matrix grows geometrically, so that a join copies it only once in a while
+            buffer = np.full((2 * (node_id + 1),) * 2, -1, dtype=np.int32)
+            buffer[:node_id, :node_id] = self._hop_rows
+            self._hop_buffer = buffer
+        self._hop_rows = self._hop_buffer[:node_id + 1, :node_id + 1]
+        self._hop_rows[node_id, node_id] = 0
+
+        index.insert(node_id, self.coords[node_id])
+        neighbors = [j for j in index.query(self.coords[node_id], self.coords).tolist() if j != node_id]
+        return self._change_edges(node_id, neighbors, [])
+
+    def remove_point(self, node_id: int) -> TopologyChange:
+        """
+        Disconnects a node leaving the network. Its ID is not reused.
+        """
+        self._get_dynamic_hop_rows()
+        self._get_point_index().remove(node_id, self.coords[node_id])
+        self.removed.add(node_id)
+        return self._change_edges(node_id, [], list(self._neighbors[node_id]))
+
+    def move_point(self, node_id: int, point: P) -> TopologyChange:
+        """
+        Moves a node to a new position, connecting it to the nodes in reach there.
+        """
+        self._get_dynamic_hop_rows()
+        index = self._get_point_index()
+        index.remove(node_id, self.coords[node_id])
+        self.real_node_coords[node_id] = point
+        self._get_dynamic_coords()[node_id] = point.xyz
+        index.insert(node_id, self.coords[node_id])
+
+        in_reach = set(index.query(self.coords[node_id], self.coords).tolist()) - {node_id}
+        old = set(self._neighbors[node_id])
+        return self._change_edges(node_id, sorted(in_reach - old), sorted(old - in_reach))
+
+    def _get_point_index(self) -> PointIndex:
+        if self._point_index is None:
+            self._point_index = PointIndex(self.NODE_REACH)
+            for node_id, point in enumerate(self.coords):
+                if node_id not in self.removed:
+                    self._point_index.insert(node_id, point)
+        return self._point_index
+
+    def _get_dynamic_adjacency(self) -> SlackAdjacency:
+        """
+        :return: The adjacency patched by the changes, created from the CSR layout on the first change
+        """
+        if self._adjacency is None:
+            self._adjacency = SlackAdjacency(*self.get_csr_adjacency())
+        return self._adjacency
+
+    def _get_dynamic_coords(self) -> np.ndarray:
+        """
+        :return: The buffer which coords is a view of, created on the first change.
+        The changes never write to the original array, as it may be shared with a snapshot or another grid.
+        """
+        if self._coords_buffer is None:
+            n = len(self.coords)
+            self._coords_buffer = np.zeros((n + 1, self.P.dim))
+            self._coords_buffer[:n] = self.coords
+            self.coords = self._coords_buffer[:n]
+        return self._coords_buffer
+
+    def _get_dynamic_hop_rows(self) -> np.ndarray:
+        """
+        :return: The matrix of hop counts between all nodes, computed once and then kept up to date by the changes.
+        It is a view of a larger buffer, so that joining nodes do not copy it every time.
+        """
+        if self._hop_buffer is None:
+            n = len(self.real_node_coords)
+            if self._hop_rows is None:
+                indptr, indices = self.get_csr_adjacency()
+                self._hop_rows = np.stack([bfs_hop_counts(indptr, indices, origin) for origin in range(n)])
+            self._hop_buffer = np.full((n + 1, n + 1), -1, dtype=np.int32)
+            self._hop_buffer[:n, :n] = self._hop_rows
+            self._hop_rows = self._hop_buffer[:n, :n]
+        return self._hop_rows
+
+    def _change_edges(self, node_id: int, added: list[int], removed: list[int]) -> TopologyChange:
+        """
+        Updates the neighbor lists, the adjacency and the hop counts after the edges of a node changed.
+        Only the hop rows which may depend on the changed edges are recomputed, and the plain CSR layout
+        is rebuilt only when asked for.
+        """
+        adjacency = self._get_dynamic_adjacency()
+        hops = self._hop_rows
+        log: list[tuple[np.ndarray, np.ndarray, np.ndarray]] = []
+        # The removed edges are applied first, so that every repaired row is exact before the edges are added
+        for j in removed:
+            self._neighbors[node_id].remove(j)
+            self._neighbors[j].remove(node_id)
+            adjacency.remove_edge(node_id, j)
+        if removed:
+            self._hops_after_removal(hops, node_id, removed, log)
+        for j in added:
+            bisect.insort(self._neighbors[node_id], j)
+            bisect.insort(self._neighbors[j], node_id)
+            adjacency.add_edge(node_id, j)
+            self._hops_after_addition(hops, node_id, j, log)
+        self._indptr = self._indices = None
+        self._in_reach_pairs = None
+        self._node_edges_changed(node_id, removed)
+        return TopologyChange(node_id, added, removed, self._changed_rows(hops, log, node_id))
+
+    @staticmethod
+    def _changed_rows(hops: np.ndarray, log: list[tuple[np.ndarray, np.ndarray, np.ndarray]],
+                      node_id: int) -> list[int]:
+        """
+        :param log: Entries of the hop matrix written by _set_hop_rows, with their old values
+        :return: Sorted rows whose hop counts to any node other than the changed one differ from before,
+        found from the written entries only
+        """
+        if not log:
+            return []
+        rows, cols, old = (np.concatenate(parts) for parts in zip(*log))
+        # The first logged value of an entry is the one from before the change
+        _, first = np.unique(rows * hops.shape[1] + cols, return_index=True)
+        rows, cols, old = rows[first], cols[first], old[first]
+        differs = (hops[rows, cols] != old) & (rows != node_id) & (cols != node_id)
+        return np.unique(rows[differs]).tolist()
+
+    def _hops_after_removal(self, hops: np.ndarray, node_id: int, removed: list[int],
+                            log: list[tuple[np.ndarray, np.ndarray, np.ndarray]]):
+        """
+        The hop counts from a node can only grow if a node at the far end of a removed edge loses its last parent,
+        a neighbor one hop closer to the node, so only the rows of such nodes are repaired.
+        The row of the changed node itself is always repaired.
+        """
+        affected = np.zeros(len(hops), dtype=bool)
+        dx = hops[:, node_id]
+        for j in removed:
+            dj = hops[:, j]
+            others = self._neighbors[j]
+            has_parent = (hops[:, others] == (dj - 1)[:, None]).any(axis=1) if others else np.zeros_like(affected)
+            affected |= (dx >= 0) & (dx + 1 == dj) & ~has_parent
+
+        retained = self._neighbors[node_id]
+        if retained:
+            has_parent = (hops[:, retained] == (dx - 1)[:, None]).any(axis=1)
+            lost_parent = np.zeros_like(affected)
+            for j in removed:
+                lost_parent |= (hops[:, j] >= 0) & (hops[:, j] + 1 == dx)
+            affected |= lost_parent & ~has_parent
+        affected[node_id] = True
+
+        rows = np.nonzero(affected)[0]
+        self._set_hop_rows(hops, rows, np.stack([self._repair_hop_row(hops[row], row, node_id, removed)
+                                                 for row in rows.tolist()]), log)
+
+    def _repair_hop_row(self, old: np.ndarray, row: int, node_id: int, removed: list[int]) -> np.ndarray:
+        """
+        Repairs a row of hop counts after edges of a node were removed, visiting only the nodes which lost
+        all their shortest paths from the origin of the row and their neighbors.
+        A row which loses much of itself is traversed again instead.
+        :param old: Hop counts from the origin of the row before the change
+        """
+        neighbors = self._neighbors
+        # Nodes are decided in the order of their old hop counts, so all their parents are decided before them
+        candidates = [(int(old[b]), b) for j in removed for a, b in ((node_id, j), (j, node_id))
+                      if old[a] >= 0 and old[b] == old[a] + 1]
+        heapq.heapify(candidates)
+        lost = set()
+        limit = len(old) // 4
+        while candidates:
+            d, v = heapq.heappop(candidates)
+            if v in lost or any(old[w] == d - 1 and w not in lost for w in neighbors[v]):
+                continue
+            lost.add(v)
+            if len(lost) > limit:
+                return self._adjacency.bfs_hop_counts(row)
+            for w in neighbors[v]:
+                if old[w] == d + 1:
+                    heapq.heappush(candidates, (d + 1, w))
+
+        new = old.copy()
+        if not lost:
+            return new
+        # Lost nodes are reached again from the closest neighbors which kept their hop counts
+        queue = []
+        for v in lost:
+            d = min((int(old[w]) + 1 for w in neighbors[v] if w not in lost and old[w] >= 0), default=None)
+            if d is not None:
+                queue.append((d, v))
+        heapq.heapify(queue)
+        new[list(lost)] = -1
+        while queue:
+            d, v = heapq.heappop(queue)
+            if new[v] >= 0:
+                continue
+            new[v] = d
+            for w in neighbors[v]:
+                if w in lost and new[w] < 0:
+                    heapq.heappush(queue, (d + 1, w))
+        return new
+
+    @staticmethod
+    def _hops_after_addition(hops: np.ndarray, u: int, v: int, log: list[tuple[np.ndarray, np.ndarray, np.ndarray]]):
+        """
+        Shortens the paths of all nodes which reach one end of a new edge in fewer hops than the other.
+        """
+        infinity = np.iinfo(np.int32).max
+
+        def finite(a):
+            return np.where(a < 0, infinity, a).astype(np.int64)
+
+        for a, b in ((u, v), (v, u)):
+            da, db = finite(hops[:, a]), finite(hops[:, b])
+            rows = np.nonzero(da + 1 < db)[0]
+            if len(rows) == 0:
+                continue
+            shortened = np.minimum(finite(hops[rows]), da[rows, None] + 1 + finite(hops[b])[None, :])
+            Grid._set_hop_rows(hops, rows, np.where(shortened >= infinity, -1, shortened), log)
+
+    @staticmethod
+    def _set_hop_rows(hops: np.ndarray, rows: np.ndarray, values: np.ndarray,
+                      log: list[tuple[np.ndarray, np.ndarray, np.ndarray]]):
+        """
+        Writes rows of the symmetric hop matrix together with the matching columns,
+        logging the old value of every entry which changes, in both halves of the matrix.
+        """
+        k, cols = np.nonzero(hops[rows] != values)
+        if len(k) > 0:
+            written = rows[k]
+            old = hops[written, cols]
+            log.append((np.concatenate((written, cols)), np.concatenate((cols, written)), np.concatenate((old, old))))
+        hops[rows] = values
+        hops[:, rows] = values.T
+
+    def _node_edges_changed(self, node_id: int, removed: list[int]):
+        """
+        Called after the edges of a node changed. Grids which precompute data for every in-reach edge override this.
+        :param removed: Former neighbors of the node
+        """
+        pass
+
     def get_true_position(self, node_id: int):
         """
         Returns the real position of a node with given ID / Address
@@ -191,7 +569,7 @@ class Grid(Generic[P]):
         """
         p1, p2 = self.real_node_coords[origin_id], self.real_node_coords[target_id]
         distance = p1.distance_to(p2)
-        if not override_range and distance > Grid.NODE_REACH:
+        if not override_range and distance > self.NODE_REACH:
             return None
         return distance
 
@@ -204,18 +582,49 @@ class Grid(Generic[P]):
         :return: A value close to the true distance between the nodes.
         """
         if self.sd > 0:
-            return random.normalvariate(self.get_true_distance(origin_id, target_id), self.sd)
+            return self.measurement_rng(origin_id).normal(self.get_true_distance(origin_id, target_id), self.sd)
         return self.get_true_distance(origin_id, target_id)
 
+    def measurement_rng(self, origin_id: int) -> np.random.Generator:
+        """
+        Measurements made by every node draw from a separate stream,
+        so that they do not depend on the order in which the nodes measure.
+        :param origin_id: ID of the measuring node
+        :return: Generator of the measurement noise of the node
+        """
+        rng = self._measurement_rngs.get(origin_id)
+        if rng is None:
+            rng = self._measurement_rngs[origin_id] = self.streams.generator("measurement", origin_id)
+        return rng
+
     def get_neighbors_of(self, origin_id: int) -> list[int]:
         """
         Returns a list of IDs of nodes in range of the origin node
         :param origin_id: ID of origin node
         :return: A list of IDs of neighboring nodes
         """
-        return [id for id in range(len(self.real_node_coords))
-                if id != origin_id
-                and self.get_true_distance(origin_id, id) is not None]
+        if self._neighbors is None or len(self._neighbors) != len(self.real_node_coords):
+            self._build_adjacency()
+        return self._neighbors[origin_id]
+
+    def get_hop_row(self, origin: int) -> np.ndarray:
+        """
+        Traverses the network using the BFS algorithm in order to find minimal hop counts
+        to get from origin to all nodes in the network.
+        :param origin: ID of origin node
+        :return: Array with the number of hops to every node, indexed by node ID. -1 for unreachable nodes.
+        """
+        if self._hop_rows is not None:
+            return np.array(self._hop_rows[origin], dtype=np.int32)
+        return bfs_hop_counts(*self.get_csr_adjacency(), origin)
+
+    def get_hop_count(self, origin: int, target: int) -> int:
+        """
+        :return: Minimal number of hops from origin to target, -1 if unreachable
+        """
+        if self._hop_rows is not None:
+            return int(self._hop_rows[origin, target])
+        return int(self.get_hop_row(origin)[target])
 
     def get_hop_counts_from(self, origin):
         """
@@ -225,82 +634,67 @@ class Grid(Generic[P]):
         :return: A list of lists with structure
             number_of_hops: [node_1, node_2, ...]
             where n_hops is between 0 (origin) and a maximum number of hops to reach any node.
+            The list always ends with an empty level.
         """
-        origins = [origin]
-        targets = set()
-        visited = set()
-        hops = [[origin]]
-        while len(visited) < self.n_nodes:
-            visited.update(origins)
-            for node in origins:
-                targets.update(self.get_neighbors_of(node))
-            targets.difference_update(visited)
-            hops.append(list(targets))
-            origins = targets.copy()
-        return hops
+        return self.hop_levels(self.get_hop_row(origin))
+
+    @staticmethod
+    def hop_levels(row: np.ndarray) -> list[list[int]]:
+        """
+        Converts a row of hop counts returned by get_hop_row into the structure returned by get_hop_counts_from.
+        """
+        order = np.argsort(row, kind="stable")
+        order = order[row[order] >= 0]
+        levels = np.split(order, np.searchsorted(row[order], np.arange(1, row.max() + 2)))
+        return [level.tolist() for level in levels]
 
 
-    def _plot(self, network: Network):
+    def edge_segments(self) -> np.ndarray:
+        """
+        :return: Array of shape (n_pairs, 2, 2) with the end points of every connection, each drawn once
+        """
+        return self.coords[self.get_in_reach_pairs()][:, :, :2]
+
+    def _plot(self, network: Network, headless: bool = False):
         """
         Plots the network and connections.
         :param network: Network describing the nodes
-        :return: None
+        :param headless: Whether to create the figure without pyplot, for exporting only
+        :return: The figure and its two axes
         """
-        fig, (ax, ax2) = plt.subplots(1, 2)
-        fig.set_size_inches(20, 10)
+        fig, (ax, ax2) = new_figure(2, headless, size=(20, 10))
         ax.set_xlim(0, self.grid_size)
         ax.set_ylim(0, self.grid_size)
         ax2.set_xlim(0, self.grid_size)
         ax2.set_ylim(0, self.grid_size)
-
-        xs = [point[0] for point in self.real_node_coords]
-        ys = [point[1] for point in self.real_node_coords]
-
-        lines = []
-        for p1, p2 in itertools.product(range(self.n_nodes), repeat=2):
-            if p1 == p2:
-                continue
-            if self.get_true_distance(p1, p2) is None:
-                continue
-            lines.append([self.real_node_coords[p1].xyz, self.real_node_coords[p2].xyz])
-
-        lc = LineCollection(lines, zorder=1)
-        ax.add_collection(lc)
-
-        ax.scatter(x=xs, y=ys, c=["y" if n.is_anchor else "g" if n.anchor_reached else "r" for n in network.nodes()],
-                   zorder=2)
-        for id in range(len(self.real_node_coords)):
-            ax.annotate(str(id), (xs[id]+.06, ys[id]+.06), zorder=3)
-
-        calc_xs = [node.position[0] for node in network.nodes()]
-        calc_ys = [node.position[1] for node in network.nodes()]
-        lines2 = [[node.position.xyz, self.real_node_coords[node._id].xyz] for node in network.nodes()]
-
-        lc2 = LineCollection(lines2, zorder=1)
-
-        ax2.add_collection(lc2)
-        ax2.scatter(calc_xs, calc_ys, c="r", zorder=2)
-
-        for id in range(len(self.real_node_coords)):
-            ax2.annotate(str(id), (calc_xs[id]+.06, calc_ys[id]+.06), zorder=3)
-
+        NetworkRenderer(self, ax, ax2).draw(list(network.nodes()))
         return fig, (ax, ax2)
 
     def plot(self, network: Network):
+        from matplotlib import pyplot as plt
+
         self._plot(network)
         plt.show()
 
+    def save_plot(self, network: Network, path, dpi: int = 100):
+        """
+        Renders the plot without a GUI and saves it, the format given by the extension, eg. .png or .svg.
+        """
+        fig, _ = self._plot(network, headless=True)
+        save_figure(fig, path, dpi)
+
 
 
 
 if __name__ == '__main__':
 
-    r = Point2D.random(upper_bound=5)
+    rng = np.random.default_rng(config["simulation"]["seed"])
+    r = Point2D.random(rng, upper_bound=5)
     print(r)
 
-    r2 = Point3D.random(5, 6)
+    r2 = Point3D.random(rng, 5, 6)
     print(r2)
 
-    r3 = Point3D.random(upper_bound=2)
+    r3 = Point3D.random(rng, upper_bound=2)
     print(r3)
     print(r2.distance_to(r3))
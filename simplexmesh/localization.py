@@ -0,0 +1,519 @@
+"""
+Global localization of the whole network from all known edges at once.
+
+The edges known by the nodes, measured and solved, form a sparse weighted distance graph. Its layout is initialized
+by landmark MDS on graph distances from a few landmarks, refined by SMACOF stress majorization on all edges
+and finally rotated and translated onto the anchors by a Procrustes fit. Every step works on flat edge arrays,
+so the cost grows with the number of edges instead of the square of the number of nodes.
+
+For very large networks, the adjacency can instead be partitioned into overlapping patches, solved independently
+in a process pool and stitched together by rigid transforms over the nodes shared by the patches.
+
+Usage:
+    positions, report = localize(sim.nodes, dim=2, pairs=sim.grid.get_in_reach_pairs())
+"""
+from __future__ import annotations
+
+import heapq
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Sequence, TYPE_CHECKING
+
+import numpy as np
+
+from simplexmesh.config import config
+from simplexmesh.metrics import metrics
+from simplexmesh.spatial import bfs_ball, csr_adjacency, csr_slots
+
+if TYPE_CHECKING:
+    from simplexmesh.node import Node
+
+
+def edges_from_nodes(nodes: Sequence[Node]) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Collects the known edges of all nodes. Both directions of an edge are merged into one with the mean value.
+    Measured edges are weighted by localization.exact_weight, solved ones by localization.solved_weight.
+    :return: Arrays (i, j, distance, weight) of the edges, i < j
+    """
+    exact_weight = config["localization"]["exact_weight"]
+    solved_weight = config["localization"]["solved_weight"]
+    origins, targets, values, weights = [], [], [], []
+    for node in nodes:
+        for target, solution_set in node._known.items():
+            value = solution_set.get()
+            if value is None or target == node._id:
+                continue
+            origins.append(node._id)
+            targets.append(target)
+            values.append(value)
+            weights.append(exact_weight if solution_set.is_exact else solved_weight)
+    if not origins:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0)
+
+    origins, targets = np.array(origins, dtype=np.int64), np.array(targets, dtype=np.int64)
+    lo, hi = np.minimum(origins, targets), np.maximum(origins, targets)
+    keys, inverse, counts = np.unique(lo * (hi.max() + 1) + hi, return_inverse=True, return_counts=True)
+    first = np.zeros(len(keys), dtype=np.int64)
+    first[inverse[::-1]] = np.arange(len(inverse))[::-1]
+    distance = np.bincount(inverse, np.array(values, dtype=np.float64)) / counts
+    weight = np.bincount(inverse, np.array(weights, dtype=np.float64)) / counts
+    return lo[first], hi[first], distance, weight
+
+
+class _EdgeGraph:
+    """Both directions of the edges, sorted by their target for segment reductions."""
+
+    def __init__(self, n: int, i: np.ndarray, j: np.ndarray, d: np.ndarray):
+        self.n = n
+        src, dst = np.concatenate((i, j)), np.concatenate((j, i))
+        order = np.argsort(dst, kind="stable")
+        self.src, dst = src[order], dst[order]
+        # Noisy short edges may be measured negative, which would make the relaxation never settle
+        self.d = np.maximum(np.concatenate((d, d))[order], 0)
+        self.starts = np.flatnonzero(np.r_[True, dst[1:] != dst[:-1]]) if len(dst) else np.zeros(0, dtype=np.int64)
+        self.owners = dst[self.starts]
+
+    def _relax(self, current: np.ndarray, values: np.ndarray) -> np.ndarray:
+        """
+        :param values: Value of every edge offered to its target
+        :return: Minimum of the current value of every node and the values offered to it
+        """
+        new = current.copy()
+        if len(values):
+            new[self.owners] = np.minimum(current[self.owners], np.minimum.reduceat(values, self.starts))
+        return new
+
+    def components(self) -> np.ndarray:
+        """
+        :return: Label of the connected component of every node, the smallest node ID in it
+        """
+        labels = np.arange(self.n)
+        while True:
+            new = self._relax(labels, labels[self.src])
+            new = new[new]
+            if np.array_equal(new, labels):
+                return labels
+            labels = new
+
+    def shortest_paths(self, source: int) -> np.ndarray:
+        """
+        Bellman-Ford relaxation of all edges at once, until no distance changes.
+        :return: Graph distance from the source to every node, inf if unreachable
+        """
+        dist = np.full(self.n, np.inf)
+        dist[source] = 0
+        while True:
+            new = self._relax(dist, dist[self.src] + self.d)
+            if np.array_equal(new, dist):
+                return dist
+            dist = new
+
+
+def landmark_mds(graph: _EdgeGraph, nodes: np.ndarray, dim: int, n_landmarks: int,
+                 rng: np.random.Generator) -> np.ndarray:
+    """
+    Landmark MDS: classical MDS of the graph distances between landmarks picked by farthest point sampling,
+    and every other node placed by its graph distances to the landmarks.
+    :param nodes: IDs of the nodes of a connected component
+    :return: Coordinates of the nodes, shape (len(nodes), dim)
+    """
+    n_landmarks = max(dim + 1, min(n_landmarks, len(nodes)))
+    landmarks = [int(nodes[rng.integers(len(nodes))])]
+    rows = []
+    nearest = np.full(len(nodes), np.inf)
+    while len(rows) < n_landmarks:
+        row = graph.shortest_paths(landmarks[-1])[nodes]
+        rows.append(row)
+        nearest = np.minimum(nearest, row)
+        if len(rows) < n_landmarks:
+            landmarks.append(int(nodes[nearest.argmax()]))
+    delta2 = np.stack(rows) ** 2
+    landmark_index = np.searchsorted(nodes, landmarks)
+
+    d2 = delta2[:, landmark_index]
+    centering = np.eye(len(landmarks)) - 1 / len(landmarks)
+    b = -0.5 * centering @ d2 @ centering
+    eigenvalues, eigenvectors = np.linalg.eigh(b)
+    top = np.argsort(eigenvalues)[::-1][:dim]
+    eigenvalues = np.maximum(eigenvalues[top], 1e-12)
+    pseudo_inverse = eigenvectors[:, top] / np.sqrt(eigenvalues)
+    return -0.5 * (delta2 - d2.mean(axis=1)[:, None]).T @ pseudo_inverse
+
+
+"""Largest graph solved by smacof with a dense Laplacian"""
+DENSE_NODES = 400
+
+
+def _laplacian_product(i: np.ndarray, j: np.ndarray, w: np.ndarray, x: np.ndarray) -> np.ndarray:
+    """
+    :return: L x, where L is the Laplacian of the graph with edge weights w
+    """
+    n, dim = x.shape
+    diff = w[:, None] * (x[i] - x[j])
+    return np.stack([np.bincount(i, diff[:, k], n) - np.bincount(j, diff[:, k], n) for k in range(dim)], axis=1)
+
+
+def stress(x: np.ndarray, i: np.ndarray, j: np.ndarray, d: np.ndarray, w: np.ndarray) -> float:
+    """
+    :return: Normalized stress sqrt(sum w (|x_i - x_j| - d)^2 / sum w d^2)
+    """
+    dist = np.linalg.norm(x[i] - x[j], axis=1)
+    return float(np.sqrt((w * (dist - d) ** 2).sum() / (w * d * d).sum()))
+
+
+def _solve_laplacian(i: np.ndarray, j: np.ndarray, w: np.ndarray, rhs: np.ndarray, x: np.ndarray,
+                     iterations: int) -> np.ndarray:
+    """
+    Conjugate gradient iterations for L x = rhs, where L is the Laplacian of the graph with edge weights w.
+    :param x: Initial solution
+    :return: The improved solution
+    """
+    residual = rhs - _laplacian_product(i, j, w, x)
+    direction = residual.copy()
+    rr = rr_start = (residual * residual).sum(axis=0)
+    for _ in range(iterations):
+        if (rr <= 1e-20 * rr_start).all():
+            break
+        product = _laplacian_product(i, j, w, direction)
+        curvature = (direction * product).sum(axis=0)
+        step = np.divide(rr, curvature, out=np.zeros_like(rr), where=curvature > 0)
+        x = x + step * direction
+        residual = residual - step * product
+        rr_new = (residual * residual).sum(axis=0)
+        direction = residual + np.divide(rr_new, rr, out=np.zeros_like(rr), where=rr > 0) * direction
+        rr = rr_new
+    return x
+
+
+def smacof(x: np.ndarray, i: np.ndarray, j: np.ndarray, d: np.ndarray, w: np.ndarray, iterations: int,
+           cg_iterations: int, tolerance: float) -> tuple[np.ndarray, float]:
+    """
+    Weighted stress majorization on a sparse graph. Every step is a Guttman transform, solving L_w x' = L_b(x) x
+    by a few conjugate gradient iterations warm-started from the current layout, or exactly for small graphs.
+    :param x: Initial coordinates, shape (n, dim)
+    :param i: First nodes of the edges, indices into x
+    :param j: Second nodes of the edges
+    :param d: Target distances of the edges
+    :param w: Weights of the edges
+    :param iterations: Maximal number of majorization steps
+    :param cg_iterations: Conjugate gradient iterations per step
+    :param tolerance: Stop when the stress decreases by less than this fraction in a step
+    :return: The refined coordinates and their normalized stress
+    """
+    n = len(x)
+    x = x - x.mean(axis=0)
+    previous = stress(x, i, j, d, w)
+    # Small graphs, eg. patches, solve the transform exactly by the pseudo-inverse of the dense Laplacian
+    pseudo_inverse = None
+    if n <= DENSE_NODES:
+        laplacian = -np.bincount(i * n + j, w, n * n).reshape(n, n)
+        laplacian += laplacian.T
+        laplacian[np.diag_indices(n)] = -laplacian.sum(axis=1)
+        pseudo_inverse = np.linalg.pinv(laplacian, hermitian=True)
+    for _ in range(iterations):
+        dist = np.linalg.norm(x[i] - x[j], axis=1)
+        b = np.divide(w * d, dist, out=np.zeros_like(dist), where=dist > 0)
+        rhs = _laplacian_product(i, j, b, x)
+
+        if pseudo_inverse is not None:
+            x = pseudo_inverse @ rhs
+        else:
+            x = _solve_laplacian(i, j, w, rhs, x, cg_iterations)
+            x = x - x.mean(axis=0)
+
+        current = stress(x, i, j, d, w)
+        if previous - current < tolerance * previous:
+            previous = current
+            break
+        previous = current
+    return x, previous
+
+
+def procrustes(x: np.ndarray, y: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Orthogonal Procrustes fit without scaling. Reflections are allowed, as a layout from distances alone
+    is only determined up to one.
+    :param x: Coordinates of the anchors in the layout, shape (n_anchors, dim)
+    :param y: True coordinates of the anchors
+    :return: Rotation r and translation t, such that x @ r + t fits y
+    """
+    mx, my = x.mean(axis=0), y.mean(axis=0)
+    u, _, vt = np.linalg.svd((x - mx).T @ (y - my))
+    r = u @ vt
+    return r, my - mx @ r
+
+
+def localize(nodes: Sequence[Node], dim: int, rng: np.random.Generator | None = None,
+             pairs: np.ndarray | None = None) -> tuple[np.ndarray, dict]:
+    """
+    Localizes all nodes connected by known edges to the anchors, with the method selected by localization.method:
+    "smacof" solves the whole network at once, see localize_edges, "patches" solves overlapping patches
+    and stitches them, see localize_patches.
+    :param nodes: All nodes of the network, the anchors among them
+    :param dim: Dimension of the space
+    :param rng: Generator of the landmarks and patches
+    :param pairs: Pairs of nodes in reach of each other partitioned into patches, eg. Grid.get_in_reach_pairs().
+    The pairs of the known edges if not provided.
+    :return: Positions of shape (max node ID + 1, dim), NaN for nodes which were not localized,
+    and a report of the run
+    """
+    n = max(node._id for node in nodes) + 1
+    anchors = {node._id: node.position.xyz for node in nodes if node.is_anchor}
+    i, j, d, w = edges_from_nodes(nodes)
+    method = config["localization"]["method"]
+    if method == "smacof":
+        return localize_edges(n, i, j, d, w, anchors, dim, rng)
+    if method == "patches":
+        pairs = np.stack((i, j), axis=1) if pairs is None else pairs
+        return localize_patches(max(n, int(pairs.max(initial=-1)) + 1), i, j, d, w, anchors, dim, pairs, rng)
+    raise ValueError(f"Unknown global localization method {method}, expected smacof or patches")
+
+
+def localize_edges(n: int, i: np.ndarray, j: np.ndarray, d: np.ndarray, w: np.ndarray,
+                   anchors: dict[int, tuple[float, ...]], dim: int,
+                   rng: np.random.Generator | None = None) -> tuple[np.ndarray, dict]:
+    """
+    Localizes the nodes of a distance graph to the anchors.
+    Only the connected component with the most anchors is localized, as the others cannot be aligned.
+    :param n: Number of nodes, the edges refer to node IDs in range(n)
+    :param i: First nodes of the edges
+    :param j: Second nodes of the edges
+    :param d: Distances of the edges
+    :param w: Weights of the edges
+    :param anchors: True position of every anchor by its ID
+    :param dim: Dimension of the space
+    :param rng: Generator picking the first landmark
+    :return: Positions of shape (n, dim), NaN for nodes which were not localized, and a report of the run
+    """
+    c = config["localization"]
+    rng = rng if rng is not None else np.random.default_rng(0)
+    positions = np.full((n, dim), np.nan)
+    if not anchors:
+        raise ValueError("Global localization needs anchors")
+
+    graph = _EdgeGraph(n, i, j, d)
+    labels = graph.components()
+    label = np.bincount(labels[list(anchors)]).argmax()
+    component = np.flatnonzero(labels == label)
+    anchor_ids = [a for a in anchors if labels[a] == label]
+    if len(anchor_ids) < dim + 1:
+        raise ValueError(f"Global localization needs {dim + 1} anchors connected by known edges, "
+                         f"found {len(anchor_ids)}")
+
+    inside = labels[i] == label
+    local = np.full(n, -1)
+    local[component] = np.arange(len(component))
+    ci, cj, cd, cw = local[i[inside]], local[j[inside]], d[inside], w[inside]
+
+    x = landmark_mds(graph, component, dim, c["landmarks"], rng)
+    initial_stress = stress(x, ci, cj, cd, cw)
+    x, final_stress = smacof(x, ci, cj, cd, cw, c["iterations"], c["cg_iterations"], c["tolerance"])
+
+    r, t = procrustes(x[local[anchor_ids]], np.array([anchors[a] for a in anchor_ids], dtype=np.float64))
+    positions[component] = x @ r + t
+    report = {
+        "nodes": len(component),
+        "edges": int(inside.sum()),
+        "anchors": len(anchor_ids),
+        "initial stress": round(initial_stress, 6),
+        "stress": round(final_stress, 6),
+    }
+    return positions, report
+
+
+def partition_patches(indptr: np.ndarray, indices: np.ndarray, core_hops: int, overlap_hops: int,
+                      rng: np.random.Generator) -> list[np.ndarray]:
+    """
+    Covers an adjacency by overlapping patches. The centers are visited in random order, skipping the nodes already
+    covered. A patch holds all nodes within core_hops + overlap_hops of its center and covers those within core_hops,
+    so neighboring patches share a band of nodes about overlap_hops wide. Every node is reached by a constant number
+    of patches, so the work grows linearly with the number of nodes.
+    :param indptr: CSR row pointers of the adjacency
+    :param indices: CSR neighbor lists of the adjacency
+    :return: Node IDs of every patch, ordered by their hops from its center
+    """
+    n = len(indptr) - 1
+    covered = np.zeros(n, dtype=bool)
+    mark = np.zeros(n, dtype=bool)
+    patches = []
+    for center in rng.permutation(n).tolist():
+        if covered[center] or indptr[center] == indptr[center + 1]:
+            continue
+        points, hops = bfs_ball(indptr, indices, center, core_hops + overlap_hops, mark)
+        covered[points[hops <= core_hops]] = True
+        patches.append(points)
+    return patches
+
+
+def _solve_patch(task: tuple) -> np.ndarray:
+    """
+    Solves the local coordinates of a patch by landmark MDS and SMACOF. Runs in the pool workers, so everything
+    it needs comes with the task and the configuration is never read.
+    :param task: (n, i, j, d, w, dim, landmarks, iterations, cg_iterations, tolerance, seed) of the patch,
+    the edges given by local node indices
+    :return: Coordinates of shape (n, dim), NaN for nodes not connected to the largest part of the patch
+    """
+    n, i, j, d, w, dim, landmarks, iterations, cg_iterations, tolerance, seed = task
+    x = np.full((n, dim), np.nan)
+    graph = _EdgeGraph(n, i, j, d)
+    labels = graph.components()
+    label = np.bincount(labels[np.r_[i, j]] if len(i) else labels).argmax()
+    component = np.flatnonzero(labels == label)
+    if len(component) <= dim:
+        return x
+    inside = labels[i] == label
+    local = np.full(n, -1)
+    local[component] = np.arange(len(component))
+    ci, cj = local[i[inside]], local[j[inside]]
+    layout = landmark_mds(graph, component, dim, landmarks, np.random.default_rng(seed))
+    x[component] = smacof(layout, ci, cj, d[inside], w[inside], iterations, cg_iterations, tolerance)[0]
+    return x
+
+
+def stitch_patches(n: int, patches: list[np.ndarray], layouts: list[np.ndarray], dim: int,
+                   anchors: dict[int, tuple[float, ...]] | None = None) -> np.ndarray:
+    """
+    Places the patches into a common frame one by one. Every next patch is the one sharing the most nodes with those
+    already placed, fitted onto their positions by a rigid transform. Positions of nodes placed by several patches
+    are averaged.
+    If some patch holds more than dim anchors, the anchors are placed first at their true positions, so that patches
+    with anchors are fitted to them directly and errors do not accumulate along chains of patches.
+    Otherwise the largest patch is placed as it is.
+    :param n: Number of nodes
+    :param patches: Node IDs of every patch
+    :param layouts: Local coordinates of every patch, NaN for nodes it could not place
+    :param anchors: True position of every anchor by its ID
+    :return: Positions of shape (n, dim), NaN for nodes which were not placed
+    """
+    total = np.zeros((n, dim))
+    count = np.zeros(n)
+    reference = np.full((n, dim), np.nan)
+    members = np.concatenate(patches)
+    owners = np.repeat(np.arange(len(patches)), [len(patch) for patch in patches])
+    member_ptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(members, minlength=n), out=member_ptr[1:])
+    patches_of = owners[np.argsort(members, kind="stable")]
+
+    def shared_nodes(k: int) -> np.ndarray:
+        return ~np.isnan(layouts[k][:, 0]) & ~np.isnan(reference[patches[k], 0])
+
+    anchor_ids = np.array(list(anchors or {}), dtype=np.int64)
+    if len(anchor_ids):
+        reference[anchor_ids] = np.array([anchors[a] for a in anchor_ids.tolist()], dtype=np.float64)
+    heap = [(-int(shared.sum()), k) for k in range(len(patches)) if (shared := shared_nodes(k)).sum() > dim]
+    if not heap:
+        reference[:] = np.nan
+        largest = int(np.argmax([len(patch) for patch in patches]))
+        heap = [(-len(patches[largest]), largest)]
+    heapq.heapify(heap)
+
+    placed = np.zeros(len(patches), dtype=bool)
+    while heap:
+        _, k = heapq.heappop(heap)
+        if placed[k]:
+            continue
+        patch, layout = patches[k], layouts[k]
+        valid = ~np.isnan(layout[:, 0])
+        shared = shared_nodes(k)
+        if placed.any() or shared.any():
+            if shared.sum() <= dim:
+                continue
+            r, t = procrustes(layout[shared], reference[patch[shared]])
+            layout = layout @ r + t
+        placed[k] = True
+        total[patch[valid]] += layout[valid]
+        count[patch[valid]] += 1
+        reference[patch[valid]] = total[patch[valid]] / count[patch[valid], None]
+        if len(anchor_ids):
+            reference[anchor_ids] = np.array([anchors[a] for a in anchor_ids.tolist()], dtype=np.float64)
+
+        # Neighbors are queued by the nodes they share with the placed ones, a stale entry is fixed when popped
+        for other in np.unique(patches_of[csr_slots(member_ptr, patch)]).tolist():
+            if not placed[other]:
+                heapq.heappush(heap, (-int(shared_nodes(other).sum()), other))
+
+    positions = np.full((n, dim), np.nan)
+    done = count > 0
+    positions[done] = total[done] / count[done, None]
+    return positions
+
+
+def localize_patches(n: int, i: np.ndarray, j: np.ndarray, d: np.ndarray, w: np.ndarray,
+                     anchors: dict[int, tuple[float, ...]], dim: int, pairs: np.ndarray,
+                     rng: np.random.Generator | None = None) -> tuple[np.ndarray, dict]:
+    """
+    Cluster-and-stitch localization: the adjacency is partitioned into overlapping patches, the local coordinates
+    of every patch are solved from the edges inside it in a process pool, and the patches are stitched by rigid
+    transforms over the shared nodes. The stitched layout is refined by a few SMACOF steps on all edges
+    and aligned to the anchors.
+    :param n: Number of nodes, the edges and pairs refer to node IDs in range(n)
+    :param i: First nodes of the edges
+    :param j: Second nodes of the edges
+    :param d: Distances of the edges
+    :param w: Weights of the edges
+    :param anchors: True position of every anchor by its ID
+    :param dim: Dimension of the space
+    :param pairs: Array of shape (n_pairs, 2) of nodes in reach of each other, partitioned into the patches
+    :param rng: Generator of the patch centers and landmarks
+    :return: Positions of shape (n, dim), NaN for nodes which were not localized, and a report of the run
+    """
+    c = config["localization"]
+    rng = rng if rng is not None else np.random.default_rng(0)
+    if not anchors:
+        raise ValueError("Global localization needs anchors")
+
+    indptr, indices = csr_adjacency(pairs, n)
+    patches = partition_patches(indptr, indices, c["patch_hops"], c["patch_overlap_hops"], rng)
+
+    edge_ptr, edge_slots = csr_adjacency(np.stack((i, j), axis=1), n)
+    src = np.repeat(np.arange(n), np.diff(edge_ptr))
+    edge_of = np.lexsort((np.r_[j, i], np.r_[i, j]))
+    edge_of = np.where(edge_of < len(i), edge_of, edge_of - len(i))
+    local = np.full(n, -1)
+    seeds = rng.integers(2 ** 63, size=len(patches))
+    tasks = []
+    for patch, seed in zip(patches, seeds.tolist()):
+        local[patch] = np.arange(len(patch))
+        slots = csr_slots(edge_ptr, patch)
+        slots = slots[(local[edge_slots[slots]] >= 0) & (src[slots] < edge_slots[slots])]
+        edges = edge_of[slots]
+        tasks.append((len(patch), local[i[edges]], local[j[edges]], d[edges], w[edges], dim,
+                      c["landmarks"], c["iterations"], c["cg_iterations"], c["patch_tolerance"], seed))
+        local[patch] = -1
+
+    workers = c["workers"] or os.cpu_count() or 1
+    with metrics.phase("patch_solving"):
+        if workers > 1 and len(tasks) > 1:
+            with ProcessPoolExecutor(min(workers, len(tasks))) as pool:
+                layouts = list(pool.map(_solve_patch, tasks, chunksize=max(1, len(tasks) // (4 * workers))))
+        else:
+            layouts = [_solve_patch(task) for task in tasks]
+
+    positions = np.full((n, dim), np.nan)
+    x = stitch_patches(n, patches, layouts, dim, anchors)
+    placed = np.flatnonzero(~np.isnan(x[:, 0]))
+    anchor_ids = [a for a in anchors if not np.isnan(x[a, 0])]
+    if len(anchor_ids) < dim + 1:
+        raise ValueError(f"Global localization needs {dim + 1} anchors in the stitched patches, "
+                         f"found {len(anchor_ids)}")
+
+    local[placed] = np.arange(len(placed))
+    inside = (local[i] >= 0) & (local[j] >= 0)
+    ci, cj, cd, cw = local[i[inside]], local[j[inside]], d[inside], w[inside]
+    stitched_stress = stress(x[placed], ci, cj, cd, cw)
+    refined, final_stress = smacof(x[placed], ci, cj, cd, cw, c["refine_iterations"], c["cg_iterations"],
+                                   c["tolerance"])
+
+    r, t = procrustes(refined[local[anchor_ids]], np.array([anchors[a] for a in anchor_ids], dtype=np.float64))
+    positions[placed] = refined @ r + t
+    report = {
+        "patches": len(patches),
+        "mean patch size": round(float(np.mean([len(patch) for patch in patches])), 1),
+        "workers": workers,
+        "nodes": len(placed),
+        "edges": int(inside.sum()),
+        "anchors": len(anchor_ids),
+        "stitched stress": round(stitched_stress, 6),
+        "stress": round(final_stress, 6),
+    }
+    return positions, report
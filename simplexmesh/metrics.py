@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+import contextlib
+import json
+import time
+from collections import defaultdict
+
+from simplexmesh.config import config
+
+
+class Metrics:
+    """
+    Collects counters and phase timings of a simulation run.
+
+    Call sites guard every update with `if metrics.enabled:`, so a disabled instance costs
+    a single attribute lookup on the hot path and nothing else.
+    """
+
+    def __init__(self, enabled: bool = False, time_series: bool = False):
+        """
+        :param enabled: Whether anything is recorded at all
+        :param time_series: Whether to additionally store counter deltas and elapsed time for every iteration
+        """
+        self.enabled = enabled
+        self.time_series = time_series
+        self.counters: dict[str, int] = defaultdict(int)
+        self.phase_times: dict[str, float] = defaultdict(float)
+        self.iterations: list[dict] = []
+        self._last_counters: dict[str, int] = {}
+        self._last_iteration_time = time.perf_counter()
+
+    def reset(self) -> None:
+        self.counters.clear()
+        self.phase_times.clear()
+        self.iterations.clear()
+        self._last_counters = {}
+        self._last_iteration_time = time.perf_counter()
+
+    def count(self, name: str, n: int = 1) -> None:
+        """
+        Increments a counter.
+        :param name: Name of the counter
+        :param n: Value to add
+        """
+        self.counters[name] += n
+
+    def phase(self, name: str):
+        """
+        Context manager measuring wall time spent in a phase of the run.
+        Time of repeated phases with the same name is summed.
+        :param name: Name of the phase
+        """
+        if not self.enabled:
+            return contextlib.nullcontext()
+        return self._timed_phase(name)
+
+    @contextlib.contextmanager
+    def _timed_phase(self, name: str):
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phase_times[name] += time.perf_counter() - t
+
+    def begin_iterations(self) -> None:
+        """
+        Marks the start of the propagation, so that the first time series entry does not include the setup.
+        """
+        self._last_counters = dict(self.counters)
+        self._last_iteration_time = time.perf_counter()
+
+    def end_iteration(self, iteration: int) -> None:
+        """
+        Closes a single iteration of the propagation, storing a time series entry if enabled.
+        :param iteration: Number of the iteration that ended
+        """
+        self.counters["iterations"] += 1
+        if not self.time_series:
+            return
+
+        now = time.perf_counter()
+        entry = {"iteration": iteration, "time": now - self._last_iteration_time}
+        for name, value in self.counters.items():
+            delta = value - self._last_counters.get(name, 0)
+            if delta and name != "iterations":
+                entry[name] = delta
+        self.iterations.append(entry)
+        self._last_counters = dict(self.counters)
+        self._last_iteration_time = now
+
+    def summary(self) -> dict:
+        """
+        :return: A JSON-serializable dict with the counters, phase timings and optionally the time series
+        """
+        result = {
+            "counters": dict(self.counters),
+            "phases": {name: round(t, 6) for name, t in self.phase_times.items()},
+        }
+        if self.time_series:
+            result["iterations"] = self.iterations
+        return result
+
+    def dump(self, path) -> None:
+        with open(path, "w") as f:
+            json.dump(self.summary(), f, indent=2)
+
+    def print_summary(self) -> None:
+        print("[METRICS] Phases:")
+        for name, t in self.phase_times.items():
+            print(f"    {name:24} {t:10.3f} s")
+        print("[METRICS] Counters:")
+        for name, value in sorted(self.counters.items()):
+            print(f"    {name:24} {value:10}")
+
+
+metrics = Metrics(config["metrics"]["enabled"], config["metrics"]["time_series"])
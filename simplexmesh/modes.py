@@ -0,0 +1,185 @@
+"""
+Mode finders picking the repeated value out of the solutions of a SolutionSet.
+
+Every gate contributes two candidate lengths of an edge, the correct one and a mirrored one. The correct ones of
+different gates agree up to the measurement noise, while the mirrored ones are scattered, so the value of the edge
+is the mode of the solutions. A finder decides whether the mode is already distinct enough to be picked.
+
+Every finder handles a single sorted list of solutions, and a batch of many sets padded into arrays at once.
+"""
+from __future__ import annotations
+
+import abc
+import math
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from simplexmesh.config import config
+
+if TYPE_CHECKING:
+    from simplexmesh.solution import Solution
+
+
+class ModeFinder(abc.ABC):
+    """Smallest number of solutions for which a value may be picked"""
+    min_solutions: int
+
+    @abc.abstractmethod
+    def pick(self, solutions: list[Solution], must_choose: bool = False) -> int | None:
+        """
+        :param solutions: Solutions sorted by value
+        :param must_choose: Pick the most likely value even if it is not distinct enough, eg. when the set is full
+        :return: Index of the picked solution, None if no value can be picked yet
+        """
+
+    @abc.abstractmethod
+    def pick_many(self, values: np.ndarray, badness: np.ndarray, lengths: np.ndarray,
+                  must_choose: np.ndarray) -> np.ndarray:
+        """
+        Picks the values of many sets at once.
+        :param values: Array of shape (n_sets, max_length) of the values of every set sorted, padded with NaN
+        :param badness: Array of the same shape with the badness of every solution
+        :param lengths: Number of solutions of every set
+        :param must_choose: Boolean array, see pick
+        :return: Index of the picked solution of every set, -1 if none can be picked yet
+        """
+
+
+class DerivativeModeFinder(ModeFinder):
+    """
+    Picks the solution in the middle of the window of sorted solutions with the smallest sum of gaps,
+    if the average gap in the window is below a threshold.
+    """
+
+    def __init__(self, filter_size: int, avg_threshold: float):
+        """
+        :param filter_size: Number of solutions in the window
+        :param avg_threshold: Average gap between the solutions in the window required to pick its middle one
+        """
+        self.filter_size = filter_size
+        self.sum_threshold = avg_threshold * filter_size
+        self.min_solutions = 2 * filter_size
+
+    def pick(self, solutions: list[Solution], must_choose: bool = False) -> int | None:
+        if len(solutions) < self.min_solutions:
+            return None
+        deriv = [solutions[i + 1] - solutions[i] for i in range(len(solutions) - 1)]
+        delta = self.filter_size // 2
+        deriv_sum = [sum(deriv[i - delta:i + delta]) for i in range(delta, len(deriv) - delta)]
+
+        deriv_sum_minimum = min(deriv_sum)
+        if not must_choose and deriv_sum_minimum > self.sum_threshold:
+            return None
+        return deriv_sum.index(deriv_sum_minimum) + delta
+
+    def pick_many(self, values: np.ndarray, badness: np.ndarray, lengths: np.ndarray,
+                  must_choose: np.ndarray) -> np.ndarray:
+        n, width = values.shape
+        delta = self.filter_size // 2
+        picked = np.full(n, -1, dtype=np.int64)
+        if width - 1 <= 2 * delta:
+            return picked
+
+        deriv = np.diff(values, axis=1)
+        n_windows = width - 1 - 2 * delta
+        # The gaps are summed in the same order as in pick, so that both give bit-identical sums
+        deriv_sum = np.zeros((n, n_windows))
+        for k in range(2 * delta):
+            deriv_sum += deriv[:, k:k + n_windows]
+        valid = np.arange(n_windows) < (lengths - 1 - 2 * delta)[:, None]
+        deriv_sum[~valid] = np.inf
+
+        best = deriv_sum.argmin(axis=1)
+        best_sum = deriv_sum[np.arange(n), best]
+        ok = (lengths >= self.min_solutions) & (must_choose | (best_sum <= self.sum_threshold))
+        picked[ok] = best[ok] + delta
+        return picked
+
+
+class KDEModeFinder(ModeFinder):
+    """
+    Picks the solution at the maximum of a Gaussian kernel density estimate of the solutions, where every solution
+    is weighted by 1 / (1 + badness). The density at a solution counts the agreeing gates, the solution itself
+    included, so the value is picked as soon as enough gates agree, regardless of how many solutions there are.
+    """
+
+    def __init__(self, bandwidth: float, min_support: float, min_solutions: int):
+        """
+        :param bandwidth: Standard deviation of the kernel, about the noise of the solutions
+        :param min_support: Density at the mode required to pick it, in units of agreeing solutions of badness 0
+        :param min_solutions: Smallest number of solutions for which a value may be picked
+        """
+        self.bandwidth = bandwidth
+        self.min_support = min_support
+        self.min_solutions = min_solutions
+        self._scale = -0.5 / (bandwidth * bandwidth)
+
+    def pick(self, solutions: list[Solution], must_choose: bool = False) -> int | None:
+        n = len(solutions)
+        if n < self.min_solutions:
+            return None
+        weights = [1 / (1 + max(0, sol.badness)) for sol in solutions]
+        scale, reach = self._scale, 4 * self.bandwidth
+        best, best_density, lo = 0, -1.0, 0
+        for i, x in enumerate(solutions):
+            # The solutions are sorted, so the kernel is evaluated only within 4 bandwidths on both sides.
+            # The terms are summed in the order of the solutions, as in pick_many, so that both give the same density
+            while x - solutions[lo] > reach:
+                lo += 1
+            density = 0.0
+            for j in range(lo, n):
+                d = x - solutions[j]
+                if -d > reach:
+                    break
+                density += weights[j] * math.exp(scale * d ** 2)
+            if density > best_density:
+                best, best_density = i, density
+        if not must_choose and best_density < self.min_support:
+            return None
+        return best
+
+    def pick_many(self, values: np.ndarray, badness: np.ndarray, lengths: np.ndarray,
+                  must_choose: np.ndarray) -> np.ndarray:
+        weights = np.where(np.isnan(values), 0.0, 1 / (1 + np.maximum(0, badness)))
+        x = np.nan_to_num(values)
+        d = x[:, :, None] - x[:, None, :]
+        kernel = np.where(np.abs(d) <= 4 * self.bandwidth, weights[:, None, :] * np.exp(self._scale * d ** 2), 0.0)
+        # The terms are summed in the same order as in pick, so that both give bit-identical densities
+        density = np.zeros(values.shape)
+        for j in range(values.shape[1]):
+            density += kernel[:, :, j]
+        density[np.isnan(values)] = -1.0
+
+        best = density.argmax(axis=1)
+        best_density = density[np.arange(len(values)), best]
+        ok = (lengths >= self.min_solutions) & (must_choose | (best_density >= self.min_support))
+        return np.where(ok, best, -1)
+
+
+"""Mode finders by their name in the configuration"""
+MODE_FINDERS = {
+    "derivative": DerivativeModeFinder,
+    "kde": KDEModeFinder,
+}
+
+_finders: dict[tuple, ModeFinder] = {}
+
+
+def get_mode_finder() -> ModeFinder:
+    """
+    :return: The mode finder selected by solution_set.mode_finder in the configuration. Finders are shared
+    by all SolutionSets with the same configuration.
+    """
+    c = config["solution_set"]
+    name = c["mode_finder"]
+    if name == "derivative":
+        args = (c["deriv_filter_size"], c["deriv_filter_avg_threshold"])
+    elif name == "kde":
+        args = (c["kde_bandwidth"], c["kde_min_support"], c["kde_min_solutions"])
+    else:
+        raise ValueError(f"Unknown mode finder {name}, expected one of {list(MODE_FINDERS)}")
+    finder = _finders.get((name, *args))
+    if finder is None:
+        finder = _finders[(name, *args)] = MODE_FINDERS[name](*args)
+    return finder
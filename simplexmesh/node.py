@@ -1,9 +1,15 @@
-import random
 import abc
+import heapq
+import itertools
+import math
+import numpy as np
 from abc import ABC
+from typing import Callable
 from simplexmesh.solution import *
 from simplexmesh.grid import Grid, Network
-from simplexmesh.algorithm import simplex_diagonal
+from simplexmesh.algorithm import (simplex_diagonal, simplex_diagonal_3d, cayley_menger_diagonals,
+                                   get_positions_by_anchors_lls, refine_position_by_anchors)
+from simplexmesh.metrics import metrics
 
 
 class TargetNode(int):
@@ -23,26 +29,102 @@ class TargetNode(int):
         return x
 
 
+class TargetTable:
+    """
+    All TargetNodes of an origin node, indexed by ID like a list. A TargetNode is created on first access,
+    so that building and restoring a node does not cost time proportional to the size of the network.
+    """
+    __slots__ = ("_targets", "_size", "_hops")
 
+    def __init__(self, size: int, hops: Callable[[int], int] | None = None):
+        """
+        :param size: Number of node IDs
+        :param hops: Hop count of a target not created yet, 0 for all if not provided
+        """
+        self._targets: dict[int, TargetNode] = {}
+        self._size = size
+        self._hops = hops
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __getitem__(self, target_id: int) -> TargetNode:
+        target = self._targets.get(target_id)
+        if target is None:
+            if not 0 <= target_id < self._size:
+                raise IndexError(target_id)
+            hops = 0 if self._hops is None else self._hops(target_id)
+            target = self._targets[target_id] = TargetNode(target_id, hops)
+        return target
+
+    def __iter__(self):
+        return (self[x] for x in range(self._size))
+
+    def created(self):
+        """
+        :return: The TargetNodes created so far
+        """
+        return self._targets.values()
+
+    def append(self, target: TargetNode):
+        assert target == self._size
+        self._targets[target] = target
+        self._size += 1
+
+
+class RemoteView:
+    """
+    Local copy of the completed set and of the asked edge values of another node.
+    The owner appends every completed target to a log, and the copy of the set is brought up to date by fetching
+    only the entries past its version. When the owner loses a target, it starts a new epoch of the log,
+    and the copy is fetched whole once. Every edge value carries a stamp bumped by the owner whenever it changes,
+    and is fetched again only if the stamp differs. An unchanged node costs an empty reply instead of its state.
+    """
+    __slots__ = ("completed_epoch", "completed_version", "completed", "edges")
+
+    def __init__(self):
+        self.completed_epoch = 0
+        self.completed_version = 0
+        self.completed: set[TargetNode] = set()
+        """Target ID -> (stamp, value)"""
+        self.edges: dict[int, tuple[int, Solution | None]] = {}
 
-class Node(ABC):
-    __anchors_required = config["grid"]["n_required_anchors"]
 
+
+
+class Node(ABC):
     def __init__(self, id: int, network: Network, grid: Grid):
         if network.get_node(id) is not None:
             raise ValueError("ID already in use")
 
+        self.__anchors_required = config["grid"]["n_required_anchors"]
         self._id = id
         self._network = network
         self._grid = grid
         self._network.add_node(self)
 
+        """Number of nodes in a gate: 2 on a plane, 3 in space"""
+        self.gate_size = grid.P.dim
+        """Stream of all random choices of the node, independent of the other nodes"""
+        self.rng = grid.streams.generator("node", id)
+
         self.is_anchor = False
         self.anchor_reached = False
         self.anchors = {}
         self.position = None
+        """Whether the position is recomputed whenever the anchors or the distances to them change"""
+        self._streaming = config["localization"]["streaming"]
+        self._position_iterations = config["localization"]["streaming_iterations"]
+        """Largest move of the position since reset_position_shift, inf after the first fix"""
+        self.position_shift = 0.0
 
         self._known: dict[TargetNode, SolutionSet] = {}
+        """Number of changes of the value of every edge"""
+        self._edge_stamps: dict[TargetNode, int] = {}
+        self._views: dict[int, RemoteView] = {}
+        """Gate node ID -> targets with solutions computed through a gate containing it"""
+        self._targets_by_gate_node: dict[int, set[TargetNode]] = {}
+        self._solver_cache = SolverCache(config["solver_cache"]["size"]) if config["solver_cache"]["enabled"] else None
         self._neighbors: set[TargetNode] = set()
         self._neighbors.update(self.broadcast_is_neighbor())
 
@@ -59,18 +141,96 @@ class Node(ABC):
     def measure_distance(self, target_id) -> float | None:
         return self._grid.get_measured_distance(self._id, target_id)
 
+    def _get_view(self, node_id) -> RemoteView:
+        view = self._views.get(node_id)
+        if view is None:
+            view = self._views[node_id] = RemoteView()
+        return view
+
     def ask_node_for_distance(self, node_id, target_id) -> Solution | None:
-        return self._network.get_node(node_id).get_known_to(target_id)
+        view = self._get_view(node_id)
+        stamp, solution = view.edges.get(target_id, (0, None))
+        changed = self._network.get_node(node_id).get_known_to_if_changed(target_id, stamp)
+        if (transport := self._network.transport) is not None:
+            transport.request(self._id, node_id, 2 * transport.id_bytes,
+                              0 if changed is None or changed[1] is None else transport.solutions_size([changed[1]]))
+        if metrics.enabled:
+            metrics.count("edge_view_hits" if changed is None else "edge_view_updates")
+        if changed is not None:
+            view.edges[target_id] = changed
+            solution = changed[1]
+        return solution
+
+    def ask_node_for_completed_delta(self, node_id) -> list[TargetNode]:
+        """
+        Brings the local copy of the completed set of a node up to date.
+        :return: IDs completed by the node since the last call
+        """
+        view = self._get_view(node_id)
+        epoch, delta = self._network.get_node(node_id).get_completed_since(view.completed_version, view.completed_epoch)
+        if (transport := self._network.transport) is not None:
+            transport.request(self._id, node_id, 2 * transport.id_bytes, len(delta) * transport.id_bytes)
+        if metrics.enabled:
+            metrics.count("completed_view_updates" if delta else "completed_view_hits")
+        if epoch != view.completed_epoch:
+            view.completed_epoch = epoch
+            view.completed_version = 0
+            view.completed = set()
+        if delta:
+            view.completed_version += len(delta)
+            view.completed.update(delta)
+        return delta
 
     def ask_node_for_all_completed_ids(self, node_id) -> set[TargetNode]:
-        return self._network.get_node(node_id).get_all_completed()
+        """
+        :return: The local copy of the completed set of the node. It is updated in place, do not modify it.
+        """
+        self.ask_node_for_completed_delta(node_id)
+        return self._views[node_id].completed
 
     def ask_node_is_anchor_and_position(self, node_id) -> tuple[int, int] | None:
-        return self._network.get_node(node_id).get_is_anchor_and_position()
+        position = self._network.get_node(node_id).get_is_anchor_and_position()
+        if (transport := self._network.transport) is not None:
+            transport.request(self._id, node_id, 0, 0 if position is None else transport.position_size())
+        return position
 
     def send_solutions_to_target(self, node_id, solutions) -> None:
+        if (transport := self._network.transport) is not None:
+            transport.push(self._id, node_id, transport.solutions_size(solutions))
+            if transport.batching:
+                transport.defer(self._id, node_id, solutions)
+                return
         self._network.get_node(node_id).add_solution_to_node(self._id, solutions)
 
+    def send_finalized_to_target(self, node_id, value: Solution, confidence: float) -> None:
+        """
+        Tells the other endpoint of an edge that this node finalized its value.
+        """
+        if (transport := self._network.transport) is not None:
+            transport.push(self._id, node_id, transport.solutions_size([value]) + 1)
+            if transport.batching:
+                transport.defer_finalized(self._id, node_id, value, confidence)
+                return
+        self._network.get_node(node_id).receive_finalized(self._id, value, confidence)
+
+    def receive_finalized(self, node_id: int, value: Solution, confidence: float) -> None:
+        """
+        Takes over the value of an edge finalized by its other endpoint, unless this node finalized its own already.
+        No more solutions are computed or pushed for the edge from either side.
+        """
+        target = self.get_target(node_id)
+        solution_set = self._known.get(target)
+        if solution_set is None:
+            solution_set = self._known[target] = SolutionSet()
+        elif solution_set.finalized:
+            return
+        solution_set.finalize_with(value, confidence)
+        if metrics.enabled:
+            metrics.count("sets_finalized_remotely")
+        self._edge_changed(target)
+        self.mark_known(target)
+        self.on_target_finalized(target)
+
 
     """
     Locals
@@ -81,6 +241,16 @@ class Node(ABC):
             return None
         return solset.get()
 
+    def get_known_to_if_changed(self, target_id, stamp: int) -> tuple[int, Solution | None] | None:
+        """
+        :param stamp: Stamp of the value the caller already has, 0 if it has none
+        :return: (stamp, value) of the edge, None if the stamp did not change
+        """
+        current = self._edge_stamps.get(target_id, 0)
+        if current == stamp:
+            return None
+        return current, self.get_known_to(target_id)
+
     def set_is_anchor(self):
         self.is_anchor = True
         self.position = self._grid.get_true_position(self._id)
@@ -93,6 +263,23 @@ class Node(ABC):
     def set_logging(self, logging: bool = True):
         self.do_logging = logging
 
+    def get_target(self, target_id: int) -> TargetNode:
+        """
+        :return: The TargetNode describing the node with the given ID from the perspective of this node
+        """
+        return TargetNode(target_id)
+
+    def restore_progress(self, known_ids: list[int], target_source: list[int], hop_level: int,
+                         known_count_by_hop_level: list[int]):
+        """
+        Restores the progress of the strategy from a snapshot. The SolutionSets are restored separately.
+        :param known_ids: IDs of the nodes to which the distance is known
+        :param target_source: Targets the strategy currently picks from, if it keeps such a list
+        :param hop_level: Current hop level, if the strategy uses one
+        :param known_count_by_hop_level: Hop level completion counters, if the strategy uses them
+        """
+        pass
+
     def measure_distances_to_neighbors(self):
         for neigh in self._neighbors:
             d = self.measure_distance(neigh)
@@ -100,41 +287,271 @@ class Node(ABC):
                 neigh.completed = True
                 self.add_exact_solution(neigh, d)
 
+    def index_gates(self, target: TargetNode, solutions: list[Solution]):
+        """
+        Remembers the gate nodes of the solutions for the target, so that they can be invalidated when a gate node
+        moves or leaves without going through all SolutionSets.
+        """
+        for sol in solutions:
+            if sol.tag != -1:
+                for gate_node in sol.tag:
+                    self._targets_by_gate_node.setdefault(gate_node, set()).add(target)
+
     def add_solutions(self, target: TargetNode, solutions: list[Solution]):
         if target not in self._known.keys():
             self._known[target] = SolutionSet()
+        self.index_gates(target, solutions)
         solution_ready = self._known[target].extend(solutions)
+        if solution_ready:
+            self._edge_ready(target)
 
         return solution_ready
 
+    def add_solutions_many(self, targets: list[TargetNode], solutions: list[list[Solution]]) -> list[bool]:
+        """
+        Adds the solutions of many targets and picks the values of all their SolutionSets at once.
+        :param targets: Distinct targets
+        :param solutions: List of solutions for every target
+        :return: For every target, whether its value was picked
+        """
+        solution_sets = []
+        for target, target_solutions in zip(targets, solutions):
+            if target not in self._known.keys():
+                self._known[target] = SolutionSet()
+            self.index_gates(target, target_solutions)
+            solution_sets.append(self._known[target])
+            solution_sets[-1].extend(target_solutions, update=False)
+
+        ready = SolutionSet.update_many(solution_sets)
+        for target, solution_ready in zip(targets, ready):
+            if solution_ready:
+                self._edge_ready(target)
+        return ready
+
+    def _edge_ready(self, target: TargetNode):
+        """
+        Called when a value of the edge to the target was picked.
+        """
+        solution_set = self._known[target]
+        self._edge_stamps[target] = self._edge_stamps.get(target, 0) + 1
+        if self._network.edge_listener is not None:
+            self._network.edge_listener(self._id, target, solution_set.get(), False)
+        self._anchor_edge_changed(target)
+        if solution_set.finalized:
+            self.send_finalized_to_target(target, solution_set.get(), solution_set.confidence)
+            self.on_target_finalized(target)
+
+    def is_finalized(self, target_id: int) -> bool:
+        """
+        :return: True if the value of the edge to the target is settled and takes no more solutions
+        """
+        solution_set = self._known.get(target_id)
+        return solution_set is not None and solution_set.finalized
+
+    def on_target_finalized(self, target: TargetNode):
+        """
+        Called when the edge to a target is finalized, here or by the target, so that strategies stop picking it.
+        """
+        pass
+
     def add_exact_solution(self, target: TargetNode, value: float):
         if target not in self._known.keys():
             self._known[target] = SolutionSet(exact_value=value)
         else:
             self._known[target].add(Solution(value=value, is_exact=True, badness=0))
+        self._edge_stamps[target] = self._edge_stamps.get(target, 0) + 1
+        if self._network.edge_listener is not None:
+            self._network.edge_listener(self._id, target, value, True)
+        self._anchor_edge_changed(target)
 
     def mark_known(self, target: TargetNode):
         self.check_anchor_hit(target)
 
+    def unmark_known(self, target: TargetNode):
+        """
+        Called when the distance to a target is lost, so that the strategy picks it again.
+        """
+        pass
+
     def check_anchor_hit(self, target: TargetNode):
         if (pos := self.ask_node_is_anchor_and_position(target)) is not None:
             self.anchors[target] = pos
+            if self._streaming:
+                self.update_position()
             if len(self.anchors.keys()) == self.__anchors_required:
                 print(f"[{self._id}] Required anchors acquired")
                 self.anchor_reached = True
+                if metrics.enabled:
+                    metrics.count("nodes_anchored")
+
+
+    """
+    Topology changes
+    """
+    def on_node_added(self, node_id: int, hops: int):
+        """
+        Called when a node joins the network.
+        :param hops: Hops required to get to the new node
+        """
+        pass
+
+    def on_node_removed(self, node_id: int):
+        """
+        Called when a node leaves the network.
+        """
+        self.forget_node(node_id)
+
+    def on_node_moved(self, node_id: int, hops: int):
+        """
+        Called when another node moves. All distances to it and through it are no longer valid.
+        :param hops: Hops required to get to the node at its new position
+        """
+        self.forget_node(node_id)
+
+    def on_neighbor_added(self, node_id: int):
+        """
+        Called when a node comes into reach, eg. after either of them moved. Measures the distance to it.
+        """
+        neigh = TargetNode(node_id, 1)
+        self._neighbors.discard(neigh)
+        self._neighbors.add(neigh)
+        d = self.measure_distance(neigh)
+        if d is not None:
+            neigh.completed = True
+            self.add_exact_solution(neigh, d)
+
+    def on_neighbor_removed(self, node_id: int):
+        self._neighbors.discard(node_id)
+
+    def update_hop_row(self, hop_row: np.ndarray):
+        """
+        Called when the hop counts from this node to other nodes changed.
+        :param hop_row: The new hop counts, as returned by Grid.get_hop_row
+        """
+        pass
+
+    def forget_node(self, node_id: int):
+        """
+        Drops everything which depends on the position of a node: the distance to it, the solutions computed
+        through gates containing it and its anchor position. Other SolutionSets are left untouched.
+        Targets whose value is lost with the solutions become unknown again.
+        """
+        self._views.pop(node_id, None)
+        if self._solver_cache is not None:
+            self._solver_cache.discard_node(node_id)
+        if self.anchors.pop(node_id, None) is not None:
+            if len(self.anchors) < self.__anchors_required:
+                self.anchor_reached = False
+            if self._streaming:
+                self.update_position()
+        if self._known.pop(node_id, None) is not None:
+            self._edge_lost(self.get_target(node_id))
+
+        targets = sorted(self._targets_by_gate_node.pop(node_id, ()))
+        for target in targets:
+            solset = self._known.get(target)
+            if solset is not None and solset.discard_gate_node(node_id):
+                if solset.get() is None:
+                    self._edge_lost(target)
+                else:
+                    self._edge_changed(target)
+        if metrics.enabled:
+            metrics.count("sets_invalidated", len(targets))
+
+    def _edge_changed(self, target: TargetNode):
+        self._edge_stamps[target] = self._edge_stamps.get(target, 0) + 1
+        if self._network.edge_listener is not None:
+            self._network.edge_listener(self._id, target, self._known[target].get(), False)
+        self._anchor_edge_changed(target)
+
+    def _edge_lost(self, target: TargetNode):
+        self._edge_stamps[target] = self._edge_stamps.get(target, 0) + 1
+        if self._network.edge_listener is not None:
+            self._network.edge_listener(self._id, target, None, False)
+        self._anchor_edge_changed(target)
+        self.unmark_known(target)
+
+    def _anchor_edge_changed(self, target: TargetNode):
+        if self._streaming and target in self.anchors:
+            self.update_position()
+
+    def update_position(self):
+        """
+        Recomputes the position from the distances to the anchors, refining the previous estimate, so that a fix
+        is available as soon as dim + 1 anchors are known and follows every later change. The first fix
+        is started from linear least squares. With fewer anchors the previous estimate is kept.
+        """
+        if self.is_anchor:
+            return
+        anchor_ids = [x for x in self.anchors if self.get_known_to(x) is not None]
+        if len(anchor_ids) < self.gate_size + 1:
+            return
+        a = np.array([self.anchors[x].xyz for x in anchor_ids], dtype=np.float64)
+        d = np.array([self.get_known_to(x) for x in anchor_ids], dtype=np.float64)
+        if self.position is None:
+            x = get_positions_by_anchors_lls(a[None], d[None])[0]
+        else:
+            x = np.array(self.position.xyz, dtype=np.float64)
+        x = refine_position_by_anchors(x, a, d, self._position_iterations)
+        position = self._grid.P(tuple(x.tolist()))
+        shift = math.inf if self.position is None else position.distance_to(self.position)
+        self.position_shift = max(self.position_shift, shift)
+        self.position = position
+        if metrics.enabled:
+            metrics.count("position_updates")
+
+    def reset_position_shift(self) -> float:
+        """
+        :return: Largest move of the position since the last reset
+        """
+        shift, self.position_shift = self.position_shift, 0.0
+        return shift
 
 
     """
     Procedures
     """
-    def compute_solutions(self, target: TargetNode, gate: tuple[int, int], p0p1: Solution,
-                         p0p2: Solution, p1p2: Solution, p1p3: Solution, p2p3: Solution):
+    def compute_solutions(self, target: TargetNode, gate: tuple[int, ...], *edges: Solution):
+        """
+        Solves the distance to the target through the gate.
+        :param edges: Distances from this node to the gate nodes, between the gate nodes (in the order of
+        itertools.combinations) and from the gate nodes to the target.
+        For a gate of two nodes that is p0p1, p0p2, p1p2, p1p3, p2p3 as in simplex_diagonal.
+        """
+        if metrics.enabled:
+            metrics.count("solver_calls")
 
-        solutions = [Solution(x, badness=max(edge.badness for edge in (p0p1, p0p2, p1p2, p1p3, p2p3)), gate=gate)
-                     for x in simplex_diagonal(p0p1, p0p2, p1p2, p1p3, p2p3)]
+        solver = simplex_diagonal if len(gate) == 2 else simplex_diagonal_3d
+        solutions = [Solution(x, badness=max(edge.badness for edge in edges), gate=gate)
+                     for x in solver(*edges)]
 
         return solutions
 
+    def compute_solutions_batch(self, gate: tuple[int, ...], gate_edges: list[Solution],
+                                target_edges: list[list[Solution]]) -> list[list[Solution]]:
+        """
+        Solves the distances to many targets through the same gate in a single batched call.
+        :param gate_edges: Distances from this node to the gate nodes and between the gate nodes, as in compute_solutions
+        :param target_edges: For every target, distances from the gate nodes to it
+        :return: List of solutions for every target
+        """
+        if metrics.enabled:
+            metrics.count("solver_calls", len(target_edges))
+
+        g = len(gate)
+        m = g + 2
+        d = np.zeros((len(target_edges), m, m))
+        index_pairs = [(0, i) for i in range(1, g + 1)] + list(itertools.combinations(range(1, g + 1), 2))
+        for (i, j), edge in zip(index_pairs, gate_edges):
+            d[:, i, j] = d[:, j, i] = edge
+        d[:, 1:g + 1, m - 1] = d[:, m - 1, 1:g + 1] = np.array(target_edges, dtype=np.float64).reshape(-1, g)
+        roots = cayley_menger_diagonals(d * d).tolist()
+
+        gate_badness = max(edge.badness for edge in gate_edges)
+        return [[Solution(x, badness=max(gate_badness, *(edge.badness for edge in edges)), gate=gate)
+                 for x in row if x == x]
+                for row, edges in zip(roots, target_edges)]
+
 
     def log_new_edge(self, target: TargetNode):
         if not self.do_logging:
@@ -164,46 +581,162 @@ class BasicStrategyNode(Node, ABC):
     def __init__(self, id: int, network: Network, grid: Grid):
         super().__init__(id, network, grid)
         self._known_set: set[TargetNode] = set()
-        self._unknown_set = self.create_unknown_set()  # So that random.choice() is more efficient
-        self._target_set = self.create_unknown_set(with_self=True)
+        """Targets in the order in which they were completed, the length is the version of the completed set"""
+        self._completed_log: list[TargetNode] = []
+        """Number of times a completed target was lost, the log is rewritten every time"""
+        self._completed_epoch = 0
+        self._target_set = self.create_target_set()
+        """Created on first use, see _unknown_set"""
+        self._unknown_targets: list[TargetNode] | None = None
+
+    @property
+    def _unknown_set(self) -> list[TargetNode]:
+        """
+        Targets not known yet, as a list so that a random choice is more efficient.
+        """
+        if self._unknown_targets is None:
+            self._unknown_targets = self.create_unknown_set()
+        return self._unknown_targets
+
+    @_unknown_set.setter
+    def _unknown_set(self, unknown: list[TargetNode] | None):
+        self._unknown_targets = unknown
 
     def get_all_completed(self) -> set[TargetNode]:
         return self._known_set
 
+    def get_completed_since(self, version: int, epoch: int = 0) -> tuple[int, list[TargetNode]]:
+        """
+        :param version: Number of completed targets the caller already knows about
+        :param epoch: Epoch of the log the version refers to
+        :return: The current epoch and the targets completed after the version.
+        All completed targets if the epoch changed since.
+        """
+        if epoch != self._completed_epoch:
+            return self._completed_epoch, self._completed_log
+        return epoch, self._completed_log[version:]
+
+    def get_target(self, target_id: int) -> TargetNode:
+        return self._target_set[target_id]
+
+    def restore_progress(self, known_ids: list[int], target_source: list[int], hop_level: int,
+                         known_count_by_hop_level: list[int]):
+        self._completed_log = [self._target_set[target] for target in known_ids]
+        self._known_set = set(self._completed_log)
+        self._unknown_set = None
+
     def add_solution_to_node(self, node_id: int, solutions: list[Solution]):
         self.add_solutions(self._target_set[node_id], solutions)
 
+    def add_solution_batches_to_node(self, node_id: int, batches: list[list[Solution]]):
+        """
+        Receives all solutions pushed by a node in one round, as a single coalesced message.
+        """
+        target = self._target_set[node_id]
+        for solutions in batches:
+            self.add_solutions(target, solutions)
+
     def add_solutions(self, target: TargetNode, solutions: list[Solution]):
         solution_ready = super().add_solutions(target, solutions)
         if solution_ready:
             self.mark_known(target)
             self.log_new_edge(target)
 
+    def add_solutions_many(self, targets: list[TargetNode], solutions: list[list[Solution]]) -> list[bool]:
+        ready = super().add_solutions_many(targets, solutions)
+        for target, solution_ready in zip(targets, ready):
+            if solution_ready:
+                self.mark_known(target)
+                self.log_new_edge(target)
+        return ready
+
     def add_exact_solution(self, target: TargetNode, value: float):
         super().add_exact_solution(target, value)
         self.mark_known(target)
 
-    def create_unknown_set(self, with_self=False) -> list[TargetNode]:
-        ret = []
-        for x in range(self._network.get_node_count()):
-            if not with_self and x == self._id:
-                continue
-            ret.append(TargetNode(x))
-        return ret
+    def create_target_set(self) -> TargetTable:
+        return TargetTable(self._network.get_node_count())
+
+    def create_unknown_set(self) -> list[TargetNode]:
+        """
+        Nodes which left the network are left out of the unknown set, but the target set keeps all of them,
+        as it is indexed by ID.
+        """
+        removed = self._grid.removed
+        return [self._target_set[x] for x in range(len(self._target_set))
+                if x != self._id and x not in removed and x not in self._known_set]
 
     def mark_known(self, target: TargetNode):
-        if target not in self._unknown_set:  # TODO check why this happens as it should not.
+        if target in self._known_set or target == self._id:  # TODO check why this happens as it should not.
             return
-        self._unknown_set.remove(target)
+        # An unknown set not created yet leaves the known targets out anyway
+        if self._unknown_targets is not None and target in self._unknown_targets:
+            self._unknown_targets.remove(target)
         self._known_set.add(target)
+        self._completed_log.append(target)
+        if metrics.enabled:
+            metrics.count("edges_known")
         super().mark_known(target)
 
-    def _compute_solutions_and_mark_known(self, target: TargetNode, gate: tuple[int, int], p0p1: Solution,
-                         p0p2: Solution, p1p2: Solution, p1p3: Solution, p2p3: Solution):
+    def unmark_known(self, target: TargetNode):
+        if target not in self._known_set:
+            return
+        unknown = self._unknown_set  # Created before the target is dropped, so that it is not in it already
+        self._known_set.remove(target)
+        self._completed_log.remove(target)
+        self._completed_epoch += 1
+        unknown.append(target)
+
+    def on_node_added(self, node_id: int, hops: int):
+        target = TargetNode(node_id, hops)
+        unknown = self._unknown_set  # Created before the target is added, so that it is not in it already
+        self._target_set.append(target)
+        unknown.append(target)
+
+    def on_node_removed(self, node_id: int):
+        super().on_node_removed(node_id)
+        if self._unknown_targets is not None and node_id in self._unknown_targets:
+            self._unknown_targets.remove(node_id)
+
+    def _get_gate_edges(self, gate: tuple[int, ...]) -> list[Solution] | None:
+        """
+        :return: Distances from this node to the gate nodes followed by distances between the gate nodes,
+        or None if any of them is not known.
+        """
+        edges = [self._known[node].get() for node in gate]
+        for left, right in itertools.combinations(gate, 2):
+            edges.append(self.ask_node_for_distance(left, right))
+        if any(edge is None for edge in edges):
+            return None
+        return edges
+
+    def _edge_version(self, owner: int, other: int) -> tuple[int, int, int]:
+        """
+        :return: (owner, other, stamp) of an edge as last read by this node, owned by it or by a remote
+        """
+        if owner == self._id:
+            return owner, other, self._edge_stamps.get(other, 0)
+        return owner, other, self._views[owner].edges[other][0]
 
-        solutions = self.compute_solutions(target, gate, p0p1, p0p2, p1p2, p1p3, p2p3)
+    def _gate_versions(self, gate: list[int]) -> tuple[tuple[int, int, int], ...]:
+        """
+        :return: Sorted versions of the edges from this node to the gate nodes and between the gate nodes,
+        read as in _get_gate_edges
+        """
+        return tuple(sorted([self._edge_version(self._id, node) for node in gate] +
+                            [self._edge_version(left, right) for left, right in itertools.combinations(gate, 2)]))
+
+    def _compute_solutions_and_mark_known(self, target: TargetNode, gate: tuple[int, ...], *edges: Solution):
+        solutions = self.compute_solutions(target, gate, *edges)
+        self._add_and_send_solutions(target, solutions)
+
+    def _add_and_send_solutions(self, target: TargetNode, solutions: list[Solution]):
+        """
+        Solutions which finalized the edge are not sent, the finalized notice sent instead replaces them.
+        """
         self.add_solutions(target, solutions)
-        self.send_solutions_to_target(target, solutions)
+        if not self.is_finalized(target):
+            self.send_solutions_to_target(target, solutions)
 
 
 class RandomTargetStrategyNode(BasicStrategyNode, ABC):
@@ -213,25 +746,47 @@ class RandomTargetStrategyNode(BasicStrategyNode, ABC):
     def try_measure_new_length(self):
         if len(self._unknown_set) == 0:
             return
-        target = random.choice(self._unknown_set)
+        target = self._unknown_set[self.rng.integers(len(self._unknown_set))]
         self._try_measure_new_length_to_target(target)
 
-    def _try_measure_new_length_to_target(self, target: TargetNode):
-        target_neighs = self.ask_node_for_all_completed_ids(target)
-        gate_pool = target_neighs.intersection(self._known_set)
-        if len(gate_pool) < 2:
-            return
-
-        gate = random.sample(gate_pool, 2)
-        p0p1 = self._known[gate[0]].get()
-        p0p2 = self._known[gate[1]].get()
-        p1p2 = self.ask_node_for_distance(gate[0], gate[1])
-        if p1p2 is None:
-            return
+    def _try_measure_new_length_to_target(self, target: TargetNode) -> bool:
+        """
+        :return: Whether solutions were computed
+        """
+        if self.is_finalized(target):
+            return False
+        return self._try_gate_pool(target, self.ask_node_for_all_completed_ids(target))
 
-        p1p3 = self.ask_node_for_distance(target, gate[0])
-        p2p3 = self.ask_node_for_distance(target, gate[1])
-        self._compute_solutions_and_mark_known(self._target_set[target], gate, p0p1, p0p2, p1p2, p1p3, p2p3)
+    def _try_gate_pool(self, target: TargetNode, target_neighs: set[TargetNode]) -> bool:
+        """
+        Solves the target through a random gate of nodes completed both by this node and by the target.
+        :param target_neighs: Completed set of the target
+        :return: Whether solutions were computed
+        """
+        gate_pool = target_neighs.intersection(self._known_set)
+        if len(gate_pool) < self.gate_size:
+            if metrics.enabled:
+                metrics.count("gate_pool_misses")
+            return False
+
+        gate_pool = sorted(gate_pool)  # Set order would make the choice depend on the history of the set
+        gate = [gate_pool[i] for i in self.rng.choice(len(gate_pool), self.gate_size, replace=False)]
+        gate_edges = self._get_gate_edges(gate)
+        if gate_edges is None:
+            if metrics.enabled:
+                metrics.count("gate_edge_misses")
+            return False
+
+        target_edges = [self.ask_node_for_distance(target, node) for node in gate]
+        if self._solver_cache is not None:
+            target_view = self._views[target].edges
+            key = SolverCache.key(target, self._gate_versions(gate),
+                                  tuple(target_view[node][0] for node in sorted(gate)))
+            if self._solver_cache.seen(key):
+                return False
+            self._solver_cache.add(key)
+        self._compute_solutions_and_mark_known(self._target_set[target], gate, *gate_edges, *target_edges)
+        return True
 
 
 
@@ -240,55 +795,83 @@ class RandomGateStrategyNode(BasicStrategyNode, ABC):
         super().__init__(id, network, grid)
 
     def get_random_gate(self):
-        return random.sample([id for id, solset in self._known.items() if solset.get() is not None], 2)
+        gate_pool = [id for id, solset in self._known.items() if solset.get() is not None]
+        return [gate_pool[i] for i in self.rng.choice(len(gate_pool), self.gate_size, replace=False)]
 
     def try_measure_new_length(self):
         gate = self.get_random_gate()
 
-        p0p1 = self._known[gate[0]].get()
-        p0p2 = self._known[gate[1]].get()
-
-        p1p2 = self.ask_node_for_distance(gate[0], gate[1])
-        if any([x is None for x in (p0p1, p0p2, p1p2)]):
+        gate_edges = self._get_gate_edges(gate)
+        if gate_edges is None:
+            if metrics.enabled:
+                metrics.count("gate_edge_misses")
             return
 
-        left_targets = self.ask_node_for_all_completed_ids(gate[0])
-        right_targets = self.ask_node_for_all_completed_ids(gate[1])
-        targets = left_targets.intersection(right_targets)
+        targets = set.intersection(*(self.ask_node_for_all_completed_ids(node) for node in gate))
 
+        if self._solver_cache is not None:
+            gate_versions = self._gate_versions(gate)
+            gate_views = [self._views[node].edges for node in sorted(gate)]
+        batch_targets, batch_edges = [], []
         for target in targets:
-            if target in self._neighbors or target == self._id:
+            if target in self._neighbors or target == self._id or self.is_finalized(target):
                 continue
 
-            p1p3 = self.ask_node_for_distance(gate[0], target)
-            p2p3 = self.ask_node_for_distance(gate[1], target)
-            if p1p3 is None or p2p3 is None:
+            target_edges = [self.ask_node_for_distance(node, target) for node in gate]
+            if any(edge is None for edge in target_edges):
                 continue
-
-            self._compute_solutions_and_mark_known(self._target_set[target], gate, p0p1, p0p2, p1p2, p1p3, p2p3)
+            if self._solver_cache is not None:
+                key = SolverCache.key(target, gate_versions, tuple(view[target][0] for view in gate_views))
+                if self._solver_cache.seen(key):
+                    continue
+                self._solver_cache.add(key)
+            batch_targets.append(target)
+            batch_edges.append(target_edges)
+
+        if len(batch_targets) == 0:
+            return
+        batch_targets = [self._target_set[target] for target in batch_targets]
+        batch_solutions = self.compute_solutions_batch(gate, gate_edges, batch_edges)
+        self.add_solutions_many(batch_targets, batch_solutions)
+        for target, solutions in zip(batch_targets, batch_solutions):
+            if not self.is_finalized(target):
+                self.send_solutions_to_target(target, solutions)
 
 
 
 class RandomTargetHopLevelStrategyNode(RandomTargetStrategyNode, ABC):
     def __init__(self, id: int, network: Network, grid: Grid):
-        self.hop_info = grid.get_hop_counts_from(id)
+        self.hop_row = grid.get_hop_row(id)
+        """Created on first use, see hop_info"""
+        self._hop_info: list[list[int]] | None = None
         self.hop_level = 2
-        self.current_target_source = self.hop_info[2].copy()
-        self.known_count_by_hop_level = [0] * len(self.hop_info)
+        self.current_target_source = np.flatnonzero(self.hop_row == 2).tolist()
+        self.known_count_by_hop_level = [0] * (int(self.hop_row.max()) + 2)
         super().__init__(id, network, grid)
 
-    def create_unknown_set(self, with_self=False) -> list[TargetNode]:
-        ret = []
-        for x in range(self._network.get_node_count()):
-            if not with_self and x == self._id:
-                continue
+    @property
+    def hop_info(self) -> list[list[int]]:
+        """
+        IDs of the targets on every hop level, as returned by Grid.hop_levels.
+        """
+        if self._hop_info is None:
+            self._hop_info = Grid.hop_levels(self.hop_row)
+        return self._hop_info
+
+    @hop_info.setter
+    def hop_info(self, hop_info: list[list[int]] | None):
+        self._hop_info = hop_info
+
+    def create_target_set(self) -> TargetTable:
+        return TargetTable(len(self.hop_row), lambda x: int(self.hop_row[x]))
 
-            for n_hops, hop_subset in enumerate(self.hop_info):
-                if x in hop_subset:
-                    tn = TargetNode(x, n_hops)
-                    ret.append(tn)
-                    break
-        return ret
+    def create_unknown_set(self) -> list[TargetNode]:
+        """
+        Unreachable nodes are left out of the unknown set, but the target set keeps all of them, as it is indexed by ID.
+        """
+        known = self._known_set
+        return [self._target_set[x] for x in np.flatnonzero(self.hop_row >= 0).tolist()
+                if x != self._id and x not in known]
 
 
 
@@ -301,17 +884,320 @@ class RandomTargetHopLevelStrategyNode(RandomTargetStrategyNode, ABC):
             completion_frac = self.known_count_by_hop_level[self.hop_level] / len(self.hop_info[self.hop_level])
             if completion_frac > config["node"]["hop_level_advance_threshold"]:
                 self.hop_level += 1
+                if metrics.enabled:
+                    metrics.count("hop_level_advances")
                 print(f"{[self._id]} Hop level -> {self.hop_level}")
-                self.current_target_source.extend(self.hop_info[self.hop_level])
+                self.current_target_source.extend(target for target in self.hop_info[self.hop_level]
+                                                  if not self.is_finalized(target))
 
     def mark_known(self, target: TargetNode):
         super().mark_known(target)
         self.process_hop_level(target)
 
+    def on_target_finalized(self, target: TargetNode):
+        if target in self.current_target_source:
+            self.current_target_source.remove(target)
+
+    def unmark_known(self, target: TargetNode):
+        if target not in self._known_set:
+            return
+        super().unmark_known(target)
+        target = self._target_set[target]
+        if target.hops >= 0:
+            self.known_count_by_hop_level[target.hops] = max(0, self.known_count_by_hop_level[target.hops] - 1)
+        if 2 <= target.hops <= self.hop_level and target not in self.current_target_source:
+            self.current_target_source.append(target)
+
+    def on_node_added(self, node_id: int, hops: int):
+        super().on_node_added(node_id, hops)
+        self._unknown_set.remove(node_id)
+        self._target_set[node_id].hops = -1
+        self.hop_row = np.append(self.hop_row, np.int32(-1))
+        self._set_target_hops(node_id, hops)
+
+    def on_node_removed(self, node_id: int):
+        super().on_node_removed(node_id)
+        self._set_target_hops(node_id, -1)
+
+    def on_node_moved(self, node_id: int, hops: int):
+        super().on_node_moved(node_id, hops)
+        self._set_target_hops(node_id, hops)
+
+    def _set_target_hops(self, node_id: int, hops: int):
+        """
+        Moves a single target to another hop level, -1 making it unreachable.
+        """
+        hop_info = self.hop_info  # Created before the hop row changes
+        target = self._target_set[node_id]
+        if target.hops >= 0:
+            hop_info[target.hops].remove(node_id)
+        if node_id in self.current_target_source:
+            self.current_target_source.remove(node_id)
+        if node_id in self._unknown_set:
+            self._unknown_set.remove(node_id)
+        target.hops = hops
+        self.hop_row[node_id] = hops
+        if hops < 0:
+            return
+        while len(self.hop_info) <= hops + 1:
+            self.hop_info.append([])
+            self.known_count_by_hop_level.append(0)
+        self.hop_info[hops].append(node_id)
+        if target not in self._known_set:
+            self._unknown_set.append(target)
+            if 2 <= hops <= self.hop_level:
+                self.current_target_source.append(node_id)
+
+    def update_hop_row(self, hop_row: np.ndarray):
+        """
+        Rebuilds the hop levels, keeping the current level, and counts the known targets on every level again.
+        """
+        self.hop_row = hop_row
+        self.hop_info = None
+        for target in self._target_set.created():
+            target.hops = int(hop_row[target])
+        self.known_count_by_hop_level = [0] * len(self.hop_info)
+        for target in self._known_set:
+            if target.hops >= 0:
+                self.known_count_by_hop_level[target.hops] += 1
+        self.hop_level = max(2, min(self.hop_level, len(self.hop_info) - 1))
+        known = self._known_set
+        self._unknown_set = None
+        self.current_target_source = [target for level in self.hop_info[2:self.hop_level + 1]
+                                      for target in level if target not in known]
+
+    def restore_progress(self, known_ids: list[int], target_source: list[int], hop_level: int,
+                         known_count_by_hop_level: list[int]):
+        super().restore_progress(known_ids, target_source, hop_level, known_count_by_hop_level)
+        self.hop_level = hop_level
+        self.current_target_source = list(target_source)
+        self.known_count_by_hop_level = list(known_count_by_hop_level)
+
     def try_measure_new_length(self):
         if len(self.current_target_source) == 0:
             return
-        target = random.choice(self.current_target_source)
+        target = self.current_target_source[self.rng.integers(len(self.current_target_source))]
         self._try_measure_new_length_to_target(target)
 
 
+
+
+class PriorityTargetStrategyNode(RandomTargetStrategyNode, ABC):
+    """
+    Picks targets from a priority queue instead of at random. Targets with gates not tried yet come first,
+    then closer targets, anchors, targets refreshed fewer times without progress and targets with more
+    common gate nodes. A gate is a combination of common gate nodes, nodes completed both by this node and
+    by the target, so a target is tried at most as many times as it has gates until new common gate nodes appear.
+
+    The common gate node count of a target is the number of nodes completed both by this node and by the target.
+    It is kept up to date incrementally: fetching the completed set of a target adds its new entries known
+    to this node, and completing an edge adds one to every target whose fetched completed set contains the new node.
+    Fetching is lazy: a popped target is refreshed first, and attempted only if it still ranks first.
+    """
+
+    def __init__(self, id: int, network: Network, grid: Grid):
+        self.hop_row = grid.get_hop_row(id)
+        super().__init__(id, network, grid)
+        """Number of targets refreshed per step at most, before giving up on the step"""
+        self.max_refreshes = config["node"]["priority_refreshes"]
+        """Target ID -> number of nodes completed by this node and by the target"""
+        self._common: dict[int, int] = {}
+        """Node ID -> targets whose fetched completed set contains it"""
+        self._holders: dict[int, set[int]] = {}
+        """Target ID -> version of its completed set counted in _common"""
+        self._counted: dict[int, tuple[int, int]] = {}
+        """Target ID -> number of attempts to solve it"""
+        self._attempts: dict[int, int] = {}
+        """Target ID -> refreshes since its common count last grew"""
+        self._stale: dict[int, int] = {}
+        self._anchor_targets: dict[int, bool] = {}
+        """Offset of the order in which targets with equal priorities are picked, see _tiebreak"""
+        self._tiebreak_salt = int(self.rng.integers(2 ** 32))
+        """Built from the unknown set on first use, see _get_queue"""
+        self._queue: list[tuple[tuple, int, int]] | None = None
+        self._queue_versions: dict[int, int] = {}
+
+    def create_target_set(self) -> TargetTable:
+        return TargetTable(len(self.hop_row), lambda x: int(self.hop_row[x]))
+
+    def create_unknown_set(self) -> list[TargetNode]:
+        """
+        Unreachable nodes are left out of the unknown set, but the target set keeps all of them, as it is indexed by ID.
+        """
+        known = self._known_set
+        return [self._target_set[x] for x in np.flatnonzero(self.hop_row >= 0).tolist()
+                if x != self._id and x not in known]
+
+    def _is_ready(self, target: int) -> bool:
+        """
+        :return: Whether the target has gates not tried yet
+        """
+        return self._attempts.get(target, 0) < math.comb(self._common.get(target, 0), self.gate_size)
+
+    def _priority(self, target: int) -> tuple:
+        """
+        :return: Key of the target in the queue, smaller keys first
+        """
+        return (not self._is_ready(target), self._target_set[target].hops,
+                not self._anchor_targets.get(target, False), self._stale.get(target, 0),
+                -self._common.get(target, 0), self._tiebreak(target))
+
+    def _tiebreak(self, target: int) -> int:
+        """
+        :return: Rank of the target in a fixed pseudo-random order of all targets, different for every target.
+        Multiplying by an odd constant modulo 2^64 maps distinct IDs to distinct ranks.
+        """
+        return (target + self._tiebreak_salt) * 0x9E3779B97F4A7C15 & 0xFFFFFFFFFFFFFFFF
+
+    def _push(self, target: int):
+        if self._queue is None:
+            return  # The queue is built with the current priorities anyway
+        version = self._queue_versions.get(target, 0) + 1
+        self._queue_versions[target] = version
+        heapq.heappush(self._queue, (self._priority(target), version, target))
+
+    def _get_queue(self) -> list[tuple[tuple, int, int]]:
+        """
+        :return: The queue, built from the unknown set on first use. Every entry which is not outdated has the
+        current priority of its target, so a queue built later pops the targets in the same order.
+        """
+        if self._queue is None:
+            self._rebuild_queue()
+        return self._queue
+
+    def _peek(self) -> tuple | None:
+        """
+        :return: Priority of the unknown target ranked first, None if there is none. Outdated entries are dropped.
+        """
+        queue = self._get_queue()
+        while queue:
+            _, version, target = queue[0]
+            if (version == self._queue_versions.get(target) and target not in self._known_set
+                    and self._target_set[target].hops >= 0 and not self.is_finalized(target)):
+                return queue[0][0]
+            heapq.heappop(queue)
+        return None
+
+    def _pop(self) -> int | None:
+        """
+        :return: The unknown target ranked first, None if there is none
+        """
+        if self._peek() is None:
+            return None
+        return heapq.heappop(self._queue)[2]
+
+    def _rebuild_queue(self):
+        self._queue = []
+        self._queue_versions.clear()
+        for target in self._unknown_set:
+            self._push(target)
+
+    def _refresh(self, target: int):
+        """
+        Fetches the completed set of the target and updates its common gate node count.
+        """
+        if target not in self._anchor_targets:
+            self._anchor_targets[target] = self.ask_node_is_anchor_and_position(target) is not None
+        view = self._get_view(target)
+        counted = self._counted.get(target, (0, 0))
+        delta = self.ask_node_for_completed_delta(target)
+        if counted != (view.completed_epoch, view.completed_version - len(delta)):
+            # The completed set was rewritten or fetched elsewhere, so the count is started over
+            delta = view.completed
+            self._common[target] = 0
+        self._counted[target] = (view.completed_epoch, view.completed_version)
+        grown = 0
+        for node in delta:
+            self._holders.setdefault(node, set()).add(target)
+            if node in self._known_set:
+                grown += 1
+        if grown:
+            self._common[target] = self._common.get(target, 0) + grown
+            self._stale[target] = 0
+        if metrics.enabled:
+            metrics.count("priority_refreshes")
+
+    def _gate_node_changed(self, node_id: int, change: int):
+        """
+        Updates the common gate node counts of the targets which completed a node whose edge this node
+        completed or lost.
+        """
+        for target in self._holders.get(node_id, ()):
+            view = self._views.get(target)
+            if view is None or node_id not in view.completed or target in self._known_set:
+                continue
+            self._common[target] = max(0, self._common.get(target, 0) + change)
+            if change > 0:
+                self._stale[target] = 0
+            self._push(target)
+
+    def mark_known(self, target: TargetNode):
+        is_new = target not in self._known_set and target != self._id
+        super().mark_known(target)
+        if is_new:
+            self._gate_node_changed(target, 1)
+
+    def unmark_known(self, target: TargetNode):
+        if target not in self._known_set:
+            return
+        super().unmark_known(target)
+        self._gate_node_changed(target, -1)
+        self._push(target)
+
+    def forget_node(self, node_id: int):
+        super().forget_node(node_id)
+        self._common.pop(node_id, None)
+        self._counted.pop(node_id, None)
+        self._attempts.pop(node_id, None)
+        self._stale.pop(node_id, None)
+        self._anchor_targets.pop(node_id, None)
+
+    def on_node_added(self, node_id: int, hops: int):
+        super().on_node_added(node_id, hops)
+        self.hop_row = np.append(self.hop_row, np.int32(hops))
+        self._push(node_id)
+
+    def on_node_removed(self, node_id: int):
+        """
+        The removed node becomes unreachable and its queue entries outdated, so that it is never refreshed again.
+        """
+        super().on_node_removed(node_id)
+        self._target_set[node_id].hops = -1
+        self.hop_row[node_id] = -1
+        self._holders.pop(node_id, None)
+        for targets in self._holders.values():
+            targets.discard(node_id)
+        self._queue_versions[node_id] = self._queue_versions.get(node_id, 0) + 1
+
+    def on_node_moved(self, node_id: int, hops: int):
+        super().on_node_moved(node_id, hops)
+        self._target_set[node_id].hops = hops
+        self.hop_row[node_id] = hops
+        self._push(node_id)
+
+    def update_hop_row(self, hop_row: np.ndarray):
+        self.hop_row = hop_row
+        for target in self._target_set.created():
+            target.hops = int(hop_row[target])
+        self._unknown_set = None
+        self._queue = None
+
+    def restore_progress(self, known_ids: list[int], target_source: list[int], hop_level: int,
+                         known_count_by_hop_level: list[int]):
+        super().restore_progress(known_ids, target_source, hop_level, known_count_by_hop_level)
+        self._queue = None
+
+    def try_measure_new_length(self):
+        for _ in range(self.max_refreshes):
+            target = self._pop()
+            if target is None:
+                return
+            self._refresh(target)
+            if self._is_ready(target) and ((top := self._peek()) is None or self._priority(target) <= top):
+                self._attempts[target] = self._attempts.get(target, 0) + 1
+                self._try_gate_pool(self._target_set[target], self._views[target].completed)
+                self._push(target)
+                return
+            if not self._is_ready(target):
+                self._stale[target] = self._stale.get(target, 0) + 1
+            self._push(target)
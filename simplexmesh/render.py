@@ -0,0 +1,125 @@
+"""
+Rendering of networks and traces from NumPy arrays.
+
+All geometry is built in one pass and drawn with a single artist per layer, so that plots of thousands of nodes
+render in seconds. Artists are updated in place on later draws. Headless figures use the Agg canvas directly,
+so no GUI backend is ever loaded when only exporting to PNG or SVG.
+"""
+from __future__ import annotations
+
+from typing import Collection, TYPE_CHECKING
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from simplexmesh.grid import Grid
+    from simplexmesh.node import Node
+
+
+def new_figure(n_axes: int = 1, headless: bool = False, size: tuple[float, float] = (10, 10)):
+    """
+    :param n_axes: Number of axes placed side by side
+    :param headless: Whether to create the figure without pyplot, for exporting only
+    :param size: Size of the figure in inches
+    :return: The figure and a list of its axes
+    """
+    if headless:
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+        fig = Figure(figsize=size)
+        FigureCanvasAgg(fig)
+    else:
+        from matplotlib import pyplot as plt
+
+        fig = plt.figure(figsize=size)
+    return fig, [fig.add_subplot(1, n_axes, i + 1) for i in range(n_axes)]
+
+
+def save_figure(fig, path, dpi: int = 100) -> None:
+    """
+    Saves a figure to a file, the format given by the extension, eg. .png or .svg.
+    """
+    fig.savefig(path, dpi=dpi)
+
+
+def node_arrays(nodes: Collection[Node], dim: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    :param nodes: Nodes ordered by ID
+    :param dim: Dimension of the positions
+    :return: Array of node states (0 - not anchored, 1 - anchored, 2 - anchor)
+    and array of shape (n, dim) of the calculated positions, NaN where not known
+    """
+    states = np.fromiter((2 if node.is_anchor else 1 if node.anchor_reached else 0 for node in nodes),
+                         dtype=np.int8, count=len(nodes))
+    positions = np.full((len(nodes), dim), np.nan)
+    for i, node in enumerate(nodes):
+        if node.position is not None:
+            positions[i] = node.position.xyz
+    return states, positions
+
+
+class NetworkRenderer:
+    """
+    Draws the true placement with the connections on one axis and the calculated positions,
+    connected to the true ones, on another. Only the first two coordinates are drawn.
+    """
+
+    """Colors of node states, as returned by node_arrays"""
+    STATE_COLORS = np.array([[1, 0, 0, 1], [0, 0.5, 0, 1], [0.75, 0.75, 0, 1]])
+    """Above this number of nodes the IDs are not drawn, as the text artists would dominate the render time"""
+    LABEL_LIMIT = 200
+
+    def __init__(self, grid: Grid, ax_true, ax_calculated, labels: bool | None = None):
+        """
+        :param grid: Grid after setup
+        :param ax_true: Axes for the true placement
+        :param ax_calculated: Axes for the calculated positions
+        :param labels: Whether to annotate the nodes with their IDs, only for small networks by default
+        """
+        self.grid = grid
+        self.ax_true = ax_true
+        self.ax_calculated = ax_calculated
+        self.labels = grid.n_nodes <= self.LABEL_LIMIT if labels is None else labels
+        self._coords = grid.coords[:, :2]
+        self._nodes_artist = None
+        self._positions_artist = None
+        self._errors_artist = None
+        self._label_artists = []
+
+    def draw(self, nodes: Collection[Node]) -> None:
+        """
+        Draws the state of the nodes. The first call creates the artists, later calls update them in place.
+        :param nodes: Nodes ordered by ID
+        """
+        from matplotlib.collections import LineCollection
+
+        states, positions = node_arrays(nodes, self.grid.P.dim)
+        known = ~np.isnan(positions).any(axis=1)
+        positions = positions[known, :2]
+        errors = np.stack((positions, self._coords[known]), axis=1)
+
+        if self._nodes_artist is None:
+            self.ax_true.add_collection(LineCollection(self.grid.edge_segments(), zorder=1))
+            self._nodes_artist = self.ax_true.scatter(*self._coords.T, c=self.STATE_COLORS[states], zorder=2)
+            self._errors_artist = LineCollection(errors, zorder=1)
+            self.ax_calculated.add_collection(self._errors_artist)
+            self._positions_artist = self.ax_calculated.scatter(*positions.T, c="r", zorder=2)
+            if self.labels:
+                for i, (x, y) in enumerate(self._coords.tolist()):
+                    self.ax_true.annotate(str(i), (x + .06, y + .06), zorder=3)
+            self._draw_calculated_labels(np.flatnonzero(known), positions)
+            return
+
+        self._nodes_artist.set_facecolors(self.STATE_COLORS[states])
+        self._errors_artist.set_segments(errors)
+        self._positions_artist.set_offsets(positions)
+        self._draw_calculated_labels(np.flatnonzero(known), positions)
+
+    def _draw_calculated_labels(self, ids: np.ndarray, positions: np.ndarray) -> None:
+        if not self.labels:
+            return
+        for artist in self._label_artists:
+            artist.remove()
+        self._label_artists = [self.ax_calculated.annotate(str(i), (x + .06, y + .06), zorder=3)
+                               for i, (x, y) in zip(ids.tolist(), positions.tolist())]
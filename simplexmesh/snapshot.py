@@ -0,0 +1,331 @@
+"""
+Compact binary snapshots of a simulation state, used to skip the grid setup, the hop tables
+and the propagation when only a later stage of the pipeline is being tested.
+
+A snapshot is a directory with a meta.json file and one .npy file per array.
+Arrays are loaded memory-mapped, so opening a snapshot is instant and several simulations
+restored from the same snapshot share the pages of the grid and hop tables.
+"""
+from __future__ import annotations
+
+import json
+from pathlib import Path
+from typing import Sequence
+
+import numpy as np
+
+import simplexmesh.node as node_module
+from simplexmesh.grid import Grid, Network, Point2D, Point3D
+from simplexmesh.node import Node, PriorityTargetStrategyNode, TargetNode
+from simplexmesh.solution import Solution, SolutionSet
+from simplexmesh.streams import RandomStreams
+from simplexmesh.wall_grid import WallGrid
+
+FORMAT_VERSION = 3
+
+
+def _to_csr(rows: Sequence[Sequence[int]], dtype=np.int32) -> tuple[np.ndarray, np.ndarray]:
+    indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+    np.cumsum([len(row) for row in rows], out=indptr[1:])
+    values = np.fromiter((x for row in rows for x in row), dtype=dtype, count=indptr[-1])
+    return indptr, values
+
+
+def _csr_rows(indptr: np.ndarray, values: np.ndarray) -> list[list]:
+    return [row.tolist() for row in np.split(np.asarray(values), np.asarray(indptr)[1:-1])]
+
+
+def _capture_priorities(nodes: Sequence[PriorityTargetStrategyNode]) -> dict[str, np.ndarray]:
+    """
+    :return: Arrays with the per-target counters of every node, -1 for a target missing in a counter,
+    and with the completed sets of the targets as fetched by every node
+    """
+    rows, counts = [], []
+    views, view_counts, completed = [], [], []
+    for node in nodes:
+        targets = sorted(set(node._common) | set(node._attempts) | set(node._stale) | set(node._counted)
+                         | set(node._anchor_targets))
+        counts.append(len(targets))
+        for target in targets:
+            rows.append((target, node._common.get(target, -1), node._attempts.get(target, -1),
+                         node._stale.get(target, -1), int(node._anchor_targets.get(target, -1)),
+                         *node._counted.get(target, (-1, -1))))
+        view_counts.append(len(node._views))
+        for target, view in sorted(node._views.items()):
+            views.append((target, view.completed_epoch, view.completed_version))
+            completed.append(sorted(view.completed))
+
+    rows = np.array(rows, dtype=np.int64).reshape(-1, 7)
+    views = np.array(views, dtype=np.int64).reshape(-1, 3)
+    arrays = {
+        "priority_salt": np.array([node._tiebreak_salt for node in nodes], dtype=np.int64),
+        "priority_indptr": np.concatenate(([0], np.cumsum(counts))).astype(np.int64),
+        "priority_target": rows[:, 0].astype(np.int32),
+        "priority_common": rows[:, 1].astype(np.int32),
+        "priority_attempts": rows[:, 2].astype(np.int32),
+        "priority_stale": rows[:, 3].astype(np.int32),
+        "priority_anchor": rows[:, 4].astype(np.int8),
+        "priority_counted": rows[:, 5:7],
+        "view_indptr": np.concatenate(([0], np.cumsum(view_counts))).astype(np.int64),
+        "view_target": views[:, 0].astype(np.int32),
+        "view_epoch": views[:, 1].astype(np.int32),
+        "view_version": views[:, 2],
+    }
+    arrays["view_completed_indptr"], arrays["view_completed_ids"] = _to_csr(completed)
+    return arrays
+
+
+class Snapshot:
+    """
+    State of a simulation stored as flat arrays:
+    - grid: node coordinates, CSR adjacency and hop count matrix,
+    - nodes: anchor flags, anchors, positions, known targets and hop level progress,
+      the latter stored as is rather than recomputed, so that a restored run continues exactly like the original,
+    - SolutionSets: one row per (node, target) set, with the solutions of all sets concatenated,
+    - PriorityTargetStrategyNode: the per-target counters and the fetched completed sets of the targets.
+    The root seed and the states of the node and measurement random streams are kept in the metadata.
+    """
+
+    def __init__(self, meta: dict, arrays: dict[str, np.ndarray]):
+        self.meta = meta
+        self.arrays = arrays
+
+    def __getitem__(self, item) -> np.ndarray:
+        return self.arrays[item]
+
+    @classmethod
+    def capture(cls, grid: Grid, nodes: Sequence[Node], meta: dict | None = None) -> Snapshot:
+        """
+        Converts the current state of the grid and the nodes into a snapshot.
+        :param meta: Additional JSON-serializable information to store, eg. the configuration
+        """
+        if grid.removed:
+            raise ValueError("Snapshots of networks which nodes left are not supported")
+        n = len(nodes)
+        dim = grid.P.dim
+        indptr, indices = grid.get_csr_adjacency()
+        arrays = {
+            "coords": grid.coords.copy(),
+            "indptr": indptr,
+            "indices": indices,
+            "is_anchor": np.array([node.is_anchor for node in nodes], dtype=bool),
+            "anchor_reached": np.array([node.anchor_reached for node in nodes], dtype=bool),
+            "hop_level": np.array([getattr(node, "hop_level", -1) for node in nodes], dtype=np.int32),
+            "positions": np.array([node.position.xyz if node.position is not None else [np.nan] * dim
+                                   for node in nodes], dtype=np.float64).reshape(n, dim),
+        }
+        if all(hasattr(node, "hop_row") for node in nodes):
+            hops = np.stack([node.hop_row for node in nodes])
+            arrays["hops"] = hops.astype(np.int16 if hops.max() < np.iinfo(np.int16).max else np.int32)
+
+        arrays["anchor_indptr"], arrays["anchor_ids"] = _to_csr([sorted(node.anchors) for node in nodes])
+        # In the order of completion, as other nodes fetch the completed targets by their position in the log
+        arrays["known_indptr"], arrays["known_ids"] = _to_csr([getattr(node, "_completed_log", ()) for node in nodes])
+        arrays["completed_epoch"] = np.array([getattr(node, "_completed_epoch", 0) for node in nodes], dtype=np.int32)
+        arrays["source_indptr"], arrays["source_ids"] = _to_csr(
+            [getattr(node, "current_target_source", []) for node in nodes])
+        arrays["hop_count_indptr"], arrays["hop_counts"] = _to_csr(
+            [getattr(node, "known_count_by_hop_level", []) for node in nodes])
+
+        set_counts, set_targets, set_exact, cached_values, cached_badness, cached_slots = [], [], [], [], [], []
+        set_finalized, set_confidence = [], []
+        solution_counts, values, badness, tags = [], [], [], []
+        for node in nodes:
+            set_counts.append(len(node._known))
+            for target, solution_set in node._known.items():
+                solutions = solution_set._solutions
+                cached = solution_set.get()
+                set_targets.append(target)
+                set_exact.append(solution_set.is_exact)
+                set_finalized.append(solution_set.finalized)
+                set_confidence.append(solution_set.confidence)
+                cached_values.append(np.nan if cached is None else float(cached))
+                cached_badness.append(-1 if cached is None else cached.badness)
+                cached_slots.append(next((i for i, sol in enumerate(solutions) if sol is cached), -1))
+                solution_counts.append(len(solutions))
+                for sol in solutions:
+                    values.append(float(sol))
+                    badness.append(sol.badness)
+                    tags.append([-1] * dim if sol.tag == -1 else sol.tag)
+
+        arrays["set_indptr"] = np.concatenate(([0], np.cumsum(set_counts))).astype(np.int64)
+        arrays["set_target"] = np.array(set_targets, dtype=np.int32)
+        arrays["set_is_exact"] = np.array(set_exact, dtype=bool)
+        arrays["set_finalized"] = np.array(set_finalized, dtype=bool)
+        arrays["set_confidence"] = np.array(set_confidence, dtype=np.float32)
+        arrays["set_cached_value"] = np.array(cached_values, dtype=np.float64)
+        arrays["set_cached_badness"] = np.array(cached_badness, dtype=np.float32)
+        arrays["set_cached_slot"] = np.array(cached_slots, dtype=np.int32)
+        arrays["solution_indptr"] = np.concatenate(([0], np.cumsum(solution_counts))).astype(np.int64)
+        arrays["solution_value"] = np.array(values, dtype=np.float64)
+        arrays["solution_badness"] = np.array(badness, dtype=np.float32)
+        arrays["solution_tag"] = np.array(tags, dtype=np.int32).reshape(-1, dim)
+        if n and all(isinstance(node, PriorityTargetStrategyNode) for node in nodes):
+            arrays.update(_capture_priorities(nodes))
+
+        meta = {
+            **(meta or {}),
+            "format_version": FORMAT_VERSION,
+            "grid_class": type(grid).__name__,
+            "node_class": type(nodes[0]).__name__ if n else None,
+            "dim": dim,
+            "n_nodes": n,
+            "grid_size": grid.grid_size,
+            "sd": grid.sd,
+            "seed": grid.streams.seed,
+            "rng_states": {
+                "nodes": [node.rng.bit_generator.state for node in nodes],
+                "measurement": {str(origin): rng.bit_generator.state for origin, rng in grid._measurement_rngs.items()},
+            },
+        }
+        return cls(meta, arrays)
+
+    def save(self, path) -> None:
+        """
+        :param path: Directory to write the snapshot to. Created if it does not exist.
+        """
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        for name, array in self.arrays.items():
+            np.save(path.joinpath(f"{name}.npy"), np.ascontiguousarray(array))
+        with open(path.joinpath("meta.json"), "w") as f:
+            json.dump(self.meta, f)
+
+    @classmethod
+    def load(cls, path, mmap_mode: str | None = "r") -> Snapshot:
+        """
+        :param path: Directory written by Snapshot.save
+        :param mmap_mode: Passed to numpy.load, None loads the arrays into memory
+        """
+        path = Path(path)
+        with open(path.joinpath("meta.json"), "r") as f:
+            meta = json.load(f)
+        if meta["format_version"] != FORMAT_VERSION:
+            raise ValueError(f"Unsupported snapshot format version {meta['format_version']}")
+        arrays = {file.stem: np.load(file, mmap_mode=mmap_mode) for file in path.glob("*.npy")}
+        return cls(meta, arrays)
+
+    def build_grid(self) -> Grid:
+        """
+        :return: A new grid with the saved placement, adjacency and hop tables, without running the setup
+        """
+        grid_class = WallGrid if self.meta["grid_class"] == WallGrid.__name__ else Grid
+        point_type = Point2D if self.meta["dim"] == 2 else Point3D
+        grid = grid_class(point_type, self.meta["n_nodes"], self.meta["grid_size"], self.meta["sd"],
+                          streams=RandomStreams(self.meta["seed"]))
+        grid.set_placement(self["coords"], self["indptr"], self["indices"], self.arrays.get("hops"))
+        for origin, state in self.meta["rng_states"]["measurement"].items():
+            grid.measurement_rng(int(origin)).bit_generator.state = state
+        return grid
+
+    def build_nodes(self, network: Network, grid: Grid, node_class: type[Node] | None = None) -> list[Node]:
+        """
+        Creates the nodes and fills them with the saved state.
+        :param network: Empty network to add the nodes to
+        :param grid: Grid created by build_grid
+        :param node_class: Class of the nodes, the saved one by default
+        :return: List of nodes ordered by ID
+        """
+        node_class = node_class or getattr(node_module, self.meta["node_class"])
+        anchors = _csr_rows(self["anchor_indptr"], self["anchor_ids"])
+        known = _csr_rows(self["known_indptr"], self["known_ids"])
+        sources = _csr_rows(self["source_indptr"], self["source_ids"])
+        hop_counts = _csr_rows(self["hop_count_indptr"], self["hop_counts"])
+        hop_levels = self["hop_level"].tolist()
+        completed_epochs = self["completed_epoch"].tolist()
+        anchor_flags = self["anchor_reached"].tolist()
+        positions = np.asarray(self["positions"])
+        rng_states = self.meta["rng_states"]["nodes"]
+
+        nodes = []
+        for i in range(self.meta["n_nodes"]):
+            node = node_class(i, network, grid)
+            node.rng.bit_generator.state = rng_states[i]
+            if self["is_anchor"][i]:
+                node.set_is_anchor()
+                node.set_logging(False)
+            elif not np.isnan(positions[i]).any():
+                node.position = grid.P(tuple(positions[i].tolist()))
+            node.anchor_reached = anchor_flags[i]
+            node.anchors = {node.get_target(a): grid.get_true_position(a) for a in anchors[i]}
+            node.restore_progress(known[i], sources[i], hop_levels[i], hop_counts[i])
+            if hasattr(node, "_completed_epoch"):
+                node._completed_epoch = completed_epochs[i]
+            nodes.append(node)
+
+        self._fill_solution_sets(nodes)
+        if "priority_indptr" in self.arrays:
+            self._fill_priorities(nodes)
+        return nodes
+
+    def _fill_solution_sets(self, nodes: list[Node]) -> None:
+        set_indptr = self["set_indptr"].tolist()
+        targets = self["set_target"].tolist()
+        exact = self["set_is_exact"].tolist()
+        finalized = self["set_finalized"].tolist()
+        confidence = self["set_confidence"].tolist()
+        cached_values = self["set_cached_value"].tolist()
+        cached_badness = self["set_cached_badness"].tolist()
+        cached_slots = self["set_cached_slot"].tolist()
+        solution_indptr = self["solution_indptr"].tolist()
+        values = self["solution_value"].tolist()
+        badness = self["solution_badness"].tolist()
+        tags = self["solution_tag"].tolist()
+
+        settings = SolutionSet()
+        for node in nodes:
+            for s in range(set_indptr[node._id], set_indptr[node._id + 1]):
+                lo, hi = solution_indptr[s], solution_indptr[s + 1]
+                solutions = [Solution(values[k], badness[k], gate=None if tags[k][0] == -1 else tags[k])
+                             for k in range(lo, hi)]
+                if cached_slots[s] >= 0:
+                    cached = solutions[cached_slots[s]]
+                elif cached_values[s] == cached_values[s]:
+                    cached = Solution(cached_values[s], badness=cached_badness[s], is_exact=exact[s])
+                else:
+                    cached = None
+                target = node.get_target(targets[s])
+                node._known[target] = SolutionSet.restore(solutions, cached, exact[s], finalized[s], confidence[s],
+                                                         settings)
+                node.index_gates(target, solutions)
+                if cached is not None:
+                    node._edge_stamps[target] = 1
+
+    def _fill_priorities(self, nodes: list[PriorityTargetStrategyNode]) -> None:
+        """
+        Restores the counters and the fetched completed sets of the priority strategy. The targets holding
+        a node are found from the completed sets, and the queue is built on first use from the counters.
+        """
+        salts = self["priority_salt"].tolist()
+        indptr = self["priority_indptr"].tolist()
+        targets = self["priority_target"].tolist()
+        common = self["priority_common"].tolist()
+        attempts = self["priority_attempts"].tolist()
+        stale = self["priority_stale"].tolist()
+        anchor = self["priority_anchor"].tolist()
+        counted = self["priority_counted"].tolist()
+        view_indptr = self["view_indptr"].tolist()
+        view_targets = self["view_target"].tolist()
+        view_epochs = self["view_epoch"].tolist()
+        view_versions = self["view_version"].tolist()
+        completed = _csr_rows(self["view_completed_indptr"], self["view_completed_ids"])
+
+        for node in nodes:
+            node._tiebreak_salt = salts[node._id]
+            for k in range(indptr[node._id], indptr[node._id + 1]):
+                target = targets[k]
+                for counter, value in ((node._common, common[k]), (node._attempts, attempts[k]),
+                                       (node._stale, stale[k])):
+                    if value >= 0:
+                        counter[target] = value
+                if anchor[k] >= 0:
+                    node._anchor_targets[target] = bool(anchor[k])
+                if counted[k][0] >= 0:
+                    node._counted[target] = tuple(counted[k])
+            for k in range(view_indptr[node._id], view_indptr[node._id + 1]):
+                view = node._get_view(view_targets[k])
+                view.completed_epoch = view_epochs[k]
+                view.completed_version = view_versions[k]
+                view.completed = set(completed[k])
+                for completed_id in completed[k]:
+                    node._holders.setdefault(completed_id, set()).add(view_targets[k])
@@ -1,6 +1,12 @@
 from __future__ import annotations
 import bisect
+from collections import OrderedDict
+
+import numpy as np
+
 from simplexmesh.config import config
+from simplexmesh.metrics import metrics
+from simplexmesh.modes import ModeFinder, get_mode_finder
 
 
 class Solution(float):
@@ -9,8 +15,8 @@ class Solution(float):
     See description of SolutionSet for more information.
     """
     @staticmethod
-    def get_tag(gate: tuple[int]):
-        return 2*min(gate) + 3*max(gate)
+    def get_tag(gate: tuple[int, ...]):
+        return tuple(sorted(int(node_id) for node_id in gate))
 
     def __new__(cls, value, badness=-1, is_exact=False, gate=None):
         """
@@ -21,7 +27,7 @@ class Solution(float):
         The bigger the badness, the more inaccurate the solution can be.
         :param is_exact: Used to fix the solution so that it cannot be overwritten by others.
         Use this to mark the solutions derived from direct measurements.
-        :param gate: Tuple of two node IDs forming the gate used to create this solution.
+        :param gate: Tuple of two (2D) or three (3D) node IDs forming the gate used to create this solution.
         """
         x = float.__new__(cls, value)
         x.badness = badness
@@ -46,11 +52,12 @@ class SolutionSet:
 
     Due to the solutions being inaccurate, a more advanced metric has to be defined
     in order to extract the repeating one, especially if the incorrect ones lie close to the correct ones.
-    """
+    The metric is pluggable, see simplexmesh.modes.
 
-    __deriv_filter_size = config["solution_set"]["deriv_filter_size"]
-    __deriv_filter_sum_thr = config["solution_set"]["deriv_filter_avg_threshold"] * __deriv_filter_size
-    __max_set_length = config["solution_set"]["max_set_length"]
+    Once enough gates agree on the picked value, or the set grows past its maximal length, the set is finalized:
+    it rejects all further solutions and its value does not change anymore. The confidence of the value is the share
+    of the gates which have a solution close to it.
+    """
 
     def __init__(self, exact_value=None):
         """
@@ -59,27 +66,76 @@ class SolutionSet:
         """
         self._solutions: list[Solution] = []
         self._cached_value: Solution | None = None
+        self._mode_finder = get_mode_finder()
+        self.__max_set_length = config["solution_set"]["max_set_length"]
         self.SOLUTION_CUTOFF = config["node"]["max_reach"] * config["solution_set"]["max_reach_constant"]
         self.MIN_LENGTH_TIMES_FILTER = config["solution_set"]["min_set_length_times_filter"]
+        self.__finalize_min_gates = config["solution_set"]["finalize_min_gates"]
+        self.__finalize_confidence = config["solution_set"]["finalize_confidence"]
+        self.__finalize_tolerance = config["solution_set"]["finalize_tolerance"]
+        """In 3D both roots of a gate are kept, in 2D the second one is rejected as a duplicate of the first"""
+        self.__keep_both_roots = config["grid"]["dim"] == 3
         self.is_exact = False
+        self.finalized = False
+        """Share of the gates with a solution close to the picked value, 1 for exact values"""
+        self.confidence = 0.0
 
         if exact_value is not None:
             self.is_exact = True
+            self.finalized = True
+            self.confidence = 1.0
             self._cached_value = Solution(exact_value, is_exact=True, badness=0)
 
 
-    def _add(self, solution: Solution) -> None:
+    @classmethod
+    def restore(cls, solutions: list[Solution], cached_value: Solution | None, is_exact: bool,
+                finalized: bool = False, confidence: float = 0.0, settings: SolutionSet | None = None) -> SolutionSet:
+        """
+        Recreates a SolutionSet from saved contents, without picking the value again.
+        :param solutions: Sorted list of the non-exact solutions
+        :param cached_value: The picked solution, or the exact one
+        :param is_exact: Whether the value comes from a direct measurement
+        :param finalized: Whether the set rejects further solutions
+        :param confidence: Confidence of the picked value
+        :param settings: Empty SolutionSet to copy the configuration from, so that restoring many sets
+        does not read the configuration for every one of them
+        """
+        if settings is None:
+            solution_set = cls()
+        else:
+            solution_set = cls.__new__(cls)
+            solution_set.__dict__.update(settings.__dict__)
+        solution_set._solutions = solutions
+        solution_set._cached_value = cached_value
+        solution_set.is_exact = is_exact
+        solution_set.finalized = finalized or is_exact
+        solution_set.confidence = confidence
+        return solution_set
+
+    def _add(self, solution: Solution, used_tags: set | None = None) -> None:
+        """
+        :param used_tags: Tags of the gates already used for this edge, taken from the current solutions if None.
+        Both solutions of a single gate share a tag, so in 3D extend() passes the tags from before the call
+        in order not to reject the second solution.
+        """
         if solution.is_exact:
             self.is_exact = True
+            self.finalized = True
+            self.confidence = 1.0
             self._cached_value = solution
             return
 
         if solution < self.SOLUTION_CUTOFF:
+            if metrics.enabled:
+                metrics.count("solutions_below_cutoff")
             return
 
-        for sol in self._solutions:
-            if sol.tag == solution.tag and sol.tag != -1:
-                return
+        if used_tags is None:
+            used_tags = {sol.tag for sol in self._solutions}
+        if solution.tag != -1 and solution.tag in used_tags:
+            if metrics.enabled:
+                metrics.count("duplicate_tag_rejections")
+            return
 
         bisect.insort_right(self._solutions, solution)
 
@@ -89,26 +145,54 @@ class SolutionSet:
         The set is a sorted list which enables the value-picking process to be more effective.
         :param solution: The solution to be added
         :return: True if a correct solution was picked thanks to the addition of the new one, False otherwise.
+        False for a finalized set, which rejects the solution.
         """
-        if len(self._solutions) > self.__max_set_length:
-            return True
+        if self.finalized and not solution.is_exact:
+            if metrics.enabled:
+                metrics.count("solutions_after_finalized")
+            return False
         self._add(solution)
         return self.update_cached_value()
 
-    def extend(self, solutions: list[Solution]) -> bool:
+    def extend(self, solutions: list[Solution], update: bool = True) -> bool:
         """
         Puts many new solutions into the SolutionSet.
         The set is a sorted list which enables the value-picking process to be more effective.
         :param solutions: The solution to be added
+        :param update: Whether to pick the value. If not, it is left to update_many, called for many sets at once.
         :return: True if a correct solution was picked thanks to the addition of the new ones, False otherwise.
+        False for a finalized set, which rejects the solutions.
         """
-        if len(self._solutions) > self.__max_set_length:
-            return True
+        if self.finalized:
+            if metrics.enabled:
+                metrics.count("solutions_after_finalized", len(solutions))
+            return False
+        used_tags = {sol.tag for sol in self._solutions} if self.__keep_both_roots else None
         for sol in solutions:
-            self._add(sol)
-        return self.update_cached_value()
+            self._add(sol, used_tags)
+        return self.update_cached_value() if update else False
 
 
+    def discard_gate_node(self, node_id: int) -> bool:
+        """
+        Removes the solutions computed through gates containing a node, eg. one which moved or left the network,
+        and picks the value again from the remaining ones.
+        :param node_id: ID of the node
+        :return: True if the picked value was among the removed solutions
+        """
+        if self.is_exact:
+            return False
+        kept = [sol for sol in self._solutions if sol.tag == -1 or node_id not in sol.tag]
+        if len(kept) == len(self._solutions):
+            return False
+        self._solutions = kept
+        self.finalized = False
+        if self._cached_value is None or any(sol is self._cached_value for sol in kept):
+            return False
+        self._cached_value = None
+        self.update_cached_value()
+        return True
+
     def get(self) -> Solution | None:
         """
         :return: True length of the edge if it's available, None otherwise
@@ -119,23 +203,134 @@ class SolutionSet:
         if self.is_exact:
             return False
 
-        if len(self._solutions) < 2 * self.__deriv_filter_size:
+        must_choose = len(self._solutions) > self.__max_set_length
+        index = self._mode_finder.pick(self._solutions, must_choose)
+        if index is None:
             return False
+        self._cached_value = self._solutions[index]
+        self.update_confidence(must_choose)
+        return True
 
-        results = [sol for sol in self._solutions]
-        deriv = [results[i + 1] - results[i] for i in range(len(results) - 1)]
-        delta = self.__deriv_filter_size // 2
-        deriv_sum = [sum(deriv[i-delta:i+delta]) for i in range(delta, len(deriv) - delta)]
+    @staticmethod
+    def update_many(solution_sets: list[SolutionSet]) -> list[bool]:
+        """
+        Picks the values of many sets as update_cached_value does, with a single vectorized call of the mode finder.
+        :return: For every set, whether a value was picked
+        """
+        ready = [False] * len(solution_sets)
+        by_finder: dict[ModeFinder, list[int]] = {}
+        for i, solution_set in enumerate(solution_sets):
+            finder = solution_set._mode_finder
+            if not solution_set.is_exact and not solution_set.finalized \
+                    and len(solution_set._solutions) >= finder.min_solutions:
+                by_finder.setdefault(finder, []).append(i)
+
+        for finder, indices in by_finder.items():
+            sets = [solution_sets[i] for i in indices]
+            lengths = np.array([len(solution_set._solutions) for solution_set in sets])
+            width = int(lengths.max())
+            padding = [np.nan] * width
+            values = np.array([solution_set._solutions + padding[len(solution_set._solutions):]
+                               for solution_set in sets], dtype=np.float64)
+            badness = np.array([[sol.badness for sol in solution_set._solutions] + padding[len(solution_set._solutions):]
+                                for solution_set in sets], dtype=np.float64)
+            must_choose = lengths > np.array([solution_set.__max_set_length for solution_set in sets])
+
+            picked = finder.pick_many(values, badness, lengths, must_choose).tolist()
+            for i, solution_set, index, must in zip(indices, sets, picked, must_choose.tolist()):
+                if index < 0:
+                    continue
+                solution_set._cached_value = solution_set._solutions[index]
+                solution_set.update_confidence(must)
+                ready[i] = True
+        return ready
+
+    def update_confidence(self, must_finalize: bool = False) -> None:
+        """
+        Scores the picked value by the share of the gates with a solution close to it,
+        and finalizes the set if enough of them agree.
+        :param must_finalize: Finalize regardless of the score, eg. when the set is full
+        """
+        value, tolerance = self._cached_value, self.__finalize_tolerance
+        tags = {sol.tag for sol in self._solutions}
+        lo = bisect.bisect_left(self._solutions, value - tolerance)
+        hi = bisect.bisect_right(self._solutions, value + tolerance)
+        agreeing = {sol.tag for sol in self._solutions[lo:hi]}
+        self.confidence = len(agreeing) / len(tags)
+        if must_finalize or (len(tags) >= self.__finalize_min_gates and self.confidence >= self.__finalize_confidence):
+            self.finalized = True
+            if metrics.enabled:
+                metrics.count("sets_finalized")
+
+    def finalize_with(self, value: Solution, confidence: float) -> None:
+        """
+        Takes over the value of the other endpoint of the edge, which finalized its own set of the same edge.
+        """
+        self._cached_value = Solution(value, badness=value.badness)
+        self.confidence = confidence
+        self.finalized = True
 
-        deriv_sum_minimum = min(deriv_sum)
-        must_choose = len(self._solutions) > self.__max_set_length
-        if not must_choose and deriv_sum_minimum > self.__deriv_filter_sum_thr:
-            return False
 
-        deriv_sum_min_index = deriv_sum.index(deriv_sum_minimum)
-        self._cached_value = self._solutions[deriv_sum_min_index + delta]
+class SolverCache:
+    """
+    Least recently used cache of the solver inputs a node already computed solutions for.
+
+    The key of an entry is the target, (owner, other node, stamp) of the edges to and within the gate and the stamps
+    of the edges from the gate nodes to the target, as read from the local edge stamps and the remote views.
+    The stamps change with the values, so a key seen before means the solver would return the same solutions
+    for the same gate tag. Those were already added to the SolutionSet and sent to the target, where they would only
+    be rejected as duplicates, so a hit skips all of it.
+    Only the keys are kept, holding on to the solutions would keep the rejected ones alive for the garbage collector.
+    """
+
+    def __init__(self, size: int):
+        """
+        :param size: Maximal number of entries, the least recently used one is evicted first
+        """
+        self.size = size
+        self._entries: OrderedDict[tuple, None] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def key(target: int, gate_versions: tuple[tuple[int, int, int], ...], target_stamps: tuple[int, ...]) -> tuple:
+        """
+        :param gate_versions: (owner, other node, stamp) of the edges to and within the gate, sorted
+        :param target_stamps: Stamps of the edges from the gate nodes to the target, in the order of the gate tag
+        """
+        return int(target), gate_versions, target_stamps
+
+    def seen(self, key: tuple) -> bool:
+        """
+        :return: True if solutions were already computed for the key
+        """
+        if key not in self._entries:
+            self.misses += 1
+            if metrics.enabled:
+                metrics.count("solver_cache_misses")
+            return False
+        self._entries.move_to_end(key)
+        self.hits += 1
+        if metrics.enabled:
+            metrics.count("solver_cache_hits")
         return True
 
+    def add(self, key: tuple) -> None:
+        self._entries[key] = None
+        if len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    def discard_node(self, node_id: int) -> None:
+        """
+        Drops the entries of a target and of all gates containing a node, eg. one which moved or left the network.
+        """
+        for key in [key for key in self._entries
+                    if key[0] == node_id or any(node_id in version[:2] for version in key[1])]:
+            del self._entries[key]
+
 
 if __name__ == '__main__':
     import random
@@ -0,0 +1,462 @@
+"""
+Vectorized spatial queries on arrays of coordinates, shared by the grids.
+"""
+from __future__ import annotations
+
+import itertools
+
+import numpy as np
+
+
+def _expand_ranges(starts: np.ndarray, counts: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Expands a batch of integer ranges [start, start + count) into flat arrays.
+    :return: Index of the range each element belongs to, and the elements themselves
+    """
+    owner = np.repeat(np.arange(len(starts)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return owner, starts[owner] + offsets
+
+
+def _cell_keys(cells: np.ndarray, strides: np.ndarray) -> np.ndarray:
+    return (cells * strides).sum(axis=1)
+
+
+def in_reach_pairs(coords: np.ndarray, reach: float) -> np.ndarray:
+    """
+    Finds all pairs of points not further apart than the reach, using a uniform grid of cells of size reach.
+    :param coords: Array of shape (n_points, dim)
+    :param reach: Maximal distance between points of a pair
+    :return: Array of shape (n_pairs, 2) with point indices, the first one always smaller than the second
+    """
+    n, dim = coords.shape
+    if n == 0:
+        return np.zeros((0, 2), dtype=np.int64)
+
+    cells = np.floor((coords - coords.min(axis=0)) / reach).astype(np.int64) + 1
+    extent = cells.max(axis=0) + 2
+    strides = np.cumprod(np.concatenate(([1], extent[:-1])))
+    keys = _cell_keys(cells, strides)
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+
+    pairs = []
+    for offset in itertools.product((-1, 0, 1), repeat=dim):
+        neighbor_keys = keys + np.dot(offset, strides)
+        lo = np.searchsorted(sorted_keys, neighbor_keys, side="left")
+        hi = np.searchsorted(sorted_keys, neighbor_keys, side="right")
+        i, j = _expand_ranges(lo, hi - lo)
+        j = order[j]
+        keep = i < j
+        pairs.append(np.stack((i[keep], j[keep]), axis=1))
+
+    pairs = np.concatenate(pairs)
+    d2 = ((coords[pairs[:, 0]] - coords[pairs[:, 1]]) ** 2).sum(axis=1)
+    pairs = pairs[d2 <= reach * reach]
+    return pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+
+
+def segments_intersect_rects(p0: np.ndarray, p1: np.ndarray, rects: np.ndarray) -> np.ndarray:
+    """
+    Batched segment / axis-aligned rectangle intersection test (slab method).
+    Segments only touching the boundary of a rectangle are not counted as intersecting.
+    :param p0: Segment start points, shape (k, 2)
+    :param p1: Segment end points, shape (k, 2)
+    :param rects: Rectangles as rows of (x, y, width, height), shape (k, 4)
+    :return: Boolean array of shape (k,)
+    """
+    d = p1 - p0
+    lower = rects[:, :2]
+    upper = rects[:, :2] + rects[:, 2:]
+    t_min = np.zeros(len(p0))
+    t_max = np.ones(len(p0))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t1 = (lower - p0) / d
+        t2 = (upper - p0) / d
+    parallel = d == 0
+    inside_slab = (p0 > lower) & (p0 < upper)
+    t_near = np.where(parallel, np.where(inside_slab, -np.inf, np.inf), np.minimum(t1, t2))
+    t_far = np.where(parallel, np.where(inside_slab, np.inf, -np.inf), np.maximum(t1, t2))
+    t_min = np.maximum(t_min, t_near.max(axis=1))
+    t_max = np.minimum(t_max, t_far.min(axis=1))
+    return t_min < t_max
+
+
+class RectIndex:
+    """
+    Uniform grid over a set of axis-aligned rectangles, used to find the rectangles
+    crossed by many short segments at once without testing every segment against every rectangle.
+    """
+
+    def __init__(self, rects: np.ndarray, cell_size: float):
+        """
+        :param rects: Rectangles as rows of (x, y, width, height)
+        :param cell_size: Size of a grid cell. Works best around the typical segment length.
+        """
+        self.rects = np.asarray(rects, dtype=np.float64).reshape(-1, 4)
+        self.cell_size = cell_size
+        self.origin = self.rects[:, :2].min(axis=0) if len(self.rects) else np.zeros(2)
+        far = (self.rects[:, :2] + self.rects[:, 2:]).max(axis=0) if len(self.rects) else np.zeros(2)
+        self.shape = (np.floor((far - self.origin) / cell_size).astype(np.int64) + 1)
+
+        lo, hi = self._cell_range(self.rects[:, :2], self.rects[:, :2] + self.rects[:, 2:])
+        rect_ids, cells = self._cells_in_ranges(lo, hi)
+        order = np.argsort(cells, kind="stable")
+        self._cell_rects = rect_ids[order]
+        self._cell_starts = np.searchsorted(cells[order], np.arange(self.shape.prod() + 1))
+
+    def _cell_range(self, lower: np.ndarray, upper: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        lo = np.floor((lower - self.origin) / self.cell_size).astype(np.int64)
+        hi = np.floor((upper - self.origin) / self.cell_size).astype(np.int64)
+        return np.clip(lo, 0, self.shape - 1), np.clip(hi, 0, self.shape - 1)
+
+    def _cells_in_ranges(self, lo: np.ndarray, hi: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        :return: For every cell inside every box of cells [lo, hi]: index of the box and flat index of the cell
+        """
+        size = hi - lo + 1
+        owner, flat = _expand_ranges(np.zeros(len(lo), dtype=np.int64), size.prod(axis=1))
+        x = lo[owner, 0] + flat % size[owner, 0]
+        y = lo[owner, 1] + flat // size[owner, 0]
+        return owner, y * self.shape[0] + x
+
+    def candidates(self, p0: np.ndarray, p1: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Finds segment / rectangle pairs which share at least one grid cell.
+        :return: Arrays of segment indices and rectangle indices, with no duplicate pairs
+        """
+        if len(self.rects) == 0 or len(p0) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+        outside = (np.maximum(p0, p1) < self.origin).any(axis=1) | \
+                  (np.minimum(p0, p1) > self.origin + self.shape * self.cell_size).any(axis=1)
+        segments = np.nonzero(~outside)[0]
+        lo, hi = self._cell_range(np.minimum(p0, p1)[segments], np.maximum(p0, p1)[segments])
+        cell_owner, cells = self._cells_in_ranges(lo, hi)
+
+        starts, ends = self._cell_starts[cells], self._cell_starts[cells + 1]
+        slot_owner, rect_slots = _expand_ranges(starts, ends - starts)
+        segment_ids = segments[cell_owner[slot_owner]]
+        rect_ids = self._cell_rects[rect_slots]
+
+        unique = np.unique(segment_ids * len(self.rects) + rect_ids)
+        return unique // len(self.rects), unique % len(self.rects)
+
+    def count_crossings(self, p0: np.ndarray, p1: np.ndarray) -> np.ndarray:
+        """
+        Counts the rectangles crossed by every segment.
+        :param p0: Segment start points, shape (k, 2)
+        :param p1: Segment end points, shape (k, 2)
+        :return: Integer array of shape (k,)
+        """
+        segment_ids, rect_ids = self.candidates(p0, p1)
+        hits = segments_intersect_rects(p0[segment_ids], p1[segment_ids], self.rects[rect_ids])
+        return np.bincount(segment_ids[hits], minlength=len(p0))
+
+    def contains(self, points: np.ndarray) -> np.ndarray:
+        """
+        :param points: Array of shape (k, 2)
+        :return: Boolean array telling whether each point lies strictly inside any rectangle
+        """
+        segment_ids, rect_ids = self.candidates(points, points)
+        rects = self.rects[rect_ids]
+        p = points[segment_ids]
+        inside = ((p > rects[:, :2]) & (p < rects[:, :2] + rects[:, 2:])).all(axis=1)
+        result = np.zeros(len(points), dtype=bool)
+        result[segment_ids[inside]] = True
+        return result
+
+
+class PointIndex:
+    """
+    Uniform grid of cells holding point IDs, updated one point at a time.
+    Finds the points in reach of a single point by looking at the neighboring cells only,
+    so that a node joining, leaving or moving costs time proportional to the local density, not to the network size.
+    """
+
+    def __init__(self, reach: float):
+        """
+        :param reach: Maximal distance of the queried points, used as the cell size
+        """
+        self.reach = reach
+        self._cells: dict[tuple[int, ...], set[int]] = {}
+
+    def _cell(self, point: np.ndarray) -> tuple[int, ...]:
+        return tuple(np.floor(np.asarray(point) / self.reach).astype(np.int64).tolist())
+
+    def insert(self, id: int, point: np.ndarray) -> None:
+        self._cells.setdefault(self._cell(point), set()).add(id)
+
+    def remove(self, id: int, point: np.ndarray) -> None:
+        cell = self._cell(point)
+        self._cells[cell].discard(id)
+        if not self._cells[cell]:
+            del self._cells[cell]
+
+    def query(self, point: np.ndarray, coords: np.ndarray) -> np.ndarray:
+        """
+        :param point: Coordinates of the queried point
+        :param coords: Coordinates of all points, indexed by ID
+        :return: Sorted IDs of the points not further from the point than the reach, including the point itself
+        """
+        center = self._cell(point)
+        ids = [id for offset in itertools.product((-1, 0, 1), repeat=len(center))
+               for id in self._cells.get(tuple(c + o for c, o in zip(center, offset)), ())]
+        ids = np.array(sorted(ids), dtype=np.int64)
+        if len(ids) == 0:
+            return ids
+        d2 = ((coords[ids] - point) ** 2).sum(axis=1)
+        return ids[d2 <= self.reach * self.reach]
+
+
+def poisson_disk_sample(rng: np.random.Generator, size: float, dim: int, min_distance: float,
+                        n_required: int | None = None, accept=None, max_trials: int = 30,
+                        cell_fraction: float = 0.3) -> np.ndarray:
+    """
+    Samples points in the cube [0, size)^dim such that no two are closer than min_distance.
+
+    Parallel dart throwing on a background grid with cells of size min_distance / sqrt(dim), so that every
+    cell holds at most one point. Cells are processed in 3^dim phases, and cells of the same phase are far
+    enough apart that their candidates can be tested against the already placed points all at once.
+    Phases are visited in a random order in every sweep, and only a random fraction of the cells is tried at once,
+    so that no phase gets to fill its cells first and the points are about as uniform as with sequential dart throwing.
+    :param rng: Random generator used for the candidates
+    :param size: Size of a single dimension of the cube
+    :param dim: Number of dimensions
+    :param min_distance: Minimal distance between two points
+    :param n_required: Stop after the first sweep of all phases which brings at least this many points.
+    If None, all trials are run, which gives a nearly maximal packing.
+    :param accept: Optional vectorized condition, takes an array of candidates of shape (k, dim)
+    and returns a boolean array telling which of them may be placed
+    :param max_trials: Expected number of candidates tried in every cell
+    :param cell_fraction: Probability of an empty cell to be tried in a sweep
+    :return: Array of shape (n_points, dim) with the points in the order they were placed
+    """
+    cell = min_distance / np.sqrt(dim)
+    shape = tuple([int(np.ceil(size / cell))] * dim)
+    pad = 2
+    points = np.full(tuple(s + 2 * pad for s in shape) + (dim,), np.nan)
+    interior = tuple(slice(pad, pad + s) for s in shape)
+    # Cells whose closest corners are at least min_distance apart can never hold conflicting points
+    offsets = [np.array(o) for o in itertools.product(range(-pad, pad + 1), repeat=dim)
+               if any(o) and sum(max(abs(x) - 1, 0) ** 2 for x in o) * cell * cell < min_distance * min_distance]
+    phases = [np.stack(np.meshgrid(*[np.arange(p, s, 3) for p, s in zip(phase, shape)], indexing="ij"),
+                       axis=-1).reshape(-1, dim)
+              for phase in itertools.product(range(3), repeat=dim)]
+    placed = []
+    n_placed = 0
+    d2_min = min_distance * min_distance
+
+    for _ in range(int(np.ceil(max_trials / cell_fraction))):
+        # A phase filled first would win most of its cells and leave the points striped by the phase,
+        # so the order of the phases is shuffled and only a part of the empty cells gets a candidate at once
+        for k in rng.permutation(len(phases)):
+            phase_cells = phases[k]
+            empty = np.isnan(points[interior][tuple(phase_cells.T)][:, 0])
+            empty &= rng.random(len(empty)) < cell_fraction
+            cells = phase_cells[empty]
+            if len(cells) == 0:
+                continue
+            candidates = (cells + rng.random(cells.shape)) * cell
+            valid = (candidates < size).all(axis=1)
+            if accept is not None:
+                valid &= accept(candidates)
+
+            padded = cells + pad
+            for offset in offsets:
+                neighbor = points[tuple((padded + offset).T)]
+                d2 = ((neighbor - candidates) ** 2).sum(axis=1)
+                valid &= ~(d2 < d2_min)
+
+            points[tuple(padded[valid].T)] = candidates[valid]
+            placed.append(candidates[valid])
+            n_placed += valid.sum()
+
+        if n_required is not None and n_placed >= n_required:
+            break
+
+    if len(placed) == 0:
+        return np.zeros((0, dim))
+    return np.concatenate(placed)
+
+
+def csr_adjacency(pairs: np.ndarray, n: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Builds a symmetric adjacency structure in the compressed sparse row layout.
+    :param pairs: Array of shape (n_pairs, 2) of connected point indices
+    :param n: Number of points
+    :return: indptr, indices - neighbors of point i are indices[indptr[i]:indptr[i + 1]], sorted ascending
+    """
+    src = np.concatenate((pairs[:, 0], pairs[:, 1]))
+    dst = np.concatenate((pairs[:, 1], pairs[:, 0]))
+    order = np.lexsort((dst, src))
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=n), out=indptr[1:])
+    return indptr, dst[order]
+
+
+def bfs_hop_counts(indptr: np.ndarray, indices: np.ndarray, origin: int,
+                   lengths: np.ndarray | None = None) -> np.ndarray:
+    """
+    Breadth-first search over a CSR adjacency, expanding a whole level at once.
+    :param lengths: Number of entries of every row, for layouts with spare slots between the rows,
+    in which case indptr holds only the start of every row
+    :return: Array with the minimal number of hops from the origin to every point, -1 for unreachable points
+    """
+    hops = np.full(len(indptr) - 1 if lengths is None else len(lengths), -1, dtype=np.int32)
+    hops[origin] = 0
+    frontier = np.array([origin])
+    level = 0
+    while len(frontier) > 0:
+        level += 1
+        starts = indptr[frontier]
+        _, slots = _expand_ranges(starts, indptr[frontier + 1] - starts if lengths is None else lengths[frontier])
+        neighbors = indices[slots]
+        frontier = np.unique(neighbors[hops[neighbors] < 0])
+        hops[frontier] = level
+    return hops
+
+
+class SlackAdjacency:
+    """
+    Symmetric adjacency in a CSR layout where every row keeps spare slots, patched in place as edges come and go.
+    A full row is moved to the end of the layout with twice the room, and the layout is compacted only once most
+    of it is left behind by moved rows, so that changing an edge costs time proportional to the degree, amortized.
+    """
+
+    def __init__(self, indptr: np.ndarray, indices: np.ndarray):
+        """
+        :param indptr: CSR row pointers, as returned by csr_adjacency
+        :param indices: CSR column indices
+        """
+        self.n = len(indptr) - 1
+        self._starts = np.zeros(0, dtype=np.int64)
+        self._lengths = np.zeros(0, dtype=np.int64)
+        self._capacities = np.zeros(0, dtype=np.int64)
+        self._slots = np.zeros(0, dtype=np.int64)
+        self._pack(np.asarray(indptr, dtype=np.int64), np.asarray(indices, dtype=np.int64))
+
+    def _pack(self, indptr: np.ndarray, indices: np.ndarray):
+        """
+        Lays the rows out one after another, every row with as many spare slots as entries, at least 2.
+        """
+        lengths = np.diff(indptr)
+        capacities = np.maximum(2 * lengths, 2)
+        rows = max(2 * self.n, 16)
+        self._starts = np.zeros(rows, dtype=np.int64)
+        self._lengths = np.zeros(rows, dtype=np.int64)
+        self._capacities = np.zeros(rows, dtype=np.int64)
+        np.cumsum(capacities[:-1], out=self._starts[1:self.n])
+        self._lengths[:self.n] = lengths
+        self._capacities[:self.n] = capacities
+        self._end = int(capacities.sum())
+        self._unused = 0
+        self._slots = np.zeros(max(2 * self._end, 64), dtype=np.int64)
+        _, slots = _expand_ranges(self._starts[:self.n], lengths)
+        self._slots[slots] = indices
+
+    def _allocate(self, capacity: int) -> int:
+        """
+        :return: Start of a new range of slots at the end of the layout, which grows geometrically
+        """
+        if self._end + capacity > len(self._slots):
+            slots = np.zeros(2 * (self._end + capacity), dtype=np.int64)
+            slots[:self._end] = self._slots[:self._end]
+            self._slots = slots
+        start = self._end
+        self._end += capacity
+        return start
+
+    def add_row(self) -> int:
+        """
+        Adds a row without entries for a new point.
+        :return: ID of the new point
+        """
+        if self.n == len(self._starts):
+            for name in ("_starts", "_lengths", "_capacities"):
+                grown = np.zeros(2 * self.n, dtype=np.int64)
+                grown[:self.n] = getattr(self, name)
+                setattr(self, name, grown)
+        self._starts[self.n] = self._allocate(2)
+        self._lengths[self.n] = 0
+        self._capacities[self.n] = 2
+        self.n += 1
+        return self.n - 1
+
+    def _insert(self, i: int, j: int):
+        length = int(self._lengths[i])
+        if length == self._capacities[i]:
+            start = self._allocate(2 * length)
+            self._slots[start:start + length] = self._slots[self._starts[i]:self._starts[i] + length]
+            self._unused += length
+            self._starts[i] = start
+            self._capacities[i] = 2 * length
+        self._slots[self._starts[i] + length] = j
+        self._lengths[i] = length + 1
+
+    def _delete(self, i: int, j: int):
+        start, length = int(self._starts[i]), int(self._lengths[i])
+        row = self._slots[start:start + length]
+        k = int(np.flatnonzero(row == j)[0])
+        row[k] = row[length - 1]
+        self._lengths[i] = length - 1
+
+    def add_edge(self, i: int, j: int):
+        self._insert(i, j)
+        self._insert(j, i)
+        self._compact_if_sparse()
+
+    def remove_edge(self, i: int, j: int):
+        self._delete(i, j)
+        self._delete(j, i)
+
+    def _compact_if_sparse(self):
+        if self._unused > self._end // 2:
+            self._pack(*self.csr())
+
+    def csr(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        :return: indptr, indices of the adjacency in the plain CSR layout, neighbors sorted ascending
+        """
+        lengths = self._lengths[:self.n]
+        indptr = np.zeros(self.n + 1, dtype=np.int64)
+        np.cumsum(lengths, out=indptr[1:])
+        owner, slots = _expand_ranges(self._starts[:self.n], lengths)
+        indices = self._slots[slots]
+        return indptr, indices[np.lexsort((indices, owner))]
+
+    def bfs_hop_counts(self, origin: int) -> np.ndarray:
+        """
+        :return: Hop counts from the origin, as returned by bfs_hop_counts
+        """
+        return bfs_hop_counts(self._starts[:self.n], self._slots, origin, self._lengths[:self.n])
+
+
+def csr_slots(indptr: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    """
+    :return: Positions of all entries of the rows in a CSR layout, row by row
+    """
+    starts = indptr[rows]
+    return _expand_ranges(starts, indptr[rows + 1] - starts)[1]
+
+
+def bfs_ball(indptr: np.ndarray, indices: np.ndarray, origin: int, max_hops: int,
+             mark: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Breadth-first search over a CSR adjacency limited to max_hops, touching only the points it reaches.
+    :param mark: Boolean scratch array with an entry for every point, all False. It is all False again on return.
+    :return: IDs of the points at most max_hops from the origin ordered by their hops, and the hops
+    """
+    frontier = np.array([origin])
+    mark[origin] = True
+    levels = [frontier]
+    for _ in range(max_hops):
+        neighbors = np.unique(indices[csr_slots(indptr, frontier)])
+        frontier = neighbors[~mark[neighbors]]
+        if len(frontier) == 0:
+            break
+        mark[frontier] = True
+        levels.append(frontier)
+    points = np.concatenate(levels)
+    mark[points] = False
+    return points, np.repeat(np.arange(len(levels)), [len(level) for level in levels])
@@ -0,0 +1,31 @@
+"""
+Random streams of the simulation, all derived from a single root seed.
+
+Every subsystem and every node draws from its own numpy Generator. A stream is keyed by its name and index
+instead of the order in which it was created, so the results do not depend on the order in which nodes are
+created or stepped, and a batched or parallel engine can reproduce the serial one bit by bit.
+"""
+from __future__ import annotations
+
+import numpy as np
+
+
+class RandomStreams:
+    """Subsystems with their own stream. The position is a part of the stream key, so new names are appended."""
+    SUBSYSTEMS = ["placement", "measurement", "node", "simulation", "localization"]
+
+    def __init__(self, seed: int):
+        """
+        :param seed: Root seed of all the streams
+        """
+        self.seed = seed
+
+    def generator(self, subsystem: str, index: int | None = None) -> np.random.Generator:
+        """
+        Creates a new generator of a stream. Generators of the same stream always produce the same numbers.
+        :param subsystem: One of SUBSYSTEMS
+        :param index: Index within the subsystem, eg. the ID of a node
+        :return: A generator independent of the generators of all other streams
+        """
+        key = (self.SUBSYSTEMS.index(subsystem),) if index is None else (self.SUBSYSTEMS.index(subsystem), index)
+        return np.random.default_rng(np.random.SeedSequence(self.seed, spawn_key=key))
@@ -0,0 +1,184 @@
+"""
+Simulated radio transport between the nodes.
+
+Every remote call of a node is a message over the mesh. The transport counts the messages and bytes of every node,
+charges airtime for every hop a message travels and accumulates the simulated latency of the rounds.
+
+With batching, a node coalesces everything it sends to a peer during one round into a single message per peer:
+the queries are assumed to be prefetched in one exchange and the solution pushes are delivered together
+at the end of the round. All peers of a node are contacted in parallel, so the latency of a node in a round
+is that of its slowest exchange instead of the sum of all of them.
+"""
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from simplexmesh.config import config
+from simplexmesh.metrics import metrics
+
+if TYPE_CHECKING:
+    from simplexmesh.grid import Grid, Network
+    from simplexmesh.solution import Solution
+
+
+class Transport:
+    def __init__(self, grid: Grid, batching: bool | None = None):
+        """
+        :param grid: Grid of the network, used for the hop counts between the nodes
+        :param batching: Whether to coalesce the messages of a round per peer. Taken from configuration if not provided.
+        """
+        self._grid = grid
+        self.batching = config["transport"]["batching"] if batching is None else batching
+        self.header_bytes = config["transport"]["header_bytes"]
+        self.id_bytes = config["transport"]["id_bytes"]
+        self.value_bytes = config["transport"]["value_bytes"]
+        """Latency of a single hop in seconds, not including the airtime"""
+        self.hop_latency = config["transport"]["hop_latency"]
+        """Bitrate of the radio in bits per second"""
+        self.bitrate = config["transport"]["bitrate"]
+
+        n = grid.n_nodes
+        self.messages_sent = np.zeros(n, dtype=np.int64)
+        self.messages_received = np.zeros(n, dtype=np.int64)
+        self.bytes_sent = np.zeros(n, dtype=np.int64)
+        self.bytes_received = np.zeros(n, dtype=np.int64)
+        """Airtime of the messages sent by a node, summed over all hops they travel, in seconds"""
+        self.airtime = np.zeros(n)
+        """Simulated time of the rounds, a round lasts as long as its slowest node"""
+        self.elapsed = 0.0
+        self.n_rounds = 0
+
+        self._hop_rows: dict[int, np.ndarray] = {}
+        self._round_latency: dict[int, float] = {}
+        """(origin, peer) -> [request bytes, reply bytes], payloads coalesced in the current round"""
+        self._pending: dict[tuple[int, int], list[int]] = {}
+        """(origin, peer) -> lists of solutions pushed in the current round, delivered at its end"""
+        self._deferred: dict[tuple[int, int], list[list[Solution]]] = {}
+        """(origin, peer, value, confidence) of the edges finalized in the current round, delivered at its end"""
+        self._deferred_finalized: list[tuple[int, int, Solution, float]] = []
+
+    def hops(self, origin: int, peer: int) -> int:
+        row = self._hop_rows.get(origin)
+        if row is None:
+            row = self._hop_rows[origin] = self._grid.get_hop_row(origin)
+        return max(1, int(row[peer]))
+
+    def solutions_size(self, solutions: list[Solution]) -> int:
+        """
+        :return: Payload of pushed solutions: the value, the badness and the IDs of the gate of every solution
+        """
+        return len(solutions) * (self.value_bytes + 1 + self._grid.P.dim * self.id_bytes)
+
+    def position_size(self) -> int:
+        return self._grid.P.dim * self.value_bytes
+
+    def request(self, origin: int, peer: int, request_bytes: int, reply_bytes: int) -> None:
+        """
+        Accounts a query of a node and the reply of the peer.
+        :param request_bytes: Payload of the query
+        :param reply_bytes: Payload of the reply
+        """
+        if self.batching:
+            pending = self._pending.setdefault((origin, peer), [0, 0])
+            pending[0] += request_bytes
+            pending[1] += reply_bytes
+            return
+        latency = self._send(origin, peer, request_bytes) + self._send(peer, origin, reply_bytes)
+        self._round_latency[origin] = self._round_latency.get(origin, 0.0) + latency
+
+    def push(self, origin: int, peer: int, payload_bytes: int) -> None:
+        """
+        Accounts a message of a node which is not replied to, eg. pushed solutions.
+        """
+        if self.batching:
+            self._pending.setdefault((origin, peer), [0, 0])[0] += payload_bytes
+            return
+        latency = self._send(origin, peer, payload_bytes)
+        self._round_latency[origin] = self._round_latency.get(origin, 0.0) + latency
+
+    def defer(self, origin: int, peer: int, solutions: list[Solution]) -> None:
+        """
+        Holds pushed solutions until the end of the round.
+        """
+        self._deferred.setdefault((origin, peer), []).append(solutions)
+
+    def defer_finalized(self, origin: int, peer: int, value: Solution, confidence: float) -> None:
+        """
+        Holds the notice of a finalized edge until the end of the round.
+        """
+        self._deferred_finalized.append((origin, peer, value, confidence))
+
+    def _send(self, origin: int, peer: int, payload_bytes: int) -> float:
+        """
+        :return: Latency of the message in seconds
+        """
+        n_bytes = self.header_bytes + payload_bytes
+        hops = self.hops(origin, peer)
+        airtime = 8 * n_bytes / self.bitrate
+        self.messages_sent[origin] += 1
+        self.messages_received[peer] += 1
+        self.bytes_sent[origin] += n_bytes
+        self.bytes_received[peer] += n_bytes
+        self.airtime[origin] += hops * airtime
+        if metrics.enabled:
+            metrics.count("messages")
+            metrics.count("message_bytes", n_bytes)
+        return hops * (self.hop_latency + airtime)
+
+    def end_round(self, network: Network) -> None:
+        """
+        Sends the coalesced messages, delivers the deferred solutions and finalized edges and advances the simulated time.
+        """
+        for (origin, peer), (request_bytes, reply_bytes) in self._pending.items():
+            latency = self._send(origin, peer, request_bytes)
+            if reply_bytes:
+                latency += self._send(peer, origin, reply_bytes)
+            self._round_latency[origin] = max(self._round_latency.get(origin, 0.0), latency)
+        self._pending.clear()
+
+        deferred, self._deferred = self._deferred, {}
+        for (origin, peer), batches in deferred.items():
+            if (node := network.get_node(peer)) is not None:
+                node.add_solution_batches_to_node(origin, batches)
+        deferred_finalized, self._deferred_finalized = self._deferred_finalized, []
+        for origin, peer, value, confidence in deferred_finalized:
+            if (node := network.get_node(peer)) is not None:
+                node.receive_finalized(origin, value, confidence)
+
+        if self._round_latency:
+            self.elapsed += max(self._round_latency.values())
+        self._round_latency.clear()
+        self.n_rounds += 1
+
+    def on_topology_change(self) -> None:
+        """
+        Grows the counters for joined nodes and drops the cached hop counts.
+        """
+        n = self._grid.n_nodes
+        for name in ("messages_sent", "messages_received", "bytes_sent", "bytes_received", "airtime"):
+            counters = getattr(self, name)
+            if len(counters) < n:
+                setattr(self, name, np.concatenate((counters, np.zeros(n - len(counters), dtype=counters.dtype))))
+        self._hop_rows.clear()
+
+    def summary(self) -> dict:
+        """
+        :return: A JSON-serializable dict with the totals and the load of the busiest node
+        """
+        return {
+            "batching": self.batching,
+            "rounds": self.n_rounds,
+            "messages": int(self.messages_sent.sum()),
+            "bytes": int(self.bytes_sent.sum()),
+            "airtime [s]": round(float(self.airtime.sum()), 6),
+            "simulated time [s]": round(self.elapsed, 6),
+            "max messages per node": int(self.messages_sent.max(initial=0)),
+            "max bytes per node": int(self.bytes_sent.max(initial=0)),
+        }
+
+    def print_summary(self) -> None:
+        print("[TRANSPORT]")
+        for name, value in self.summary().items():
+            print(f"    {name:24} {value:>10}")
@@ -1,47 +1,113 @@
+import itertools
 from typing import Type
-from grid import Grid, P, Point2D, Point
-from config import config
-from simplexmesh.grid import Network
-import matplotlib.patches as patches
+
+import numpy as np
+
+from simplexmesh.grid import Grid, P, Point2D, Network
+from simplexmesh.config import config
+from simplexmesh.spatial import RectIndex
+from simplexmesh.streams import RandomStreams
 
 
 class WallGrid(Grid):
-    def __init__(self, point_type: Type[P], n_nodes: int, grid_size: int, sd: float = 0.2):
-        super().__init__(point_type, n_nodes, grid_size, sd)
-        self.walls = config["grid"]["walls"]
-        for i in range(len(self.walls)):
-            self.walls[i] = [(self.walls[i][0], self.walls[i][1]), *self.walls[i][2:]]
-        self._placement_conditions.append(self._condition_node_not_inside_wall)
+    """
+    A 2D grid with rectangular walls. Nodes are never placed inside a wall, and measurements
+    between nodes separated by walls are biased and noisier, as observed in the ranging tests.
+    """
+
+    def __init__(self, point_type: Type[P], n_nodes: int, grid_size: int, sd: float = 0.2,
+                 seed: int | None = None, walls=None, streams: RandomStreams | None = None):
+        """
+        :param walls: List of walls given as [x, y, width, height]. Taken from configuration if not provided.
+        """
+        super().__init__(point_type, n_nodes, grid_size, sd, seed, streams)
+        walls = config["grid"]["walls"] if walls is None else walls
+        self.walls = [[(wall[0], wall[1]), *wall[2:]] for wall in walls]
+        self.wall_index = RectIndex(np.array(walls, dtype=np.float64).reshape(-1, 4), self.NODE_REACH)
+        self.wall_bias = config["measurement"]["wall_bias"]
+        self.wall_sd = config["measurement"]["wall_sd"]
+        self.wall_detection_probability = config["measurement"]["wall_detection_probability"]
+        self._walls_between: dict[tuple[int, int], int] = {}
+        self._walls_detected: set[tuple[int, int]] = set()
+
+    def _placement_mask(self, points: np.ndarray) -> np.ndarray:
+        return ~self.wall_index.contains(points)
+
+    def _set_adjacency(self, pairs: np.ndarray, indptr: np.ndarray, indices: np.ndarray):
+        """
+        Besides the neighbor lists, counts the walls crossed by every in-reach edge in one batch.
+        """
+        super()._set_adjacency(pairs, indptr, indices)
+        counts = self.wall_index.count_crossings(self.coords[pairs[:, 0]], self.coords[pairs[:, 1]])
+        self._walls_between = {(i, j): c for (i, j), c in zip(pairs[counts > 0].tolist(), counts[counts > 0].tolist())}
+
+    def _node_edges_changed(self, node_id: int, removed: list[int]):
+        """
+        Recounts the walls crossed by the edges of a node which joined, left or moved.
+        """
+        neighbors = self._neighbors[node_id]
+        for j in itertools.chain(removed, neighbors):
+            key = (min(node_id, j), max(node_id, j))
+            self._walls_between.pop(key, None)
+            self._walls_detected.discard(key)
+        if not neighbors:
+            return
+        counts = self.wall_index.count_crossings(self.coords[[node_id] * len(neighbors)], self.coords[neighbors])
+        for j, c in zip(neighbors, counts.tolist()):
+            if c > 0:
+                self._walls_between[(min(node_id, j), max(node_id, j))] = c
 
-    def _condition_node_not_inside_wall(self, point: P) -> bool:
-        print("cc")
-        for wall in self.walls:
-            print(point, wall)
-            if wall[0][0] < point.xyz[0] < wall[0][0] + wall[1] and wall[0][1] < point.xyz[1] < wall[0][1] + wall[2]:
-                print("inside wall")
-                return False
-        return True
+    def count_walls_between(self, origin: int, target: int) -> int:
+        """
+        :return: Number of walls crossed by the straight line between two nodes
+        """
+        key = (min(origin, target), max(origin, target))
+        if self.get_true_distance(origin, target) is not None:
+            return self._walls_between.get(key, 0)
+        p0 = self.coords[[origin]]
+        p1 = self.coords[[target]]
+        return int(self.wall_index.count_crossings(p0, p1)[0])
 
-    def is_wall_between_nodes_true(self, origin, target):
-        pass
+    def is_wall_between_nodes_true(self, origin, target) -> bool:
+        """
+        :return: True if any wall physically separates the nodes
+        """
+        return self.count_walls_between(origin, target) > 0
 
-    def is_wall_between_nodes_detected(self, origin, target):
-        pass
+    def is_wall_between_nodes_detected(self, origin, target) -> bool:
+        """
+        :return: True if the measurement between the nodes was flagged as going through a wall.
+        Only a part of the walls is detected, as given by the wall_detection_probability configuration value.
+        """
+        return (min(origin, target), max(origin, target)) in self._walls_detected
 
-    def _plot(self, network: Network):
-        fig, (ax1, ax2) = super()._plot(network)
-        for wall in self.walls:
-            rect1 = patches.Rectangle(*wall, color="gray")
-            rect2 = patches.Rectangle(*wall, color="gray")
-            ax1.add_patch(rect1)
-            ax2.add_patch(rect2)
+    def get_measured_distance(self, origin_id: int, target_id: int) -> float:
+        """
+        Every crossed wall adds a constant bias and additional noise to the measurement.
+        """
+        n_walls = self.count_walls_between(origin_id, target_id)
+        if n_walls == 0:
+            return super().get_measured_distance(origin_id, target_id)
 
+        rng = self.measurement_rng(origin_id)
+        if rng.random() < self.wall_detection_probability:
+            self._walls_detected.add((min(origin_id, target_id), max(origin_id, target_id)))
+        sd = (self.sd ** 2 + n_walls * self.wall_sd ** 2) ** 0.5
+        true = self.get_true_distance(origin_id, target_id)
+        return rng.normal(true + n_walls * self.wall_bias, sd)
 
+    def _plot(self, network: Network, headless: bool = False):
+        from matplotlib.collections import PatchCollection
+        from matplotlib.patches import Rectangle
 
+        fig, (ax1, ax2) = super()._plot(network, headless)
+        for ax in (ax1, ax2):
+            ax.add_collection(PatchCollection([Rectangle(*wall) for wall in self.walls], color="gray"))
+        return fig, (ax1, ax2)
 
 
 if __name__ == '__main__':
-    from node import DummyNode
+    from simplexmesh.node import DummyNode
 
     wg = WallGrid(Point2D, 10, 10)
     wg.setup()
@@ -50,4 +116,4 @@ if __name__ == '__main__':
         node = DummyNode(i, n, wg)
         node.set_is_anchor()
 
-    wg.plot(Network())
\ No newline at end of file
+    wg.plot(n)
@@ -1,44 +1,199 @@
-from simplexmesh.grid import Grid, Network, Point2D
+import numpy as np
+
+from simplexmesh.grid import Grid, Network, Point, Point2D, Point3D, TopologyChange
+from simplexmesh.wall_grid import WallGrid
 from simplexmesh.node import *
 from simplexmesh.config import config
-from simplexmesh.algorithm import get_position_by_anchors_2d_lls
+from simplexmesh.algorithm import get_position_by_anchors_2d_lls, get_position_by_anchors_3d_lls
+from simplexmesh.localization import localize
+from simplexmesh.metrics import metrics
+from simplexmesh.convergence import ConvergenceRecorder
+from simplexmesh.snapshot import Snapshot
+from simplexmesh.streams import RandomStreams
+from simplexmesh.transport import Transport
 
 
 class Simulation:
-    def __init__(self):
+    def __init__(self, grid: Grid | None = None):
+        """
+        :param grid: Grid with the nodes already placed. A new one is created from configuration if not provided.
+        The random streams of a provided grid are used by the whole simulation.
+        """
         self.N_NODES = config["grid"]["n_nodes"]
         self.REQ_ANCHORS = config["grid"]["n_required_anchors"]
         self.nodes: list[Node] = []
-        self.grid = Grid(Point2D, config["grid"]["n_nodes"], config["grid"]["size"], config["measurement"]["sd"])
-        self.network = Network()
+        self.DIM = config["grid"]["dim"]
+        if grid is None:
+            point_type = Point2D if self.DIM == 2 else Point3D
+            grid_class = WallGrid if config["simulation"]["use_walls"] else Grid
+            grid = grid_class(point_type, config["grid"]["n_nodes"], config["grid"]["size"], config["measurement"]["sd"],
+                              streams=RandomStreams(config["simulation"]["seed"]))
+        self.grid = grid
+        self.rng = grid.streams.generator("simulation")
+        self.network = Network(Transport(grid) if config["transport"]["enabled"] else None)
+
+    @classmethod
+    def from_snapshot(cls, snapshot: Snapshot | str) -> "Simulation":
+        """
+        Restores a simulation saved with save_snapshot, skipping the grid setup, hop tables and propagation.
+        Every call creates an independent simulation, so one snapshot can be forked into many what-if runs.
+        :param snapshot: Snapshot or path of a snapshot directory
+        """
+        if not isinstance(snapshot, Snapshot):
+            snapshot = Snapshot.load(snapshot)
+        if snapshot.meta["n_nodes"] != config["grid"]["n_nodes"] or snapshot.meta["dim"] != config["grid"]["dim"]:
+            raise ValueError("Snapshot does not match grid.n_nodes and grid.dim of the current configuration")
+
+        sim = cls(snapshot.build_grid())
+        sim.nodes = snapshot.build_nodes(sim.network, sim.grid)
+        return sim
+
+    def save_snapshot(self, path) -> None:
+        """
+        Saves the grid, the hop tables, the state of the nodes and the SolutionSets to a snapshot directory.
+        """
+        Snapshot.capture(self.grid, self.nodes, meta={"config": dict(config)}).save(path)
 
     def create(self):
+        """
+        Places the nodes, unless the grid already has a placement, creates the nodes and measures the neighbor distances.
+        """
         n_anchors = config["grid"]["n_anchors"]
         self.nodes = []
 
         node_class_str = config["simulation"]["node"]
         node_class = globals()[node_class_str]
 
-        self.grid.setup()
+        if self.grid.coords is None:
+            with metrics.phase("grid_setup"):
+                self.grid.setup()
+
+        with metrics.phase("node_creation"):
+            for i in range(self.N_NODES):
+                node = node_class(i, self.network, self.grid)
+                if i < n_anchors:
+                    node.set_is_anchor()
+                    node.set_logging(False)
+                self.nodes.append(node)
+
+        with metrics.phase("neighbor_measurements"):
+            for node in self.nodes:
+                node.measure_distances_to_neighbors()
+
+
+    def run(self, recorder: ConvergenceRecorder | None = None):
+        """
+        Runs the propagation for the configured number of iterations. With localization.streaming and
+        localization.stable_iterations set, it stops early once no streamed position moved by more than
+        localization.stable_tolerance for that many iterations in a row.
+        :param recorder: Optional ConvergenceRecorder, notified after every iteration
+        """
+        stable_iterations = config["localization"]["stable_iterations"] if config["localization"]["streaming"] else None
+        n_stable = 0
+        if metrics.enabled:
+            metrics.begin_iterations()
+        with metrics.phase("propagation"):
+            for i in range(config["simulation"]["iterations"]):
+                for node in self.nodes:
+                    node.try_measure_new_length()
+                self.network.end_round()
+                if metrics.enabled:
+                    metrics.end_iteration(i)
+                if recorder is not None:
+                    recorder.record(i)
+                if i % 100 == 0:
+                    print(f"------ ITERATION {i} ------")
+                if stable_iterations is not None:
+                    n_stable = n_stable + 1 if self.positions_stable() else 0
+                    if n_stable >= stable_iterations:
+                        print(f"[LOCALIZATION] Positions stable for {n_stable} iterations, stopped after iteration {i}")
+                        break
+
+    def positions_stable(self) -> bool:
+        """
+        Checks whether no streamed position moved by more than localization.stable_tolerance since the last check.
+        Positions are stable only once every node acquired the required anchors, as nodes not localized yet
+        do not move either.
+        """
+        tolerance = config["localization"]["stable_tolerance"]
+        shift = max((node.reset_position_shift() for node in self.nodes), default=0.0)
+        return shift <= tolerance and all(node.is_anchor or node.anchor_reached for node in self.nodes)
 
-        for i in range(self.N_NODES):
-            node = node_class(i, self.network, self.grid)
-            if i < n_anchors:
-                node.set_is_anchor()
-                node.set_logging(False)
-            self.nodes.append(node)
 
+    """
+    Topology changes
+    """
+    def add_node(self, point: Point) -> Node:
+        """
+        Joins a new node at the given position. It measures the distances to its neighbors and becomes
+        a target of all other nodes, which keep everything they already know.
+        :return: The new node
+        """
+        change = self.grid.add_point(point)
+        if self.network.transport is not None:
+            self.network.transport.on_topology_change()
         for node in self.nodes:
-            node.measure_distances_to_neighbors()
+            node.on_node_added(change.node, self.grid.get_hop_count(node._id, change.node))
+        node = globals()[config["simulation"]["node"]](change.node, self.network, self.grid)
+        node.measure_distances_to_neighbors()
+        self.nodes.append(node)
+        self._apply_topology_change(change)
+        return node
 
+    def remove_node(self, node_id: int) -> None:
+        """
+        Removes a node leaving the network, eg. on reboot. The other nodes drop the distances to it
+        and the solutions computed through it.
+        """
+        change = self.grid.remove_point(node_id)
+        if self.network.transport is not None:
+            self.network.transport.on_topology_change()
+        removed = self.network.get_node(node_id)
+        self.network.remove_node(node_id)
+        self.nodes.remove(removed)
+        for node in self.nodes:
+            node.on_node_removed(node_id)
+        self._apply_topology_change(change)
 
-    def run(self):
-        for i in range(config["simulation"]["iterations"]):
-            for node in self.nodes:
-                node.try_measure_new_length()
-            if i % 100 == 0:
-                print(f"------ ITERATION {i} ------")
+    def move_node(self, node_id: int, point: Point) -> Node:
+        """
+        Moves a node to a new position. The node starts over, as all its distances changed, and the other nodes
+        drop the distances to it and the solutions computed through it.
+        :return: The node replacing the moved one
+        """
+        change = self.grid.move_point(node_id, point)
+        if self.network.transport is not None:
+            self.network.transport.on_topology_change()
+        old = self.network.get_node(node_id)
+        self.network.remove_node(node_id)
+        for node in self.nodes:
+            if node is not old:
+                node.on_node_moved(node_id, self.grid.get_hop_count(node._id, node_id))
 
+        node = type(old)(node_id, self.network, self.grid)
+        node.rng = old.rng
+        node.set_logging(old.do_logging)
+        if old.is_anchor:
+            node.set_is_anchor()
+        node.measure_distances_to_neighbors()
+        self.nodes[self.nodes.index(old)] = node
+        self._apply_topology_change(change)
+        return node
+
+    def _apply_topology_change(self, change: TopologyChange) -> None:
+        """
+        Updates the hop levels of the nodes whose hop counts changed, and lets the nodes in reach of the changed one
+        measure the distance to it.
+        """
+        for node_id in change.changed_hop_rows:
+            self.network.get_node(node_id).update_hop_row(self.grid.get_hop_row(node_id))
+        for node_id in change.removed_neighbors:
+            self.network.get_node(node_id).on_neighbor_removed(change.node)
+        for node_id in self.grid.get_neighbors_of(change.node):
+            self.network.get_node(node_id).on_neighbor_added(change.node)
+        if metrics.enabled:
+            metrics.count("topology_changes")
+            metrics.count("hop_rows_updated", len(change.changed_hop_rows))
 
     def show_results(self):
         print("Distances")
@@ -53,7 +208,7 @@ class Simulation:
         print("Errors")
         for node in self.nodes:
             print(f"{node._id} |   " + "  ".join(
-                f"{f'{target}: {round(x.get() - self.grid.get_true_distance(node._id, target, override_range=True), 1) if (x := node._known.get(target)) is not None else None}':10}"
+                f"{f'{target}: {round(x.get() - self.grid.get_true_distance(node._id, target, override_range=True), 1) if (x := node._known.get(target)) is not None and x.get() is not None else None}':10}"
                 if target != node._id
                 else " " * 10
                 for target in range(config["grid"]["n_nodes"])
@@ -66,17 +221,34 @@ class Simulation:
 
         print("\n\n")
         print("Positions:")
+        # A subset of n_used_anchors anchors is only honored by recomputing the positions below
+        streamed = (config["localization"]["streaming"]
+                    and config["simulation"]["n_used_anchors"] == config["grid"]["n_required_anchors"])
+        if config["localization"]["method"] != "anchors" or streamed:
+            if config["localization"]["method"] != "anchors":
+                print(f"[LOCALIZATION] {self.localize()}")
+            for node in self.nodes:
+                if node.position is not None:
+                    true_pos = self.grid.get_true_position(node._id)
+                    print(f"{node._id} | Calculated: {node.position}  | Real: {true_pos}  | "
+                          f"Delta: {node.position.distance_to(true_pos)}")
+            return
         for node in self.nodes:
             if config["simulation"]["n_used_anchors"] != config["grid"]["n_required_anchors"]:
-                anchor_ids = random.sample(list(node.anchors.keys()), config["simulation"]["n_used_anchors"])
+                all_anchor_ids = list(node.anchors.keys())
+                anchor_ids = [all_anchor_ids[i] for i in
+                              self.rng.choice(len(all_anchor_ids), config["simulation"]["n_used_anchors"], replace=False)]
             else:
                 anchor_ids = node.anchors.keys()
 
             anchors = [node.anchors[id] for id in anchor_ids]
             distances = [node._known[id].get() for id in anchor_ids]
-            if None in distances:
+            if None in distances or len(distances) < self.DIM + 1:
                 continue
-            position = get_position_by_anchors_2d_lls(anchors, distances)
+            if self.DIM == 2:
+                position = get_position_by_anchors_2d_lls(anchors, distances)
+            else:
+                position = get_position_by_anchors_3d_lls(anchors, distances)
             true_pos = self.grid.get_true_position(node._id)
             print(f"{node._id} | Calculated: {position}  | Real: {true_pos}  | Delta: {position.distance_to(true_pos)}")
             if not node.is_anchor:
@@ -85,19 +257,48 @@ class Simulation:
 
 
 
+    def localize(self) -> dict:
+        """
+        Localizes all nodes from every known edge by localization.method, see simplexmesh.localization,
+        and stores the positions of the localized nodes which are not anchors.
+        :return: Report of the localization
+        """
+        with metrics.phase("localization"):
+            positions, report = localize(self.nodes, self.DIM, self.grid.streams.generator("localization"),
+                                         self.grid.get_in_reach_pairs())
+        point_type = Point2D if self.DIM == 2 else Point3D
+        for node in self.nodes:
+            if not node.is_anchor and not np.isnan(positions[node._id, 0]):
+                node.position = point_type(tuple(positions[node._id].tolist()))
+        return report
+
+    def show_metrics(self):
+        if self.network.transport is not None:
+            self.network.transport.print_summary()
+        if not metrics.enabled:
+            return
+        metrics.print_summary()
+        if config["metrics"]["output"] is not None:
+            metrics.dump(config["metrics"]["output"])
+
     def show_plots(self):
         self.grid.plot(self.network)
 
 if __name__ == '__main__':
     sim = Simulation()
     sim.create()
+    convergence_output = config["simulation"]["convergence_output"]
+    recorder = ConvergenceRecorder(sim.grid, sim.network) if convergence_output is not None else None
     try:
-        sim.run()
+        sim.run(recorder)
     except Exception as ex:
         raise ex
         pass
+    if recorder is not None:
+        recorder.save(convergence_output)
 
     sim.show_results()
+    sim.show_metrics()
     sim.show_plots()
 
 
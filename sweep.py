@@ -0,0 +1,165 @@
+"""
+Runs the simulation for every combination of configuration overrides and reports the results as one table.
+
+Usage:
+    python sweep.py sweep.yaml [-o results.csv] [--every N] [--verbose]
+
+The sweep file maps configuration values to lists of candidates, either as "section.key: [...]"
+or nested the same way as config.yaml. Every run gets its own configuration built from the global one.
+Stages shared between runs are computed once: runs differing only in the solution_set or node settings
+reuse the placement and the neighbor measurements, runs differing only in measurement settings reuse the placement.
+"""
+from __future__ import annotations
+
+import argparse
+import contextlib
+import csv
+import itertools
+import json
+import os
+import time
+
+import yaml
+
+from simplexmesh.config import config, with_overrides, use_config
+from simplexmesh.convergence import ConvergenceRecorder, summarize, print_table
+from simplexmesh.snapshot import Snapshot
+from simulation import Simulation
+
+
+"""Configuration values that determine the node placement and the adjacency"""
+PLACEMENT_STAGE = ["grid.dim", "grid.n_nodes", "grid.size", "grid.min_node_real_distance", "grid.walls",
+                   "node.max_reach", "simulation.seed", "simulation.use_walls"]
+"""Configuration values that additionally determine the nodes, the settings they are built with and their neighbor
+measurements"""
+MEASUREMENT_STAGE = PLACEMENT_STAGE + ["measurement", "grid.n_anchors", "grid.n_required_anchors", "simulation.node",
+                                       "localization.streaming", "localization.streaming_iterations"]
+
+
+def stage_key(run_config: dict, stage: list[str]) -> str:
+    """
+    :param run_config: Configuration of a run
+    :param stage: List of "section.key" or whole "section" names the stage depends on
+    :return: A key equal for all configurations that produce the same result of the stage
+    """
+    values = []
+    for name in stage:
+        section, _, key = name.partition(".")
+        values.append(run_config[section][key] if key else run_config[section])
+    return json.dumps(values, sort_keys=True)
+
+
+def flatten_overrides(spec: dict) -> dict[str, list]:
+    """
+    :param spec: Sweep specification with "section.key" names or nested sections
+    :return: Mapping of "section.key" to the list of candidate values
+    """
+    result = {}
+    for name, value in spec.items():
+        if isinstance(value, dict):
+            result.update({f"{name}.{key}": candidates for key, candidates in value.items()})
+        else:
+            result[name] = value
+    return result
+
+
+class Sweep:
+    def __init__(self, overrides: dict[str, list], base: dict | None = None, every: int = 10):
+        """
+        :param overrides: Mapping of "section.key" to the list of values to try. Runs are the cartesian product.
+        :param base: Configuration the overrides are applied to, the global one by default
+        :param every: Record the convergence every n-th iteration
+        """
+        self.overrides = overrides
+        self.base = config if base is None else base
+        self.every = every
+        self._placements: dict[str, tuple] = {}
+        self._measurements: dict[str, Snapshot] = {}
+
+    def runs(self) -> list[dict]:
+        """
+        :return: Overrides of every run
+        """
+        names = list(self.overrides.keys())
+        return [dict(zip(names, values)) for values in itertools.product(*self.overrides.values())]
+
+    def run(self, verbose: bool = False) -> list[dict]:
+        """
+        Runs the whole sweep.
+        :param verbose: Whether to show the output of the simulations
+        :return: One row per run, with the overrides followed by the results
+        """
+        rows = []
+        runs = self.runs()
+        for i, overrides in enumerate(runs):
+            run_config = with_overrides(self.base, overrides)
+            print(f"[SWEEP] Run {i + 1}/{len(runs)}: {overrides}")
+            with use_config(run_config), self._output(verbose):
+                reused, elapsed, summary = self.run_single(run_config)
+            rows.append({**overrides, "reused": reused, "time [s]": round(elapsed, 2), **summary})
+        return rows
+
+    def run_single(self, run_config: dict) -> tuple[str, float, dict]:
+        """
+        Runs a simulation with the configuration already installed, reusing cached stages if possible.
+        :return: Name of the reused stage, time of the propagation and the convergence summary
+        """
+        placement_key = stage_key(run_config, PLACEMENT_STAGE)
+        measurement_key = stage_key(run_config, MEASUREMENT_STAGE)
+
+        if measurement_key in self._measurements:
+            sim = Simulation.from_snapshot(self._measurements[measurement_key])
+            reused = "measurements"
+        else:
+            sim = Simulation()
+            reused = "-"
+            if placement_key in self._placements:
+                sim.grid.set_placement(*self._placements[placement_key])
+                reused = "placement"
+            sim.create()
+            self._placements[placement_key] = (sim.grid.coords, sim.grid._indptr, sim.grid._indices)
+            self._measurements[measurement_key] = Snapshot.capture(sim.grid, sim.nodes)
+
+        recorder = ConvergenceRecorder(sim.grid, sim.network, self.every)
+        t = time.perf_counter()
+        sim.run(recorder)
+        elapsed = time.perf_counter() - t
+        return reused, elapsed, summarize(recorder.records, run_config["grid"]["n_nodes"])
+
+    @staticmethod
+    @contextlib.contextmanager
+    def _output(verbose: bool):
+        if verbose:
+            yield
+            return
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            yield
+
+
+def save_csv(rows: list[dict], path) -> None:
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Run the simulation for a grid of configuration overrides.")
+    parser.add_argument("path", help="YAML file mapping configuration values to lists of candidates")
+    parser.add_argument("-o", "--output", help="Save the results table to a CSV file")
+    parser.add_argument("--every", type=int, default=10, help="Record the convergence every n-th iteration")
+    parser.add_argument("--verbose", action="store_true", help="Show the output of the simulations")
+    args = parser.parse_args(argv)
+
+    with open(args.path, "r") as f:
+        overrides = flatten_overrides(yaml.safe_load(f))
+    rows = Sweep(overrides, every=args.every).run(args.verbose)
+
+    print()
+    print_table(list(rows[0].keys()), [["-" if v is None else v for v in row.values()] for row in rows])
+    if args.output is not None:
+        save_csv(rows, args.output)
+
+
+if __name__ == '__main__':
+    main()
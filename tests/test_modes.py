@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from simplexmesh.config import config
+from simplexmesh.modes import DerivativeModeFinder, KDEModeFinder
+from simplexmesh.solution import Solution, SolutionSet
+
+
+def _random_solutions(rng: np.random.Generator, max_length: int) -> list[Solution]:
+    """
+    :return: Sorted solutions of a random edge, a noisy cluster of correct ones among scattered mirrored ones.
+    Some are rounded, so that equal values and equal densities are covered as well.
+    """
+    length = int(rng.integers(0, max_length + 1))
+    n_correct = rng.binomial(length, rng.uniform(0.3, 0.7))
+    values = np.concatenate([rng.uniform(2, 10) + rng.normal(0, rng.choice([0.05, 0.2, 0.5]), n_correct),
+                             rng.uniform(2, 12, length - n_correct)])
+    if rng.random() < 0.2:
+        values = np.round(values, 1)
+    badness = rng.integers(-1, 6, length)
+    order = np.argsort(values, kind="stable")
+    return [Solution(value, badness=int(bad)) for value, bad in zip(values[order], badness[order])]
+
+
+@pytest.mark.parametrize("finder", [DerivativeModeFinder(5, 0.3), KDEModeFinder(0.3, 3.5, 6)],
+                         ids=["derivative", "kde"])
+def test_pick_many_picks_like_pick(finder):
+    rng = np.random.default_rng(46)
+    for _ in range(30):
+        sets = [_random_solutions(rng, 25) for _ in range(100)]
+        must_choose = rng.random(len(sets)) < 0.3
+        width = max(len(solutions) for solutions in sets)
+        values = np.array([solutions + [np.nan] * (width - len(solutions)) for solutions in sets], dtype=np.float64)
+        badness = np.array([[sol.badness for sol in solutions] + [np.nan] * (width - len(solutions))
+                            for solutions in sets], dtype=np.float64)
+        lengths = np.array([len(solutions) for solutions in sets])
+
+        picked = finder.pick_many(values, badness, lengths, must_choose).tolist()
+        for solutions, must, index in zip(sets, must_choose.tolist(), picked):
+            expected = finder.pick(solutions, must)
+            assert index == (-1 if expected is None else expected)
+
+
+@pytest.mark.parametrize("mode_finder", ["derivative", "kde"])
+def test_update_many_picks_the_repeated_value(monkeypatch, mode_finder):
+    monkeypatch.setitem(config["solution_set"], "mode_finder", mode_finder)
+    rng = np.random.default_rng(46)
+    batched, single = [], []
+    for edge in range(50):
+        true_value = rng.uniform(3, 10)
+        solutions = []
+        for gate in range(12):
+            solutions.append(Solution(true_value + rng.normal(0, 0.05), badness=0, gate=(edge, 100 + gate)))
+            solutions.append(Solution(rng.uniform(3, 12), badness=0, gate=(edge, 200 + gate)))
+        for solution_sets in (batched, single):
+            solution_set = SolutionSet()
+            solution_set.extend(solutions, update=False)
+            solution_sets.append((true_value, solution_set))
+
+    ready = SolutionSet.update_many([solution_set for _, solution_set in batched])
+    assert all(ready)
+    for (true_value, solution_set), (_, expected) in zip(batched, single):
+        expected.update_cached_value()
+        assert solution_set.get() is not None and abs(solution_set.get() - true_value) < 0.3
+        assert float(solution_set.get()) == float(expected.get())
+        assert (solution_set.finalized, solution_set.confidence) == (expected.finalized, expected.confidence)
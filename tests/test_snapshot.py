@@ -0,0 +1,25 @@
+import pytest
+
+from simplexmesh.config import config
+from simplexmesh.snapshot import Snapshot
+from simulation import Simulation
+
+
+def _known_values(sim: Simulation) -> dict:
+    return {(node._id, int(target)): float(solution_set.get())
+            for node in sim.nodes for target, solution_set in node._known.items() if solution_set.get() is not None}
+
+
+@pytest.mark.parametrize("node", ["RandomTargetStrategyNode", "RandomGateStrategyNode",
+                                  "RandomTargetHopLevelStrategyNode", "PriorityTargetStrategyNode"])
+def test_restored_run_continues_like_the_original(monkeypatch, node):
+    monkeypatch.setitem(config["simulation"], "node", node)
+    monkeypatch.setitem(config["simulation"], "iterations", 60)
+    sim = Simulation()
+    sim.create()
+    sim.run()
+
+    fork = Simulation.from_snapshot(Snapshot.capture(sim.grid, sim.nodes))
+    sim.run()
+    fork.run()
+    assert _known_values(fork) == _known_values(sim)
@@ -0,0 +1,61 @@
+from simplexmesh.config import config
+from simplexmesh.solution import Solution, SolutionSet
+from simulation import Simulation
+
+
+def _full_set() -> SolutionSet:
+    """
+    :return: A set past its maximal length, of solutions through gates (0, 1), (0, 2), ..., none of which agree
+    """
+    solution_set = SolutionSet()
+    for gate in range(config["solution_set"]["max_set_length"] + 1):
+        solution_set.add(Solution(4 + 0.5 * gate, badness=0, gate=(0, gate + 1)))
+    return solution_set
+
+
+def test_full_set_finalizes():
+    solution_set = _full_set()
+    assert solution_set.finalized
+    assert solution_set.get() is not None
+    assert 0 < solution_set.confidence < config["solution_set"]["finalize_confidence"]
+
+
+def test_finalized_set_rejects_solutions():
+    solution_set = _full_set()
+    solutions, value = list(solution_set._solutions), solution_set.get()
+
+    assert not solution_set.add(Solution(value, badness=0, gate=(50, 51)))
+    assert not solution_set.extend([Solution(value, badness=0, gate=(52, 53)),
+                                    Solution(value + 0.01, badness=0, gate=(54, 55))])
+    assert solution_set._solutions == solutions
+    assert solution_set.get() is value
+
+
+def test_discarding_a_gate_node_reopens_the_set():
+    solution_set = _full_set()
+    n_solutions = len(solution_set._solutions)
+
+    solution_set.discard_gate_node(3)
+    assert not solution_set.finalized
+    assert len(solution_set._solutions) == n_solutions - 1
+    solution_set.add(Solution(7, badness=0, gate=(50, 51)))
+    assert len(solution_set._solutions) == n_solutions
+
+
+def test_received_finalized_value_is_taken_over():
+    sim = Simulation()
+    sim.create()
+    node = sim.nodes[0]
+    neighbors = set(sim.grid.get_neighbors_of(node._id))
+    target_id = next(target for target in range(1, len(sim.nodes))
+                     if target not in neighbors and not node.is_finalized(target))
+
+    node.receive_finalized(target_id, Solution(5.5, badness=1), 0.95)
+    solution_set = node._known[target_id]
+    assert node.is_finalized(target_id)
+    assert (float(solution_set.get()), solution_set.confidence) == (5.5, 0.95)
+    assert not solution_set.add(Solution(6.5, badness=0, gate=(1, 2)))
+    assert float(node.get_known_to(target_id)) == 5.5
+
+    node.receive_finalized(target_id, Solution(8.0, badness=0), 1.0)
+    assert float(node.get_known_to(target_id)) == 5.5
@@ -0,0 +1,29 @@
+import numpy as np
+
+from simplexmesh.spatial import poisson_disk_sample
+
+
+def test_poisson_disk_sample_keeps_min_distance():
+    rng = np.random.default_rng(43)
+    points = poisson_disk_sample(rng, 15, 2, 1.2)
+    d = np.linalg.norm(points[:, None] - points[None], axis=2)
+    assert (d[np.triu_indices(len(points), 1)] >= 1.2).all()
+
+
+def test_poisson_disk_sample_is_uniform_over_phases():
+    """
+    Stopping early must not leave the points striped by the phases of the background grid. Counts of the points
+    by cell index mod 3 along every axis are compared to an even split, which gives a mean chi-square
+    of about 2 for uniform points, and about 13 when the first phases fill their cells first.
+    """
+    cell = 1.2 / np.sqrt(2)
+    chi2 = []
+    for seed in range(50):
+        rng = np.random.default_rng(seed)
+        points = poisson_disk_sample(rng, 15, 2, 1.2, n_required=80)
+        phase = (points // cell).astype(int) % 3
+        expected = len(points) / 3
+        for axis in range(2):
+            counts = np.bincount(phase[:, axis], minlength=3)
+            chi2.append(((counts - expected) ** 2 / expected).sum())
+    assert np.mean(chi2) < 4
@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+from simplexmesh.config import config
+from simplexmesh.grid import Grid, Point2D
+from simplexmesh.snapshot import Snapshot
+from simplexmesh.spatial import bfs_hop_counts, csr_adjacency, in_reach_pairs
+from simulation import Simulation
+
+
+@pytest.mark.parametrize("node", ["RandomTargetStrategyNode", "RandomGateStrategyNode",
+                                  "RandomTargetHopLevelStrategyNode", "PriorityTargetStrategyNode"])
+def test_nodes_survive_join_move_and_leave(monkeypatch, node):
+    monkeypatch.setitem(config["simulation"], "node", node)
+    monkeypatch.setitem(config["simulation"], "iterations", 50)
+    sim = Simulation()
+    sim.create()
+    sim.run()
+
+    sim.remove_node(5)
+    sim.run()
+    sim.add_node(Point2D((7.3, 7.1)))
+    sim.run()
+    sim.move_node(10, Point2D((3.1, 12.2)))
+    sim.run()
+
+    live = {node._id for node in sim.nodes}
+    assert 5 not in live
+    for node in sim.nodes:
+        assert {int(target) for target in node._known_set} <= live
+
+
+def test_moving_a_node_leaves_the_snapshot_and_other_forks_untouched(tmp_path, monkeypatch):
+    monkeypatch.setitem(config["simulation"], "iterations", 20)
+    sim = Simulation()
+    sim.create()
+    sim.run()
+    snapshot = Snapshot.capture(sim.grid, sim.nodes)
+    sim.save_snapshot(tmp_path)
+    original = snapshot["coords"].copy()
+
+    fork, sibling = Simulation.from_snapshot(snapshot), Simulation.from_snapshot(snapshot)
+    fork.move_node(10, Point2D((3.1, 12.2)))
+    Simulation.from_snapshot(str(tmp_path)).move_node(10, Point2D((3.1, 12.2)))
+    sim.move_node(11, Point2D((12.2, 3.1)))
+
+    assert fork.grid.get_true_position(10).xyz == (3.1, 12.2)
+    assert np.array_equal(snapshot["coords"], original)
+    assert np.array_equal(sibling.grid.coords, original)
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_incremental_adjacency_and_hops_match_a_rebuild(seed):
+    rng = np.random.default_rng(seed)
+    grid = Grid(Point2D, 80, 15, seed=seed)
+    grid.setup()
+    for _ in range(60):
+        live = sorted(set(range(len(grid.coords))) - grid.removed)
+        change = rng.integers(3)
+        if change == 0:
+            grid.add_point(Point2D.random(rng, upper_bound=15))
+        elif change == 1:
+            grid.move_point(int(rng.choice(live)), Point2D.random(rng, upper_bound=15))
+        else:
+            grid.remove_point(int(rng.choice(live)))
+
+        pairs = in_reach_pairs(grid.coords, grid.NODE_REACH)
+        pairs = pairs[~np.isin(pairs, list(grid.removed)).any(axis=1)]
+        expected_indptr, expected_indices = csr_adjacency(pairs, len(grid.coords))
+        indptr, indices = grid.get_csr_adjacency()
+        assert np.array_equal(indptr, expected_indptr)
+        assert np.array_equal(indices, expected_indices)
+        expected_hops = np.stack([bfs_hop_counts(expected_indptr, expected_indices, origin)
+                                  for origin in range(len(grid.coords))])
+        assert np.array_equal(grid._hop_rows, expected_hops)